@@ -0,0 +1,99 @@
+# compares the old FILE_CHUNK send path (read + base64 + dict + craft_message + encode)
+# with the memory-mapped ChunkFrames path. reports CPU seconds per MB of file data and
+# the number of copies of the chunk payload each path makes before sendto.
+#
+#   python bench/bench_chunk_send.py [--size-mb 64] [--chunk-size 4096] [--send]
+#
+# --send also pushes every datagram to a local UDP socket, so syscall cost is included
+import argparse
+import base64
+import os
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parser.message_parser import craft_message
+from utils.chunk_frames import ChunkFrames
+
+# copies of the payload (or its encoding) per chunk, excluding the kernel copy in sendto
+COPIES = {
+	"legacy": 5, # f.read, b64encode, .decode(), craft_message join, .encode()
+	"mmap": 2, # b2a_base64 of the mapped slice, copy into the frame buffer
+}
+
+def legacy_frames(path, chunk_size):
+	total_chunks = (os.path.getsize(path) + chunk_size - 1) // chunk_size
+	with open(path, "rb") as f:
+		for chunk_index in range(total_chunks):
+			chunk_data = f.read(chunk_size)
+			message = {
+				"TYPE": "FILE_CHUNK",
+				"FROM": "bench@127.0.0.1",
+				"TO": "peer@127.0.0.1",
+				"FILEID": "bench",
+				"CHUNK_INDEX": chunk_index,
+				"TOTAL_CHUNKS": total_chunks,
+				"CHUNK_SIZE": chunk_size,
+				"DATA": base64.b64encode(chunk_data).decode(),
+				"TOKEN": "bench@127.0.0.1|0|file",
+				"TIMESTAMP": int(time.time())
+			}
+			yield craft_message(message).encode("utf-8")
+
+def mmap_frames(path, chunk_size):
+	frames = ChunkFrames(path, "bench", "bench@127.0.0.1", "peer@127.0.0.1", "bench@127.0.0.1|0|file", chunk_size)
+	try:
+		for chunk_index in range(frames.total_chunks):
+			yield frames.frame(chunk_index)
+	finally:
+		frames.close()
+
+def run(name, frames, size_mb, sock, addr):
+	count = 0
+	wire_bytes = 0
+	cpu_start, wall_start = time.process_time(), time.perf_counter()
+	for frame in frames:
+		count += 1
+		wire_bytes += len(frame)
+		if sock:
+			sock.sendto(frame, addr)
+	cpu = time.process_time() - cpu_start
+	wall = time.perf_counter() - wall_start
+	print(f"{name:<8} {count:>8} {wire_bytes / 1048576:>9.1f} {cpu / size_mb * 1000:>10.2f} "
+		f"{size_mb / wall:>9.1f} {COPIES[name]:>7}")
+
+def main():
+	parser = argparse.ArgumentParser(description="FILE_CHUNK send path benchmark")
+	parser.add_argument("--size-mb", type=int, default=64)
+	parser.add_argument("--chunk-size", type=int, default=4096)
+	parser.add_argument("--send", action="store_true", help="also sendto a local UDP sink")
+	args = parser.parse_args()
+
+	sock = sink = None
+	addr = None
+	if args.send:
+		sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		sink.bind(("127.0.0.1", 0))
+		addr = sink.getsockname()
+		sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+	with tempfile.TemporaryDirectory() as tmp:
+		path = os.path.join(tmp, "payload.bin")
+		with open(path, "wb") as f:
+			for _ in range(args.size_mb):
+				f.write(os.urandom(1048576))
+
+		print(f"{args.size_mb} MB file, {args.chunk_size} byte chunks{', sending to ' + str(addr) if sock else ''}")
+		print(f"{'path':<8} {'frames':>8} {'wire MB':>9} {'ms CPU/MB':>10} {'MB/s':>9} {'copies':>7}")
+		run("legacy", legacy_frames(path, args.chunk_size), args.size_mb, sock, addr)
+		run("mmap", mmap_frames(path, args.chunk_size), args.size_mb, sock, addr)
+
+	if sock:
+		sock.close()
+		sink.close()
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,98 @@
+# loopback FILE_CHUNK throughput for different chunk sizes, in text (base64) and binary
+# framing. a receiver thread parses and decodes every datagram the way handle_file_chunk does; the sender keeps at most
+# --window datagrams unprocessed so the comparison is not dominated by socket-buffer drops.
+#
+#   python bench/bench_chunk_size.py [--size-mb 32] [--window 64]
+import argparse
+import base64
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parser.message_parser import parse_datagram
+from utils.chunk_frames import ChunkFrames
+
+FILE_ID = "bench"
+SENDER = "bench@127.0.0.1"
+RECEIVER = "peer@127.0.0.1"
+TOKEN = "bench@127.0.0.1|1700000000|file"
+
+def receive(sock, total_chunks, progress, done):
+	buffer = bytearray(65536)
+	while progress["processed"] < total_chunks:
+		try:
+			n = sock.recv_into(buffer)
+		except socket.timeout:
+			break # the rest was lost
+		message = parse_datagram(memoryview(buffer)[:n])
+		data = message["DATA"]
+		progress["bytes"] += len(data if isinstance(data, memoryview) else base64.b64decode(data))
+		progress["processed"] += 1
+	done.set()
+
+def run(path, label, chunk_size, window, binary=False):
+	sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	sink.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1048576)
+	sink.bind(("127.0.0.1", 0))
+	sink.settimeout(1)
+	sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	frames = ChunkFrames(path, FILE_ID, SENDER, RECEIVER, TOKEN, chunk_size, binary)
+	progress = {"processed": 0, "bytes": 0}
+	done = threading.Event()
+	largest = 0
+
+	started = time.perf_counter()
+	threading.Thread(target=receive, args=(sink, frames.total_chunks, progress, done), daemon=True).start()
+	for index in range(frames.total_chunks):
+		while index - progress["processed"] >= window and not done.is_set():
+			time.sleep(0) # crude flow control: wait for the receiver to catch up
+		frame = frames.frame(index)
+		largest = max(largest, len(frame))
+		sock.sendto(frame, sink.getsockname())
+	done.wait()
+	elapsed = time.perf_counter() - started
+	frames.close()
+	sock.close()
+	sink.close()
+
+	lost = frames.total_chunks - progress["processed"]
+	fragments = -(-(largest + 28) // 1500) # 1500-byte Ethernet packets per datagram
+	print(f"{label:<16} {chunk_size:>7} {largest:>9} {fragments:>9} {frames.total_chunks:>9} {lost:>6} "
+		f"{progress['bytes'] / 1048576 / elapsed:>8.1f}")
+
+def main():
+	parser = argparse.ArgumentParser(description="FILE_CHUNK size benchmark")
+	parser.add_argument("--size-mb", type=int, default=32)
+	parser.add_argument("--window", type=int, default=64)
+	args = parser.parse_args()
+
+	filesize = args.size_mb * 1048576
+	overhead = ChunkFrames.overhead(FILE_ID, SENDER, RECEIVER, TOKEN, filesize)
+	binary_overhead = ChunkFrames.overhead(FILE_ID, SENDER, RECEIVER, TOKEN, filesize, binary=True)
+	sizes = [
+		("1500 MTU", ChunkFrames.chunk_size_for(1500 - 28, overhead), False),
+		("1500 binary", ChunkFrames.chunk_size_for(1500 - 28, binary_overhead, True), True),
+		("legacy 4096", 4096, False),
+		("9000 MTU", ChunkFrames.chunk_size_for(9000 - 28, overhead), False),
+		("9000 binary", ChunkFrames.chunk_size_for(9000 - 28, binary_overhead, True), True),
+		("jumbo (64KB)", ChunkFrames.chunk_size_for(65507, overhead), False),
+		("jumbo binary", ChunkFrames.chunk_size_for(65507, binary_overhead, True), True),
+	]
+
+	with tempfile.TemporaryDirectory() as tmp:
+		path = os.path.join(tmp, "payload.bin")
+		with open(path, "wb") as f:
+			for _ in range(args.size_mb):
+				f.write(os.urandom(1048576))
+		print(f"{args.size_mb} MB over loopback, window {args.window} datagrams")
+		print(f"{'mode':<16} {'chunk':>7} {'datagram':>9} {'eth pkts':>9} {'datagrams':>9} {'lost':>6} {'MB/s':>8}")
+		for label, chunk_size, binary in sizes:
+			run(path, label, chunk_size, args.window, binary)
+
+if __name__ == "__main__":
+	main()
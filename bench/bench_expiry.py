@@ -0,0 +1,74 @@
+# 24-hour soak of PeerManager state on a simulated clock: posts, DMs, issued tokens and
+# revoked tokens arrive at a steady rate with the protocol's TTL, and the expiry engine is
+# run once per simulated second. prints the live item counts and traced memory every
+# simulated hour; with --no-expiry the same load runs without eviction for comparison.
+#
+#   python bench/bench_expiry.py [--hours 24] [--ttl 3600] [--peers 100] [--no-expiry]
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config # before utils.network_utils (config imports it back)
+from core.peer import PeerManager
+from utils.logger import Logger
+
+def main():
+	parser = argparse.ArgumentParser(description="expiry soak benchmark")
+	parser.add_argument("--hours", type=int, default=24)
+	parser.add_argument("--ttl", type=int, default=config.TTL)
+	parser.add_argument("--peers", type=int, default=100)
+	parser.add_argument("--posts", type=float, default=2, help="posts received per second")
+	parser.add_argument("--dms", type=float, default=1, help="DMs received per second")
+	parser.add_argument("--tokens", type=float, default=1, help="tokens issued per second")
+	parser.add_argument("--revokes", type=float, default=0.2, help="REVOKEs received per second")
+	parser.add_argument("--no-expiry", action="store_true")
+	args = parser.parse_args()
+
+	peer_manager = PeerManager(Logger(verbose=False))
+	peer_manager.own_profile = {"TYPE": "PROFILE", "USER_ID": "me@10.0.0.1", "DISPLAY_NAME": "Me"}
+	peers = [f"user{i}@10.1.{i >> 8 & 255}.{i & 255}" for i in range(args.peers)]
+	for user_id in peers:
+		peer_manager.add_peer(user_id, user_id.split("@")[0], "ok")
+		peer_manager.follow(user_id)
+
+	tracemalloc.start()
+	start = int(time.time())
+	counts = {"posts": 0.0, "dms": 0.0, "tokens": 0.0, "revokes": 0.0}
+	rates = {"posts": args.posts, "dms": args.dms, "tokens": args.tokens, "revokes": args.revokes}
+	sequence = 0
+	started = time.perf_counter()
+	print(f"{'hour':>4} {'posts':>8} {'dms':>8} {'issued':>8} {'revoked':>8} {'heap':>8} {'traced MB':>10}")
+	for second in range(args.hours * 3600):
+		now = start + second
+		for kind, rate in rates.items():
+			counts[kind] += rate
+			while counts[kind] >= 1:
+				counts[kind] -= 1
+				sequence += 1
+				user_id = peers[sequence % len(peers)]
+				if kind == "posts":
+					peer_manager.add_post(user_id, "lunch anyone?", now, args.ttl, f"{sequence:016x}", f"{user_id}|{now + args.ttl}|broadcast")
+				elif kind == "dms":
+					peer_manager.add_dm(user_id, "see you at 5", now, f"{sequence:016x}", f"{user_id}|{now + args.ttl}|chat")
+				elif kind == "tokens":
+					peer_manager.issue_token(f"me@10.0.0.1|{now + args.ttl}|chat")
+				else:
+					peer_manager.revoke_token(f"{user_id}|{now + args.ttl}|{sequence}")
+		if not args.no_expiry:
+			peer_manager.expiry.run_due(now)
+		if (second + 1) % 3600 == 0:
+			posts = sum(len(peer_manager.peers[user_id].posts) for user_id in peers)
+			dms = sum(len(peer_manager.peers[user_id].dms) for user_id in peers)
+			print(f"{(second + 1) // 3600:>4} {posts:>8} {dms:>8} {len(peer_manager.issued_tokens):>8} "
+				f"{len(peer_manager.revoked_tokens):>8} {len(peer_manager.expiry):>8} "
+				f"{tracemalloc.get_traced_memory()[0] / 1048576:>10.1f}")
+	tracemalloc.stop()
+	stats = peer_manager.expiry.get_stats()
+	print(f"\nevicted: {stats['evicted']} in {stats['passes']} passes, {time.perf_counter() - started:.1f}s wall")
+
+if __name__ == "__main__":
+	main()
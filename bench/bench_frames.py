@@ -0,0 +1,68 @@
+# cost of serializing a message once per send (the old path) against encoding it once and
+# reusing the bytes, for a group fan-out and for a retransmitted DM. sends go to a null
+# sender so only the serialization is measured. reports microseconds per message.
+#
+#   python bench/bench_frames.py [--members 50] [--seconds 0.5]
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config # before utils.network_utils (config imports it back)
+from parser.message_parser import encode_message
+
+GROUP_MESSAGE = {
+	"TYPE": "GROUP_MESSAGE", "FROM": "alice@192.168.1.10", "GROUP_ID": "g1a2b3", "CONTENT": "meeting moved to 3pm",
+	"TIMESTAMP": 1700000000, "TOKEN": "alice@192.168.1.10|1700003600|group",
+}
+DM = {
+	"TYPE": "DM", "FROM": "alice@192.168.1.10", "TO": "bob@192.168.1.11", "CONTENT": "see you at 5",
+	"TIMESTAMP": 1700000000, "MESSAGE_ID": "f83d2b1c", "TOKEN": "alice@192.168.1.10|1700003600|chat",
+}
+
+def null_send(frame, addr):
+	pass
+
+def fan_out_per_send(message, ips):
+	for ip in ips:
+		null_send(encode_message(message), (ip, config.PORT))
+
+def fan_out_once(message, ips):
+	frame = encode_message(message)
+	for ip in ips:
+		null_send(frame, (ip, config.PORT))
+
+# microseconds per call, repeating for about `seconds`
+def time_per_call(func, args, seconds):
+	calls = 0
+	started = time.perf_counter()
+	while True:
+		for _ in range(100):
+			func(*args)
+		calls += 100
+		elapsed = time.perf_counter() - started
+		if elapsed >= seconds:
+			return elapsed / calls * 1e6
+
+def main():
+	parser = argparse.ArgumentParser(description="encoded frame reuse benchmark")
+	parser.add_argument("--members", type=int, default=50)
+	parser.add_argument("--seconds", type=float, default=0.5)
+	args = parser.parse_args()
+
+	member_ips = [f"192.168.1.{100 + i}" for i in range(args.members)]
+	retransmits = [DM["TO"].split("@")[1]] * config.ACK_MAX_ATTEMPTS
+	cases = [
+		(f"GROUP_MESSAGE x{args.members}", GROUP_MESSAGE, member_ips),
+		(f"DM x{len(retransmits)} attempts", DM, retransmits),
+	]
+	print(f"{'message':<24} {'per send us':>12} {'once us':>9} {'speedup':>8}")
+	for label, message, ips in cases:
+		old = time_per_call(fan_out_per_send, (message, ips), args.seconds)
+		new = time_per_call(fan_out_once, (message, ips), args.seconds)
+		print(f"{label:<24} {old:>12.2f} {new:>9.2f} {old / new:>7.1f}x")
+
+if __name__ == "__main__":
+	main()
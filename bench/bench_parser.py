@@ -0,0 +1,113 @@
+# compares the receive-side parse of the old path (decode the datagram, then parse_message)
+# with parse_message_bytes on typical datagrams. reports microseconds per message and the
+# peak memory allocated while parsing one message. a second table times parse + dispatch
+# for messages dispatch drops, eagerly parsed vs as parse_datagram hands them over (a
+# LazyMessage for large bulk messages).
+#
+#   python bench/bench_parser.py [--seconds 0.5]
+import argparse
+import base64
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config # before utils.network_utils (config imports it back)
+from parser.message_parser import craft_message, parse_message, parse_message_bytes, parse_datagram
+from core.message_dispatcher import dispatch
+from core.peer import PeerManager
+from utils.logger import Logger
+
+def file_chunk(size):
+	return craft_message({
+		"TYPE": "FILE_CHUNK",
+		"FROM": "alice@192.168.1.10",
+		"TO": "bob@192.168.1.11",
+		"FILEID": "a1b2c3d4",
+		"TOTAL_CHUNKS": 1000,
+		"CHUNK_SIZE": size,
+		"TOKEN": "alice@192.168.1.10|1700000000|file",
+		"TIMESTAMP": 1700000000,
+		"CHUNK_INDEX": "0042",
+		"SACK_NOW": 0,
+		"CRC32": "0badf00d",
+		"DATA": base64.b64encode(os.urandom(size)).decode(),
+	}).encode("utf-8")
+
+MESSAGES = [
+	("PING", craft_message({"TYPE": "PING", "USER_ID": "alice@192.168.1.10"}).encode("utf-8")),
+	("DM", craft_message({
+		"TYPE": "DM", "FROM": "alice@192.168.1.10", "TO": "bob@192.168.1.11", "CONTENT": "see you at 5",
+		"TIMESTAMP": 1700000000, "MESSAGE_ID": "f83d2b1c", "TOKEN": "alice@192.168.1.10|1700003600|chat",
+	}).encode("utf-8")),
+	("FILE_CHUNK 1KB", file_chunk(1024)),
+	("FILE_CHUNK 48KB", file_chunk(48 * 1024)),
+]
+
+# messages this peer (me@192.168.1.11, following nobody) drops in dispatch
+REJECTED = [
+	("DM to someone else", craft_message({
+		"TYPE": "DM", "FROM": "alice@192.168.1.10", "TO": "carol@192.168.1.12", "CONTENT": "see you at 5",
+		"TIMESTAMP": 1700000000, "MESSAGE_ID": "f83d2b1c", "TOKEN": "alice@192.168.1.10|9999999999|chat",
+	}).encode("utf-8")),
+	("POST, not followed", craft_message({
+		"TYPE": "POST", "USER_ID": "alice@192.168.1.10", "CONTENT": "lunch anyone? " * 20, "TTL": 3600,
+		"MESSAGE_ID": "a7c1e9f0", "TOKEN": "alice@192.168.1.10|9999999999|broadcast",
+	}).encode("utf-8")),
+	("FILE_CHUNK 48KB, expired token", file_chunk(48 * 1024)),
+]
+
+def old_path(data):
+	return parse_message(data.decode("utf-8"))
+
+# microseconds per call, repeating for about `seconds`
+def time_per_call(func, data, seconds):
+	calls = 0
+	started = time.perf_counter()
+	while True:
+		for _ in range(100):
+			func(data)
+		calls += 100
+		elapsed = time.perf_counter() - started
+		if elapsed >= seconds:
+			return elapsed / calls * 1e6
+
+def peak_bytes(func, data):
+	tracemalloc.start()
+	func(data)
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return peak
+
+def reject_table(args):
+	peer_manager = PeerManager(Logger(verbose=False))
+	peer_manager.own_profile = {"TYPE": "PROFILE", "USER_ID": "me@192.168.1.11", "DISPLAY_NAME": "Me"}
+	peer_manager.logger.log_drop = lambda reason="": None # keep printing out of the timings
+	eager = lambda data: dispatch(parse_message_bytes(data), "192.168.1.10", peer_manager)
+	received = lambda data: dispatch(parse_datagram(data), "192.168.1.10", peer_manager)
+	print(f"{'dropped message':<32} {'eager us':>9} {'recv us':>9} {'speedup':>8}")
+	for label, data in REJECTED:
+		eager_us = time_per_call(eager, data, args.seconds)
+		received_us = time_per_call(received, data, args.seconds)
+		print(f"{label:<32} {eager_us:>9.2f} {received_us:>9.2f} {eager_us / received_us:>7.1f}x")
+
+def parse_table(args):
+	print(f"{'message':<16} {'bytes':>7} {'old us':>9} {'bytes us':>9} {'speedup':>8} {'old peak':>9} {'bytes peak':>10}")
+	for label, data in MESSAGES:
+		old = time_per_call(old_path, data, args.seconds)
+		new = time_per_call(parse_message_bytes, data, args.seconds)
+		print(f"{label:<16} {len(data):>7} {old:>9.2f} {new:>9.2f} {old / new:>7.1f}x "
+			f"{peak_bytes(old_path, data):>9} {peak_bytes(parse_message_bytes, data):>10}")
+
+def main():
+	parser = argparse.ArgumentParser(description="LSNP parser benchmark")
+	parser.add_argument("--seconds", type=float, default=0.5)
+	args = parser.parse_args()
+	parse_table(args)
+	print()
+	reject_table(args)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,109 @@
+# group creation and follower bookkeeping with --peers known peers, comparing PeerManager's
+# indexed followers / members with the list scans it used before (reproduced below).
+#
+#   python bench/bench_peers.py [--peers 10000] [--members 1000]
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config # before utils.network_utils (config imports it back)
+from core.peer import PeerManager
+from utils.logger import Logger
+
+def make_peer_manager(peers):
+	peer_manager = PeerManager(Logger(verbose=False))
+	peer_manager.own_profile = {"TYPE": "PROFILE", "USER_ID": "me@10.255.255.254", "DISPLAY_NAME": "Me"}
+	for i in range(peers):
+		peer_manager.add_peer(user_id(i), f"User {i}", "ok")
+	return peer_manager
+
+def user_id(i):
+	return f"user{i}@10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}"
+
+# ----- the old list-based paths -----
+
+def old_validate_member(peer_manager, member):
+	known_user_ids = [uid for uid, display_name in peer_manager.list_peers()]
+	return member in known_user_ids
+
+def old_create_group(peer_manager, members):
+	invalid = [member for member in members if not old_validate_member(peer_manager, member)]
+	return {"members": members.copy(), "invalid": invalid}
+
+def old_follower_ips(followers):
+	return [uid.split('@')[1] for uid in followers]
+
+def old_add_follower(followers, from_user):
+	if from_user.split('@')[1] not in old_follower_ips(followers):
+		followers.append(from_user)
+
+def old_group_update(members, add, remove):
+	for member in add:
+		if member not in members:
+			members.append(member)
+	for member in remove:
+		if member in members:
+			members.remove(member)
+
+# seconds for one call
+def timed(func, *args):
+	started = time.perf_counter()
+	func(*args)
+	return time.perf_counter() - started
+
+def main():
+	parser = argparse.ArgumentParser(description="follower / group membership benchmark")
+	parser.add_argument("--peers", type=int, default=10000)
+	parser.add_argument("--members", type=int, default=1000)
+	args = parser.parse_args()
+
+	peer_manager = make_peer_manager(args.peers)
+	members = [user_id(i) for i in range(0, args.peers, max(1, args.peers // args.members))][:args.members]
+	followers = [user_id(i) for i in range(args.peers)]
+	changes = members[: len(members) // 10]
+
+	def new_follow_all():
+		for uid in followers:
+			peer_manager.add_follower("me@10.255.255.254", uid)
+
+	old_list = []
+	def old_follow_all():
+		for uid in followers:
+			old_add_follower(old_list, uid)
+
+	def new_fan_out():
+		for _ in range(100):
+			peer_manager.get_follower_ips()
+
+	def old_fan_out():
+		for _ in range(100):
+			old_follower_ips(old_list)
+
+	def new_update():
+		peer_manager.update_group("bench", remove_members=changes)
+		peer_manager.update_group("bench", add_members=changes)
+
+	old_members = list(members)
+	def old_update():
+		old_group_update(old_members, [], changes)
+		old_group_update(old_members, changes, [])
+
+	rows = [
+		(f"create group ({len(members)} members)", lambda: timed(old_create_group, peer_manager, members),
+			lambda: timed(peer_manager.create_group, "bench", "bench", members)),
+		(f"{args.peers} FOLLOWs", lambda: timed(old_follow_all), lambda: timed(new_follow_all)),
+		("100 follower fan-outs", lambda: timed(old_fan_out), lambda: timed(new_fan_out)),
+		(f"update +/-{len(changes)} members", lambda: timed(old_update), lambda: timed(new_update)),
+	]
+	print(f"{args.peers} known peers")
+	print(f"{'operation':<32} {'old ms':>10} {'new ms':>10} {'speedup':>9}")
+	for label, old, new in rows:
+		old_s = old()
+		new_s = new()
+		print(f"{label:<32} {old_s * 1000:>10.2f} {new_s * 1000:>10.2f} {old_s / new_s:>8.0f}x")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,77 @@
+# memory per record for the slotted records in core.records against the dicts PeerManager
+# used to keep (same field names, same values). allocations are measured with tracemalloc
+# while building --count records of each kind, and include the field values that are
+# shared by both layouts (so the difference is the per-record container overhead).
+#
+#   python bench/bench_records.py [--count 100000]
+import argparse
+import os
+import sys
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.records import Peer, Post, DM, Like, GroupMessage
+
+def post_dict(i):
+	return {"content": "lunch anyone?", "timestamp": 1700000000 + i, "ttl": 3600, "message_id": f"{i:016x}", "token": "alice@192.168.1.10|1700003600|broadcast"}
+
+def post_record(i):
+	return Post("lunch anyone?", 1700000000 + i, 3600, f"{i:016x}", "alice@192.168.1.10|1700003600|broadcast")
+
+def dm_dict(i):
+	return {"content": "see you at 5", "timestamp": 1700000000 + i, "message_id": f"{i:016x}", "token": "alice@192.168.1.10|1700003600|chat"}
+
+def dm_record(i):
+	return DM("see you at 5", 1700000000 + i, f"{i:016x}", "alice@192.168.1.10|1700003600|chat")
+
+def like_dict(i):
+	return {"from_user": "alice@192.168.1.10", "post_timestamp": 1700000000 + i, "action": "LIKE", "post_content": "lunch anyone?", "timestamp": 1700000000 + i}
+
+def like_record(i):
+	return Like("alice@192.168.1.10", 1700000000 + i, "LIKE", "lunch anyone?", 1700000000 + i)
+
+def group_message_dict(i):
+	return {"from": "alice@192.168.1.10", "content": "meeting moved to 3pm", "timestamp": 1700000000 + i}
+
+def group_message_record(i):
+	return GroupMessage("alice@192.168.1.10", "meeting moved to 3pm", 1700000000 + i)
+
+def peer_dict(i):
+	return {"display_name": "Alice", "status": "online", "avatar_type": None, "avatar_encoding": None, "avatar_data": None,
+		"posts": [], "dms": [], "followers": []}
+
+def peer_record(i):
+	return Peer("Alice", "online")
+
+KINDS = [
+	("Peer", peer_dict, peer_record),
+	("Post", post_dict, post_record),
+	("DM", dm_dict, dm_record),
+	("Like", like_dict, like_record),
+	("GroupMessage", group_message_dict, group_message_record),
+]
+
+# bytes allocated per record while building count of them
+def bytes_per_record(build, count):
+	tracemalloc.start()
+	records = [build(i) for i in range(count)]
+	allocated = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	del records
+	return allocated / count
+
+def main():
+	parser = argparse.ArgumentParser(description="record memory benchmark")
+	parser.add_argument("--count", type=int, default=100000)
+	args = parser.parse_args()
+
+	print(f"{args.count} records of each kind")
+	print(f"{'record':<14} {'dict B':>8} {'slots B':>8} {'saved':>7}")
+	for label, as_dict, as_record in KINDS:
+		old = bytes_per_record(as_dict, args.count)
+		new = bytes_per_record(as_record, args.count)
+		print(f"{label:<14} {old:>8.0f} {new:>8.0f} {1 - new / old:>6.0%}")
+
+if __name__ == "__main__":
+	main()
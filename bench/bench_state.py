@@ -0,0 +1,110 @@
+# PeerManager state store: how fast changes are logged with each fsync setting, and how long a
+# restart takes with --messages stored messages (DMs, posts and group messages) when they all
+# have to be replayed from the WAL, come from a snapshot, or from a snapshot plus a WAL tail.
+#
+#   python bench/bench_state.py [--messages 100000] [--peers 1000] [--tail 0.1] [--fsync-messages 2000]
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config # before utils.network_utils (config imports it back)
+from core.peer import PeerManager
+from utils.logger import Logger
+
+def make_peer_manager(directory):
+	peer_manager = PeerManager(Logger(verbose=False))
+	peer_manager.own_profile = {"TYPE": "PROFILE", "USER_ID": "me@10.0.0.1", "DISPLAY_NAME": "Me"}
+	peer_manager.load_state(directory)
+	return peer_manager
+
+# one stored message per call: DMs and posts from peers, and messages in a few groups
+def store_messages(peer_manager, peers, start, count):
+	now = int(time.time())
+	for n in range(start, start + count):
+		user_id = peers[n % len(peers)]
+		if n % 4 == 0:
+			peer_manager.add_post(user_id, "lunch anyone?", now, 86400, f"{n:016x}", f"{user_id}|{now + 86400}|broadcast")
+		elif n % 4 == 3:
+			peer_manager.handle_group_message({"GROUP_ID": f"g{n % 8}", "FROM": user_id, "CONTENT": "see you at 5", "TIMESTAMP": str(now)})
+		else:
+			peer_manager.add_dm(user_id, "see you at 5", now, f"{n:016x}", f"{user_id}|{now + 86400}|chat")
+
+def populate(directory, peers, messages):
+	peer_manager = make_peer_manager(directory)
+	for user_id in peers:
+		peer_manager.add_peer(user_id, user_id.split("@")[0], "ok")
+		peer_manager.follow(user_id)
+	for group in range(8):
+		peer_manager.handle_group_create({"GROUP_ID": f"g{group}", "GROUP_NAME": "team", "FROM": peers[0],
+			"MEMBERS": ",".join(["me@10.0.0.1"] + peers), "TIMESTAMP": "0"})
+	started = time.perf_counter()
+	store_messages(peer_manager, peers, 0, messages)
+	return peer_manager, time.perf_counter() - started
+
+# stop without a clean shutdown, so the WAL is left as it is
+def crash(peer_manager):
+	store = peer_manager.store
+	store.running = False
+	store.wakeup.set()
+	store.thread.join()
+	store.wal.close()
+
+def restart(directory):
+	started = time.perf_counter()
+	peer_manager = make_peer_manager(directory)
+	elapsed = time.perf_counter() - started
+	stored = sum(len(peer.posts) + len(peer.dms) for _, peer in peer_manager.peer_items())
+	stored += sum(len(group["messages"]) for group in peer_manager.groups.values())
+	return peer_manager, elapsed, stored
+
+def main():
+	parser = argparse.ArgumentParser(description="state store benchmark")
+	parser.add_argument("--messages", type=int, default=100000)
+	parser.add_argument("--peers", type=int, default=1000)
+	parser.add_argument("--tail", type=float, default=0.1, help="WAL tail after the snapshot, as a fraction of --messages")
+	parser.add_argument("--fsync-messages", type=int, default=2000, help="changes logged per fsync setting")
+	args = parser.parse_args()
+
+	config.HISTORY_PEER_POSTS = config.HISTORY_PEER_DMS = args.messages # keep every message in memory
+	config.HISTORY_GROUP_MESSAGES = args.messages
+	config.STATE_SNAPSHOT_EVERY = args.messages * 10 # compaction only where the benchmark asks for it
+	peers = [f"user{i}@10.1.{i >> 8 & 255}.{i & 255}" for i in range(args.peers)]
+	root = tempfile.mkdtemp()
+	try:
+		print(f"{'fsync':>10} {'changes/s':>10} {'fsyncs':>7}")
+		for interval in (0, 1.0, None):
+			config.STATE_FSYNC_INTERVAL = interval
+			directory = os.path.join(root, f"fsync-{interval}")
+			peer_manager, elapsed = populate(directory, peers, args.fsync_messages)
+			peer_manager.store.close()
+			label = "every" if interval == 0 else "never" if interval is None else f"{interval:g}s"
+			print(f"{label:>10} {args.fsync_messages / elapsed:>10.0f} {peer_manager.store.get_stats()['fsyncs']:>7}")
+		config.STATE_FSYNC_INTERVAL = 1.0
+
+		directory = os.path.join(root, "restart")
+		peer_manager, elapsed = populate(directory, peers, args.messages)
+		crash(peer_manager)
+		print(f"\n{args.messages} messages logged in {elapsed:.2f}s")
+		print(f"{'restart from':<24} {'ms':>8} {'replayed':>9} {'stored':>8}")
+		peer_manager, elapsed, stored = restart(directory)
+		print(f"{'WAL only':<24} {elapsed * 1000:>8.0f} {peer_manager.store.get_stats()['replayed']:>9} {stored:>8}")
+		peer_manager.store.compact()
+		crash(peer_manager)
+		peer_manager, elapsed, stored = restart(directory)
+		print(f"{'snapshot':<24} {elapsed * 1000:>8.0f} {peer_manager.store.get_stats()['replayed']:>9} {stored:>8}")
+		tail = int(args.messages * args.tail)
+		store_messages(peer_manager, peers, args.messages, tail)
+		crash(peer_manager)
+		peer_manager, elapsed, stored = restart(directory)
+		print(f"{'snapshot + WAL tail':<24} {elapsed * 1000:>8.0f} {peer_manager.store.get_stats()['replayed']:>9} {stored:>8}")
+		crash(peer_manager)
+	finally:
+		shutil.rmtree(root)
+
+if __name__ == "__main__":
+	main()
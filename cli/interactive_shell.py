@@ -1,18 +1,22 @@
-from utils.network_utils import send_message, get_local_ip, send_file_offer
+from utils.network_utils import send_message, get_local_ip, send_file_offer, accept_file_offer, reject_file_offer
 from core.peer import PeerManager
 import json
+import base64
 import config
 import time
 import random
 import string
-from parser.message_parser import craft_message
+from parser.message_parser import craft_message, encode_message
 from parser.message_parser import parse_message
 from utils.network_utils import validate_token
 from utils.game_utils import print_board
 from utils.game_utils import check_game_result, send_result_message
 import uuid
+from network.send_pool import send_pool
+from core.handler_registry import registry, LATENCY_BUCKETS
+from core.file_transfer import ChunkBitmap, find_resumable, resume_incoming
 
-def run_shell(logger, peer_manager):
+def run_shell(logger, peer_manager, udp=None, dispatch_pool=None):
 	print("LSNP Interactive Shell. Type 'help' for commands.")
 
 	while True:
@@ -20,7 +24,7 @@ def run_shell(logger, peer_manager):
 			cmd = input(">>> ").strip()
 
 			if cmd == "exit":
-				for token in peer_manager.issued_tokens:
+				for token in list(peer_manager.issued_tokens): # copy: expired tokens are pruned concurrently
 					revoke_msg = {
 						"TYPE": "REVOKE",
 						"TOKEN": token
@@ -134,9 +138,10 @@ def run_shell(logger, peer_manager):
 				
 				# send only to followers
 				follower_ips = peer_manager.get_follower_ips()
+				frame = encode_message(post_message) # one encoding for every follower
 				for ip in follower_ips:
-					send_message(post_message, (ip, config.PORT))
-				peer_manager.issued_tokens.append(token)
+					send_message(frame, (ip, config.PORT))
+				peer_manager.issue_token(token)
 				logger.log_send("POST", get_local_ip(), post_message)
 
 			# 'dm' command to send a direct message to a peer
@@ -177,17 +182,13 @@ def run_shell(logger, peer_manager):
 				# Extract IP from recipient (format: user@ip)
 				try:
 					_, ip = recipient.split("@")
-					send_message(dm_message, (ip, config.PORT))
-					peer_manager.issued_tokens.append(token)
+					frame = encode_message(dm_message)
+					send_message(frame, (ip, config.PORT))
+					peer_manager.issue_token(token)
 					logger.log_send("DM", ip, dm_message, peer_manager)
 
-					# track for retransmission if needed
-					peer_manager.pending_acks[message_id] = {
-						"message": dm_message,
-						"addr": (ip, config.PORT),
-						"timestamp": time.time(),
-						"attempts": 1
-					}
+					# track for retransmission if needed (retransmits reuse the frame)
+					peer_manager.track_ack(message_id, dm_message, (ip, config.PORT), frame)
 				except ValueError:
 					print("Invalid recipient format. Use user@ip.")
 				except Exception as e:
@@ -230,7 +231,7 @@ def run_shell(logger, peer_manager):
 					_, ip = target_user.split("@")
 					send_message(follow_message, (ip, config.PORT))
 					
-					peer_manager.issued_tokens.append(token)
+					peer_manager.issue_token(token)
 					# Add to local following list
 					peer_manager.follow(target_user)
 					# print(f"Follow request sent to {target_user}.")
@@ -279,9 +280,9 @@ def run_shell(logger, peer_manager):
 					_, ip = target_user.split("@")
 					send_message(unfollow_message, (ip, config.PORT))
 					
-					peer_manager.issued_tokens.append(token)
+					peer_manager.issue_token(token)
 					# Remove from local following list
-					peer_manager.following.discard(target_user)
+					peer_manager.unfollow(target_user)
 					# print(f"Unfollow request sent to {target_user}.")
 					logger.log_send("UNFOLLOW", ip, unfollow_message)
 				except ValueError:
@@ -296,8 +297,8 @@ def run_shell(logger, peer_manager):
 						following_status = " (Following)" if peer_manager.is_following(user_id) else ""
 						avatar_info = ""
 						peer_info = peer_manager.peers.get(user_id)
-						if peer_info and peer_info.get('avatar_type') and peer_info.get('avatar_data'):
-							avatar_info = f" [Avatar: {peer_info.get('avatar_type')}]"
+						if peer_info and peer_info.has_avatar():
+							avatar_info = f" [Avatar: {peer_info.avatar_type}]"
 						print(f"  {display_name} ({user_id}){following_status}{avatar_info}")
 				else:
 					print("  No peers discovered yet.")
@@ -308,8 +309,8 @@ def run_shell(logger, peer_manager):
 						display_name = peer_manager.get_display_name(user_id)
 						avatar_info = ""
 						peer_info = peer_manager.peers.get(user_id)
-						if peer_info and peer_info.get('avatar_type') and peer_info.get('avatar_data'):
-							avatar_info = f" [Avatar: {peer_info.get('avatar_type')}]"
+						if peer_info and peer_info.has_avatar():
+							avatar_info = f" [Avatar: {peer_info.avatar_type}]"
 						print(f"  {display_name} ({user_id}){avatar_info}")
 				else:
 					print("  Not following anyone.")
@@ -343,7 +344,7 @@ def run_shell(logger, peer_manager):
 						continue
 					
 					print(f"\n=== PEER DETAILS: {target_user} ===")
-					peer_manager.show_peer_details(target_user, peer_info['display_name'])
+					peer_manager.show_peer_details(target_user, peer_info.display_name)
 
 			# switching verbose/non-verbose mode
 			elif cmd.startswith("verbose"):
@@ -492,6 +493,83 @@ def run_shell(logger, peer_manager):
 				else:
 					print("TTL must be a positive integer")
 			
+			# show per-peer round-trip estimates used for retransmission timeouts
+			elif cmd == "rtt":
+				rtt_stats = peer_manager.rtt.get_stats()
+				if not rtt_stats:
+					print("No RTT measurements yet.")
+					continue
+				print("\n--- Peer RTT ---")
+				for ip, entry in sorted(rtt_stats.items()):
+					if entry['srtt'] is None:
+						print(f"  {ip}: no samples | RTO {entry['rto'] * 1000:.0f} ms | retransmits: {entry['retransmits']} | gave up: {entry['timeouts']}")
+					else:
+						print(f"  {ip}: SRTT {entry['srtt'] * 1000:.1f} ms | RTTVAR {entry['rttvar'] * 1000:.1f} ms | RTO {entry['rto'] * 1000:.0f} ms | last {entry['last_rtt'] * 1000:.1f} ms")
+						print(f"     samples: {entry['samples']} | retransmits: {entry['retransmits']} | gave up: {entry['timeouts']}")
+
+			# show network counters
+			elif cmd == "stats":
+				send_stats = send_pool.get_stats()
+				print("\n--- Send Path ---")
+				print(f"  Datagrams sent: {send_stats['sends']} ({send_stats['bytes']} bytes)")
+				print(f"  Send errors: {send_stats['errors']}")
+				print(f"  Sockets: {send_stats['pool_size']} in pool ({send_stats['sockets_created']} created, {send_stats['sockets_attached']} attached)")
+				if udp:
+					recv_stats = udp.get_stats()
+					drops = recv_stats['kernel_drops']
+					print("\n--- Receive Path ---")
+					print(f"  Datagrams received: {recv_stats['datagrams']} in {recv_stats['batches']} batches (largest {recv_stats['largest_batch']})")
+					print(f"  Handler errors: {recv_stats['errors']}")
+					print(f"  SO_RCVBUF: {recv_stats['recv_buffer']} bytes")
+					print(f"  Kernel drops: {drops if drops is not None else 'N/A'}")
+				if not peer_manager.engine:
+					timer_stats = peer_manager.retransmit_scheduler.get_stats()
+					print("\n--- Retransmission Timers ---")
+					print(f"  Pending: {timer_stats['pending']} (heap entries: {timer_stats['heap_size']})")
+					print(f"  Scheduled: {timer_stats['scheduled']} | Fired: {timer_stats['fired']} | Cancelled: {timer_stats['cancelled']} | Wakeups: {timer_stats['wakeups']}")
+				if peer_manager.engine:
+					engine_stats = peer_manager.engine.get_stats()
+					print("\n--- Asyncio Engine ---")
+					print(f"  Datagrams received: {engine_stats['datagrams']} | Handler errors: {engine_stats['errors']}")
+					print(f"  Engine sends: {engine_stats['sends']} | Retransmits: {engine_stats['retransmits']} | Gave up: {engine_stats['gave_up']}")
+					print(f"  Active timers: {engine_stats['timers']}")
+				if dispatch_pool:
+					queue_stats = dispatch_pool.get_stats()
+					print("\n--- Dispatch Queue ---")
+					print(f"  Workers: {queue_stats['workers']} | Overflow policy: {queue_stats['overflow']}")
+					print(f"  Depth: {queue_stats['depth']}/{queue_stats['capacity']} (max seen per worker: {queue_stats['max_depth']})")
+					print(f"  Enqueued: {queue_stats['enqueued']} | Processed: {queue_stats['processed']} | Handler errors: {queue_stats['errors']}")
+					print(f"  Dropped: {queue_stats['dropped_oldest']} oldest, {queue_stats['dropped_newest']} newest | Blocked submits: {queue_stats['blocked']}")
+					print(f"  Queue wait: avg {queue_stats['wait_avg'] * 1000:.2f} ms, max {queue_stats['wait_max'] * 1000:.2f} ms")
+				transfer_stats = peer_manager.transfer_scheduler.get_stats()
+				print("\n--- File Transfers ---")
+				print(f"  Active: {transfer_stats['active']} | Queued: {transfer_stats['queued']} | Completed: {transfer_stats['completed']} | Failed: {transfer_stats['failed']}")
+				print(f"  Chunks sent: {transfer_stats['chunks']} ({transfer_stats['bytes']} bytes) | Throttled turns: {transfer_stats['throttled']}")
+				seen_stats = peer_manager.seen_messages.get_stats()
+				print("\n--- Duplicate Suppression ---")
+				print(f"  Hits: {seen_stats['hits']} | Misses: {seen_stats['misses']} | Hit rate: {seen_stats['hit_rate'] * 100:.1f}%")
+				print(f"  Cached IDs: {seen_stats['size']} | Evicted: {seen_stats['evicted']} | Expired: {seen_stats['expired']}")
+				expiry_stats = peer_manager.expiry.get_stats()
+				print("\n--- Expiry ---")
+				print(f"  Pending: {expiry_stats['pending']} | Passes: {expiry_stats['passes']} | Evicted: " +
+					", ".join(f"{kind} {count}" for kind, count in expiry_stats['evicted'].items()))
+				frame_stats = peer_manager.frames.get_stats()
+				print("\n--- Encoded Frames ---")
+				print(f"  Cached: {frame_stats['cached']} | Reused: {frame_stats['hits']} | Built: {frame_stats['builds']}")
+				if peer_manager.store:
+					store_stats = peer_manager.store.get_stats()
+					print("\n--- State Store ---")
+					print(f"  Logged: {store_stats['appended']} | WAL records: {store_stats['wal_records']} | Snapshots: {store_stats['snapshots']} | "
+						f"Fsyncs: {store_stats['fsyncs']} | Replayed at startup: {store_stats['replayed']}")
+				type_stats = registry.get_stats()
+				if type_stats:
+					bucket_labels = [f"<{bound * 1000:g}ms" for bound in LATENCY_BUCKETS] + [f">={LATENCY_BUCKETS[-1] * 1000:g}ms"]
+					print("\n--- Messages by Type ---")
+					for msg_type, entry in sorted(type_stats.items()):
+						print(f"  {msg_type}: {entry['received']} received, {entry['handled']} handled, {entry['dropped']} dropped, {entry['duplicates']} duplicates, {entry['errors']} errors | avg {entry['avg_time'] * 1000:.3f} ms, max {entry['max_time'] * 1000:.3f} ms")
+						histogram = ", ".join(f"{label}: {count}" for label, count in zip(bucket_labels, entry['histogram']) if count)
+						print(f"    latency {histogram}")
+
 			elif cmd == "help":
 				print("Available commands:")
 				print("  profile    - Set your user profile (with optional avatar)")
@@ -510,20 +588,26 @@ def run_shell(logger, peer_manager):
 				print("  group update - Update group membership")
 				print("  group message - Send message to a group")
 				print("  group show - Show detailed group information")
+				print("  history    - Page through older posts, DMs or group messages")
 				print("  offer file - offer to send a file to a peer")
+				print("  accept <fileid> / reject <fileid> - Answer a file offer")
+				print("  transfers  - Show file transfer progress and throughput")
+				print("  resume     - Resume an interrupted incoming file transfer")
 				print("  verbose [on|off] - Toggle verbose logging")
 				print("  ttl        - Set TTL")
+				print("  stats      - Show network counters")
+				print("  rtt        - Show per-peer round-trip times and retransmission timeouts")
 				print("  exit       - Quit the application")
 			
 			elif cmd == "avatar":
 				# Show available peers with avatars
 				print("\n--- Peers with Profile Pictures ---")
 				peers_with_avatars = []
-				for user_id, peer_info in peer_manager.peers.items():
-					if peer_info.get('avatar_type') and peer_info.get('avatar_data'):
-						display_name = peer_info.get('display_name', 'Unknown')
-						avatar_type = peer_info.get('avatar_type')
-						avatar_size = len(peer_info.get('avatar_data', ''))
+				for user_id, peer_info in peer_manager.peer_items():
+					if peer_info.has_avatar():
+						display_name = peer_info.display_name
+						avatar_type = peer_info.avatar_type
+						avatar_size = len(peer_info.avatar_data)
 						peers_with_avatars.append((user_id, display_name, avatar_type, avatar_size))
 						print(f"  {display_name} ({user_id}) - {avatar_type}")
 				
@@ -535,15 +619,15 @@ def run_shell(logger, peer_manager):
 					
 					if not peer_info:
 						print("Peer not found.")
-					elif not peer_info.get('avatar_data'):
+					elif not peer_info.avatar_data:
 						print("This peer has no profile picture.")
 					else:
 						try:
 							import base64
 							import os
 							
-							avatar_data = peer_info.get('avatar_data')
-							avatar_type = peer_info.get('avatar_type', 'image/png')
+							avatar_data = peer_info.avatar_data
+							avatar_type = peer_info.avatar_type or 'image/png'
 							
 							# Determine file extension from MIME type
 							extension = '.png'  # default
@@ -574,16 +658,16 @@ def run_shell(logger, peer_manager):
 				posts_found = False
 				for user_id in peer_manager.following:
 					peer_info = peer_manager.peers.get(user_id)
-					if peer_info and peer_info.get('posts'):
-						posts = peer_info['posts']
-						display_name = peer_info['display_name']
+					if peer_info and peer_info.posts:
+						posts = peer_info.posts
+						display_name = peer_info.display_name
 						print(f"\nPosts from {display_name} ({user_id}):")
 						for i, post in enumerate(posts, 1):
 							# Check if post is still valid
-							is_valid, error = validate_token(post.get("token"), "broadcast", peer_manager.revoked_tokens)
+							is_valid, error = validate_token(post.token, "broadcast", peer_manager.revoked_tokens)
 							if is_valid:
-								content = post.get('content', 'No content')
-								timestamp = post.get('timestamp', 'N/A')
+								content = post.content
+								timestamp = post.timestamp
 								print(f"  {i}. {content}")
 								print(f"     Timestamp: {timestamp}")
 								posts_found = True
@@ -619,15 +703,15 @@ def run_shell(logger, peer_manager):
 					print(f"Peer '{target_user}' not found.")
 					continue
 				
-				posts = peer_info.get('posts', [])
+				posts = peer_info.posts
 				post_found = False
 				target_post_content = ""
 				for post in posts:
-					if post.get('timestamp') == post_timestamp:
-						is_valid, error = validate_token(post.get("token"), "broadcast", peer_manager.revoked_tokens)
+					if post.timestamp == post_timestamp:
+						is_valid, error = validate_token(post.token, "broadcast", peer_manager.revoked_tokens)
 						if is_valid:
 							post_found = True
-							target_post_content = post.get('content', '')
+							target_post_content = post.content
 							break
 				
 				if not post_found:
@@ -661,7 +745,7 @@ def run_shell(logger, peer_manager):
 				try:
 					_, ip = target_user.split("@")
 					send_message(like_message, (ip, config.PORT))
-					peer_manager.issued_tokens.append(token)
+					peer_manager.issue_token(token)
 					logger.log_send("LIKE", ip, like_message, peer_manager)
 					
 					# Store the like locally for tracking
@@ -707,8 +791,10 @@ def run_shell(logger, peer_manager):
 					return
 
 				peer_manager.create_game(game_id, recipient, is_initiator=True, token=token, my_symbol="X", opponent_symbol="O")
-				send_message(invite_message, (ip, config.PORT))
-				peer_manager.issued_tokens.append(token)
+				frame = encode_message(invite_message)
+				send_message(frame, (ip, config.PORT))
+				peer_manager.track_ack(message_id, invite_message, (ip, config.PORT), frame)
+				peer_manager.issue_token(token)
 				print(f"Invitation sent to {recipient} with GAMEID {game_id}")
 
 			elif cmd == "tictactoe move":
@@ -765,8 +851,10 @@ def run_shell(logger, peer_manager):
 
 				peer_manager.apply_move(game_id, position, is_self=True)
 				print_board(game["board"])
-				send_message(move_message, (ip, config.PORT))
-				peer_manager.issued_tokens.append(token)
+				frame = encode_message(move_message)
+				send_message(frame, (ip, config.PORT))
+				peer_manager.track_ack(message_id, move_message, (ip, config.PORT), frame)
+				peer_manager.issue_token(token)
 				print(f"Move sent to {game['opponent_id']} at position {position}")
 
 				result, winning_line = check_game_result(game["board"])
@@ -835,10 +923,11 @@ def run_shell(logger, peer_manager):
 
 					# send to all members
 					member_ips = peer_manager.get_group_member_ips(group_id)
+					frame = encode_message(message) # one encoding for every member
 					for ip in member_ips:
-						send_message(message, (ip, config.PORT))
+						send_message(frame, (ip, config.PORT))
 					
-					peer_manager.issued_tokens.append(message["TOKEN"])
+					peer_manager.issue_token(message["TOKEN"])
 					logger.log_send("GROUP_CREATE", get_local_ip(), message)
 
 				except Exception as e:
@@ -885,13 +974,14 @@ def run_shell(logger, peer_manager):
 
 					# send to all current members
 					member_ips = peer_manager.get_group_member_ips(group_id)
+					frame = encode_message(message) # one encoding for every recipient
 					if remove_members:
 						for id in remove_members:
-							send_message(message, (id.split("@")[1], config.PORT))
+							send_message(frame, (peer_manager.user_ip(id), config.PORT))
 					for ip in member_ips:
-						send_message(message, (ip, config.PORT))
+						send_message(frame, (ip, config.PORT))
 					
-					peer_manager.issued_tokens.append(message["TOKEN"])
+					peer_manager.issue_token(message["TOKEN"])
 					logger.log_send("GROUP_UPDATE", get_local_ip(), message)
 					
 					# success message
@@ -941,10 +1031,11 @@ def run_shell(logger, peer_manager):
 
 					# send to all group members
 					member_ips = peer_manager.get_group_member_ips(group_id)
+					frame = encode_message(message) # one encoding for every member
 					for ip in member_ips:
-						send_message(message, (ip, config.PORT))
+						send_message(frame, (ip, config.PORT))
 					
-					peer_manager.issued_tokens.append(message["TOKEN"])
+					peer_manager.issue_token(message["TOKEN"])
 					logger.log_send("GROUP_MESSAGE", get_local_ip(), message)
 
 				except Exception as e:
@@ -977,18 +1068,92 @@ def run_shell(logger, peer_manager):
 					print(f"  {member}")
 				
 				if group_details['messages']:
-					print(f"\nRecent messages ({len(group_details['messages'])}):")
-					for msg in group_details['messages'][-10:]:  
+					print(f"\nRecent messages ({group_details['message_count']}, 'history' pages through older ones):")
+					for msg in group_details['messages']:
 						# show last 10 messages
 						import datetime
-						timestamp = datetime.datetime.fromtimestamp(msg['timestamp']).strftime("%H:%M:%S")
-						print(f"  [{timestamp}] {msg['from']}: {msg['content']}")
+						timestamp = datetime.datetime.fromtimestamp(msg.timestamp).strftime("%H:%M:%S")
+						print(f"  [{timestamp}] {msg.sender}: {msg.content}")
 				else:
 					print("\nNo messages yet.")
 			
+			# page through a peer's posts or DMs, or a group's messages (including spilled history)
+			elif cmd == "history":
+				kind = input("History of (posts/dms/groups): ").strip().lower()
+				if kind not in ("posts", "dms", "groups"):
+					print("Choose posts, dms or groups.")
+					continue
+				key = input("User ID or group ID: ").strip()
+				try:
+					page = int(input("Page (0 = newest): ").strip() or 0)
+				except ValueError:
+					print("Page must be a number.")
+					continue
+				records = peer_manager.get_history(kind, key, page)
+				if not records:
+					print("Nothing on that page.")
+				import datetime
+				for record in records:
+					when = datetime.datetime.fromtimestamp(int(record.timestamp)).strftime("%Y-%m-%d %H:%M:%S") if record.timestamp else "N/A"
+					sender = f"{record.sender}: " if kind == "groups" else ""
+					print(f"  [{when}] {sender}{record.content}")
+
 			elif cmd == "offer file":
 				send_file_offer(peer_manager, config.TTL)
 
+			# answering a FILE_OFFER: 'accept <fileid>' / 'reject <fileid>' (no id lists the offers)
+			elif cmd.partition(" ")[0] in ("accept", "reject"):
+				parts = cmd.split()
+				if len(parts) != 2:
+					if not peer_manager.file_offers:
+						print("No pending file offers.")
+					for file_id, offer in list(peer_manager.file_offers.items()):
+						print(f"  {file_id}: {offer['FILENAME']} ({offer['FILESIZE']} bytes) from {peer_manager.get_display_name(offer['FROM'])}")
+					print(f"Usage: {parts[0]} <fileid>")
+				elif not (accept_file_offer if parts[0] == "accept" else reject_file_offer)(parts[1], peer_manager):
+					print(f"No pending file offer {parts[1]}.")
+
+			elif cmd == "transfers":
+				transfer_stats = peer_manager.transfer_scheduler.get_stats()
+				limit = lambda rate: f"{rate / 1024:.0f} KB/s" if rate else "unlimited"
+				print(f"\n--- Outgoing Transfers (limit {limit(transfer_stats['rate'])}, per peer {limit(transfer_stats['peer_rate'])}) ---")
+				rows = peer_manager.transfer_scheduler.get_transfers()
+				if not rows:
+					print("No outgoing transfers.")
+				for row in rows:
+					percent = 100 * row['completed_chunks'] / row['total_chunks'] if row['total_chunks'] else 100
+					print(f"  [{row['state']}] {row['filename']} -> {peer_manager.get_display_name(row['receiver'])}: "
+						f"{percent:.1f}% ({row['completed_chunks']}/{row['total_chunks']} chunks) | {row['goodput'] / 1024:.1f} KB/s | "
+						f"window {row['cwnd']:.1f} | {row['retransmits']} retransmitted ({row['corrupt']} corrupt) | "
+						f"hashing {row['hash_seconds'] * 1000:.1f} ms | {row['elapsed']:.1f}s")
+				incoming = [(file_id, context) for file_id, context in peer_manager.file_transfer_context.items() if context.get("transfer")]
+				if incoming:
+					print("\n--- Incoming Transfers ---")
+					for file_id, context in incoming:
+						transfer = context["transfer"]
+						state = "done" if transfer.completed else "receiving"
+						percent = 100 * transfer.received.count / transfer.total_chunks if transfer.total_chunks else 100
+						print(f"  [{state}] {transfer.filename} <- {peer_manager.get_display_name(context['from'])}: "
+							f"{percent:.1f}% ({transfer.received.count}/{transfer.total_chunks} chunks) | "
+							f"hashing {transfer.hash_seconds * 1000:.1f} ms")
+
+			elif cmd == "resume":
+				resumable = find_resumable()
+				if not resumable:
+					print("\nNo interrupted file transfers.")
+					continue
+				print("\n--- Interrupted File Transfers ---")
+				for i, manifest in enumerate(resumable, 1):
+					received = ChunkBitmap.from_bytes(manifest["total_chunks"], base64.b64decode(manifest["bitmap"]))
+					percent = 100 * received.count / manifest["total_chunks"] if manifest["total_chunks"] else 100
+					print(f"{i}. {manifest['filename']} from {peer_manager.get_display_name(manifest['from'])} ({percent:.1f}% received)")
+				choice = input("Select transfer to resume (number): ").strip()
+				if not choice.isdigit() or not 1 <= int(choice) <= len(resumable):
+					print("Invalid selection.")
+					continue
+				context = resume_incoming(peer_manager, resumable[int(choice) - 1]["manifest_path"])
+				print(f"Asked {context['from']} to resume {context['filename']}")
+
 			else:
 				print("Unknown command. Type 'help'.")
 
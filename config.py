@@ -4,4 +4,43 @@ from utils.network_utils import get_manual_broadcast
 PORT = 50999
 BROADCAST_ADDR = get_manual_broadcast()
 VERBOSE = True
-TTL = 3600 # default is 3600
\ No newline at end of file
+TTL = 3600 # default is 3600
+MAX_TTL = 86400 # longest a received POST's TTL, or a post / DM kept in memory for its token, is honoured (seconds)
+SEND_POOL_SIZE = 2 # long-lived sockets used for sending (including the bound listener socket)
+BATCH_RECV = True # drain every ready datagram per wakeup instead of one recvfrom per loop
+RECV_BATCH_SIZE = 32 # max datagrams drained per wakeup (one preallocated 64KB buffer each)
+RECV_BUFFER_SIZE = 1048576 # requested SO_RCVBUF in bytes (the kernel may clamp it)
+DISPATCH_WORKERS = 4 # dispatcher worker threads (0 dispatches inline on the receive thread)
+DISPATCH_QUEUE_SIZE = 1024 # total queued messages across all workers
+DISPATCH_OVERFLOW = "drop-oldest" # drop-oldest | drop-newest | block
+ACK_TIMEOUT = 1 # initial retransmission timeout (seconds) until a peer's RTT has been measured
+ACK_MAX_ATTEMPTS = 3 # sends (including the first) before giving up
+DEDUP_CAPACITY = 4096 # MESSAGE_IDs remembered for duplicate suppression
+DEDUP_TTL = 120 # seconds a handled MESSAGE_ID is remembered (well beyond the retransmission window)
+HISTORY_PEER_POSTS = 200 # posts kept in memory per peer (older ones are spilled or dropped)
+HISTORY_PEER_DMS = 200 # DMs kept in memory per peer
+HISTORY_GROUP_MESSAGES = 500 # messages kept in memory per group
+HISTORY_DIR = None # directory for the on-disk history logs that overflow spills to (None = drop overflow)
+STATE_DIR = None # directory of the persistent peer state (snapshot + write-ahead log); None = state lives in memory only
+STATE_FSYNC_INTERVAL = 1.0 # seconds between fsyncs of the write-ahead log (0 = fsync every change, None = leave it to the OS)
+STATE_SNAPSHOT_EVERY = 50000 # write-ahead log records before they are compacted into a new snapshot
+EXPIRY_GRANULARITY = 1 # seconds between expiry passes at most once per this interval (posts, DMs, tokens)
+RTO_MIN = 0.2 # lower clamp for the retransmission timeout (seconds)
+RTO_MAX = 10 # upper clamp, also caps exponential backoff (seconds)
+RTO_JITTER = 0.1 # +/- fraction of random jitter applied to each backoff timeout
+FILE_WINDOW_INITIAL = 8 # chunks in flight when a windowed transfer starts
+FILE_WINDOW_MAX = 256 # congestion window cap (must not exceed FILE_SACK_BITS)
+FILE_SACK_EVERY = 8 # receiver sends a FILE_SACK after this many chunks (and on gaps or duplicates)
+FILE_SACK_BITS = 256 # chunks past BASE covered by the FILE_SACK bitmap
+FILE_MAX_STALLS = 8 # consecutive timeouts without progress before a transfer is abandoned
+FILE_MANIFEST_EVERY = 256 # new chunks between resume manifest checkpoints (each one syncs the part file)
+FILE_RESUME_MAX_RANGES = 512 # received ranges listed in a FILE_RESUME (the rest are re-sent)
+PENDING_FILES_PATH = "pending_files.json" # offered files, kept across restarts for FILE_RESUME
+MAX_ACTIVE_TRANSFERS = 4 # outgoing file transfers sent concurrently (others wait in a queue)
+TRANSFER_RATE_LIMIT = 0 # bytes/s across all outgoing transfers (0 = unlimited)
+TRANSFER_PEER_RATE_LIMIT = 0 # bytes/s to any one receiver (0 = unlimited)
+TRANSFER_BURST = 0.1 # seconds of traffic a rate limit lets through in one burst
+TRANSFER_BATCH = 64 # chunks sent per scheduler round before checking for other work
+FILE_MTU = 0 # path MTU used to size FILE_CHUNKs (0 = ask the kernel for the route MTU, default 1500)
+FILE_JUMBO = False # size FILE_CHUNKs to the largest UDP datagram (loopback / jumbo-frame links)
+BINARY_FRAMES = False # offer/accept raw binary FILE_CHUNK DATA instead of base64 (peers without it get text)
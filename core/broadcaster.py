@@ -5,17 +5,26 @@ from utils.network_utils import send_message
 import json
 from parser.message_parser import craft_message
 
+# builds the periodic PING, or None while the own profile is incomplete
+def build_ping(peer_manager):
+    profile = peer_manager.get_own_profile()
+    # Only broadcast if the profile is complete (has USER_ID)
+    if profile and profile.get("USER_ID"):
+        return {
+            "TYPE": "PING",
+            "USER_ID": profile.get("USER_ID")
+        }
+    return None
+
+# the encoded PING, built again only when the own profile changes
+def ping_frame(peer_manager):
+    return peer_manager.frames.get("PING", peer_manager.profile_version, lambda: build_ping(peer_manager))
+
 def broadcast_profile_periodically(logger, peer_manager, interval=300): # set the interval to 20 seconds for testing
     def broadcast_loop():
         while True:
-            profile = peer_manager.get_own_profile()
-            # Only broadcast if the profile is complete (has USER_ID)
-            if profile and profile.get("USER_ID"):
-                user_id = profile.get("USER_ID")
-                ping = {
-                    "TYPE": "PING",
-                    "USER_ID": user_id
-                }
+            ping = ping_frame(peer_manager)
+            if ping:
                 send_message(ping, (config.BROADCAST_ADDR, config.PORT))
                 
                 #lsnp_text = craft_message(profile)
@@ -0,0 +1,55 @@
+import threading
+import time
+from collections import OrderedDict
+
+# bounded, time-expiring set of recently handled message keys (LRU + TTL).
+# entries are kept in last-seen order, so both the capacity bound and expiry only
+# ever remove from the front; every check is O(1) amortized
+class SeenCache:
+	def __init__(self, capacity=4096, ttl=120):
+		self.capacity = capacity
+		self.ttl = ttl
+		self.entries = OrderedDict() # key -> last seen time
+		self.lock = threading.Lock()
+		self.stats = {"hits": 0, "misses": 0, "evicted": 0, "expired": 0}
+
+	# returns True if key was seen within the TTL, and records it as seen either way
+	def check_and_add(self, key, now=None):
+		now = time.monotonic() if now is None else now
+		with self.lock:
+			self._expire(now)
+			if key in self.entries:
+				self.entries[key] = now
+				self.entries.move_to_end(key)
+				self.stats["hits"] += 1
+				return True
+			self.entries[key] = now
+			self.stats["misses"] += 1
+			if len(self.entries) > self.capacity:
+				self.entries.popitem(last=False)
+				self.stats["evicted"] += 1
+			return False
+
+	# forget key, so the next copy of it is handled again (its handler failed)
+	def discard(self, key):
+		with self.lock:
+			self.entries.pop(key, None)
+
+	def _expire(self, now):
+		while self.entries:
+			key, seen_at = next(iter(self.entries.items()))
+			if now - seen_at < self.ttl:
+				break
+			self.entries.popitem(last=False)
+			self.stats["expired"] += 1
+
+	def __len__(self):
+		return len(self.entries)
+
+	def get_stats(self):
+		with self.lock:
+			stats = dict(self.stats)
+			stats["size"] = len(self.entries)
+		lookups = stats["hits"] + stats["misses"]
+		stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+		return stats
@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import deque
+from parser.message_parser import copy_bulk
+
+OVERFLOW_POLICIES = ("drop-oldest", "drop-newest", "block")
+
+# one bounded ring queue served by a single worker thread.
+# all messages from the same sender land in the same lane, so they are handled in order
+class DispatchLane:
+	def __init__(self, capacity):
+		self.capacity = capacity
+		self.queue = deque() # (enqueued_at, message, addr, peer_manager)
+		self.cond = threading.Condition()
+		self.max_depth = 0
+		self.busy = False # the worker is dispatching a message taken off the queue
+
+# receive thread -> bounded per-lane queues -> N dispatcher workers
+class DispatchPool:
+	def __init__(self, dispatcher, logger, workers=4, queue_size=1024, overflow="drop-oldest"):
+		if overflow not in OVERFLOW_POLICIES:
+			raise ValueError(f"Unknown overflow policy '{overflow}', expected one of {', '.join(OVERFLOW_POLICIES)}")
+		self.dispatch = dispatcher
+		self.logger = logger
+		self.overflow = overflow
+		self.running = False
+		# the queue bound is shared evenly between lanes
+		lane_capacity = max(1, queue_size // max(1, workers))
+		self.lanes = [DispatchLane(lane_capacity) for _ in range(max(1, workers))]
+		self.stats_lock = threading.Lock()
+		self.stats = {
+			"enqueued": 0,
+			"processed": 0,
+			"dropped_oldest": 0,
+			"dropped_newest": 0,
+			"blocked": 0,
+			"errors": 0,
+			"wait_total": 0.0,
+			"wait_max": 0.0,
+		}
+
+	def start(self):
+		self.running = True
+		for index, lane in enumerate(self.lanes):
+			threading.Thread(target=self._worker, args=(lane,), name=f"dispatch-{index}", daemon=True).start()
+
+	# wait (up to timeout) until every queued message has been dispatched, so nothing is
+	# handled after state is closed. receiving should have stopped first
+	def drain(self, timeout=None):
+		deadline = None if timeout is None else time.monotonic() + timeout
+		for lane in self.lanes:
+			with lane.cond:
+				while self.running and (lane.queue or lane.busy):
+					remaining = None if deadline is None else deadline - time.monotonic()
+					if remaining is not None and remaining <= 0:
+						return False
+					lane.cond.wait(remaining)
+		return True
+
+	# workers exit and receive threads blocked on a full lane give up on their message
+	def stop(self):
+		self.running = False
+		for lane in self.lanes:
+			with lane.cond:
+				lane.cond.notify_all()
+
+	# messages are routed by source IP so per-sender ordering is preserved
+	def lane_for(self, addr):
+		return self.lanes[hash(addr) % len(self.lanes)]
+
+	# same signature as dispatch(), so it can be handed to UDPHandler in its place.
+	# a queued message outlives the receive buffer it may still point into, so that is copied
+	def submit(self, message, addr, peer_manager):
+		copy_bulk(message)
+		lane = self.lane_for(addr)
+		with lane.cond:
+			if len(lane.queue) >= lane.capacity:
+				if self.overflow == "drop-newest":
+					self._count("dropped_newest")
+					return False
+				if self.overflow == "drop-oldest":
+					lane.queue.popleft()
+					self._count("dropped_oldest")
+				else:
+					self._count("blocked")
+					while self.running and len(lane.queue) >= lane.capacity:
+						lane.cond.wait()
+					if len(lane.queue) >= lane.capacity: # stopped while waiting: drop it rather than overfill
+						self._count("dropped_newest")
+						return False
+			lane.queue.append((time.monotonic(), message, addr, peer_manager))
+			lane.max_depth = max(lane.max_depth, len(lane.queue))
+			lane.cond.notify_all()
+		self._count("enqueued")
+		return True
+
+	def _worker(self, lane):
+		while self.running:
+			with lane.cond:
+				while self.running and not lane.queue:
+					lane.cond.wait()
+				if not self.running:
+					return
+				enqueued_at, message, addr, peer_manager = lane.queue.popleft()
+				lane.busy = True
+				lane.cond.notify_all() # wake a receive thread blocked on a full lane
+			waited = time.monotonic() - enqueued_at
+			try:
+				self.dispatch(message, addr, peer_manager)
+			except Exception as e:
+				self._count("errors")
+				self.logger.log("ERROR", str(e))
+			with lane.cond:
+				lane.busy = False
+				lane.cond.notify_all() # wake drain()
+			with self.stats_lock:
+				self.stats["processed"] += 1
+				self.stats["wait_total"] += waited
+				self.stats["wait_max"] = max(self.stats["wait_max"], waited)
+
+	def _count(self, key):
+		with self.stats_lock:
+			self.stats[key] += 1
+
+	def get_stats(self):
+		with self.stats_lock:
+			stats = dict(self.stats)
+		stats["depth"] = sum(len(lane.queue) for lane in self.lanes)
+		stats["max_depth"] = max(lane.max_depth for lane in self.lanes)
+		stats["capacity"] = sum(lane.capacity for lane in self.lanes)
+		stats["workers"] = len(self.lanes)
+		stats["overflow"] = self.overflow
+		stats["wait_avg"] = stats["wait_total"] / stats["processed"] if stats["processed"] else 0.0
+		return stats
@@ -0,0 +1,140 @@
+import heapq
+import itertools
+import threading
+import time
+
+# min-heap of expiry times for state that must not outlive its TTL (posts, DMs, issued and
+# revoked tokens). an entry names a kind, the container holding the expiring item and the
+# item; when entries come due, each container is pruned once with the pruner registered for
+# its kind, given all of its due items, and returns how many it removed.
+# a container that drops items before they expire (a capped history) calls forget(), so the
+# heap does not keep them alive until their TTL; forgotten entries are skipped, and the heap
+# is compacted once they make up half of it.
+# times are wall-clock epoch seconds, like token expiries. pump() does one pass and says how
+# long to sleep, so the engine is driven by its own thread in threaded mode or by a task on
+# the asyncio engine's loop
+class ExpiryEngine:
+	def __init__(self, granularity=1.0):
+		self.granularity = granularity # minimum sleep, so expiries close together share one pass
+		self.heap = [] # [expires_at, seq, kind, container, item]; kind is None once forgotten
+		self.entries = {} # (id(container), id(item)) -> its heap entry, for forget()
+		self.forgotten = 0 # forgotten entries still in the heap
+		self.pruners = {} # kind -> prune(container, items) -> items removed
+		self.seq = itertools.count()
+		self.lock = threading.Lock()
+		self.wakeup = threading.Event()
+		self.notify = self.wakeup.set # replaced by the asyncio engine with a loop-safe wakeup
+		self.running = False
+		self.stats = {"tracked": 0, "passes": 0, "evicted": {}}
+
+	def register(self, kind, prune):
+		self.pruners[kind] = prune
+		self.stats["evicted"].setdefault(kind, 0)
+
+	# remove item from container (with kind's pruner) once expires_at has passed
+	def track(self, kind, container, item, expires_at):
+		with self.lock:
+			seq = next(self.seq)
+			entry = [expires_at, seq, kind, container, item]
+			heapq.heappush(self.heap, entry)
+			self.entries[(id(container), id(item))] = entry
+			self.stats["tracked"] += 1
+			earliest = self.heap[0][1] == seq
+		if earliest:
+			self.notify() # new earliest expiry, wake whoever drives the engine
+
+	# track (kind, container, item, expires_at) entries in one go (restoring saved state):
+	# one heapify instead of a push each
+	def track_many(self, entries):
+		with self.lock:
+			for kind, container, item, expires_at in entries:
+				entry = [expires_at, next(self.seq), kind, container, item]
+				self.heap.append(entry)
+				self.entries[(id(container), id(item))] = entry
+			heapq.heapify(self.heap)
+			self.stats["tracked"] += len(entries)
+		self.notify()
+
+	# container dropped these items before they expired: stop holding them. with keep, the
+	# entries stay (without the item) so the container is still pruned when they come due,
+	# for a history whose spilled log drops its own expired records then
+	def forget(self, container, items, keep=False):
+		with self.lock:
+			for item in items:
+				entry = self.entries.pop((id(container), id(item)), None)
+				if entry is None:
+					continue
+				entry[4] = None
+				if not keep:
+					entry[2] = entry[3] = None
+					self.forgotten += 1
+			if self.forgotten > len(self.heap) // 2:
+				self.heap = [entry for entry in self.heap if entry[2] is not None]
+				heapq.heapify(self.heap)
+				self.forgotten = 0
+
+	def __len__(self):
+		return len(self.heap) - self.forgotten
+
+	def next_deadline(self):
+		with self.lock:
+			return self.heap[0][0] if self.heap else None
+
+	# remove every item due by now, one pruner call per container; returns the number removed
+	def run_due(self, now=None):
+		now = time.time() if now is None else now
+		due = {} # (kind, id(container)) -> (kind, container, items)
+		with self.lock:
+			while self.heap and self.heap[0][0] <= now:
+				popped = heapq.heappop(self.heap)
+				_, _, kind, container, item = popped
+				if kind is None:
+					self.forgotten -= 1
+					continue
+				key = (id(container), id(item))
+				if self.entries.get(key) is popped:
+					del self.entries[key]
+				entry = due.get((kind, id(container)))
+				if entry is None:
+					entry = due[(kind, id(container))] = (kind, container, [])
+				entry[2].append(item)
+		removed = 0
+		for kind, container, items in due.values():
+			count = self.pruners[kind](container, items)
+			self.stats["evicted"][kind] += count
+			removed += count
+		if due:
+			self.stats["passes"] += 1
+		return removed
+
+	# one pass; returns seconds until the next expiry (None when nothing is tracked)
+	def pump(self, now=None):
+		now = time.time() if now is None else now
+		self.run_due(now)
+		deadline = self.next_deadline()
+		if deadline is None:
+			return None
+		return max(deadline - now, self.granularity)
+
+	def start(self):
+		with self.lock:
+			if self.running:
+				return
+			self.running = True
+		threading.Thread(target=self._loop, name="expiry", daemon=True).start()
+
+	def stop(self):
+		self.running = False
+		self.notify()
+
+	def _loop(self):
+		while self.running:
+			self.wakeup.clear()
+			self.wakeup.wait(self.pump())
+
+	def get_stats(self):
+		with self.lock:
+			stats = dict(self.stats)
+			stats["evicted"] = dict(self.stats["evicted"])
+			stats["pending"] = len(self.heap) - self.forgotten
+		return stats
@@ -0,0 +1,749 @@
+import base64
+import binascii
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from collections import deque
+import config
+from utils.network_utils import send_message, validate_token, CHUNK_SIZE
+from utils.chunk_frames import ChunkFrames
+from core.handler_registry import registry
+
+# one bit per chunk. `base` is the first chunk not received yet (every index below it is set)
+class ChunkBitmap:
+	def __init__(self, total):
+		self.total = total
+		self.bits = bytearray((total + 7) // 8)
+		self.count = 0
+		self.base = 0
+
+	def __contains__(self, index):
+		return bool(self.bits[index >> 3] & (1 << (index & 7)))
+
+	# returns True if the index was not set before
+	def add(self, index):
+		byte, mask = index >> 3, 1 << (index & 7)
+		if self.bits[byte] & mask:
+			return False
+		self.bits[byte] |= mask
+		self.count += 1
+		while self.base < self.total and self.base in self:
+			self.base += 1
+		return True
+
+	def complete(self):
+		return self.count == self.total
+
+	# rebuild from bytes produced by `bits` (as stored in a resume manifest)
+	@classmethod
+	def from_bytes(cls, total, data):
+		bitmap = cls(total)
+		bitmap.bits[:len(data)] = data[:len(bitmap.bits)]
+		if total % 8:
+			bitmap.bits[-1] &= (1 << (total % 8)) - 1 # ignore padding bits
+		bitmap.count = sum(bin(byte).count("1") for byte in bitmap.bits)
+		while bitmap.base < total and bitmap.base in bitmap:
+			bitmap.base += 1
+		return bitmap
+
+	# runs of set indices as (first, last) pairs
+	def ranges(self):
+		start = None
+		for byte_index, byte in enumerate(self.bits):
+			if byte in (0, 0xFF) and (start is None) == (byte == 0):
+				continue # whole byte continues the current state
+			for bit in range(8):
+				index = byte_index * 8 + bit
+				if index >= self.total:
+					break
+				if byte & (1 << bit):
+					if start is None:
+						start = index
+				elif start is not None:
+					yield start, index - 1
+					start = None
+		if start is not None:
+			yield start, self.total - 1
+
+	# bits for indices base .. base + nbits - 1 as a hex string (bit i = index base + i)
+	def window_hex(self, nbits):
+		value = 0
+		for i in range(nbits):
+			index = self.base + i
+			if index >= self.total:
+				break
+			if index in self:
+				value |= 1 << i
+		return format(value, "x")
+
+# sender side of a windowed transfer: a congestion window of chunks in flight,
+# selective acknowledgements from the receiver, and retransmission of missing chunks only
+class OutgoingTransfer:
+	def __init__(self, peer_manager, file_id, filepath, receiver_id, token, chunk_size=CHUNK_SIZE, received_ranges=(), binary=False):
+		self.peer_manager = peer_manager
+		self.file_id = file_id
+		self.filepath = filepath
+		self.filename = os.path.basename(filepath)
+		self.receiver_id = receiver_id
+		self.token = token
+		self.chunk_size = chunk_size
+		self.filesize = os.path.getsize(filepath)
+		self.total_chunks = (self.filesize + chunk_size - 1) // chunk_size  # ceil division
+		self.sender_id = peer_manager.get_own_profile()["USER_ID"]
+		self.addr = (receiver_id.split("@")[1], config.PORT)
+		self.binary = binary # raw DATA, negotiated with the receiver
+		self.frames = ChunkFrames(filepath, file_id, self.sender_id, receiver_id, token, chunk_size, binary)
+
+		self.lock = threading.Lock()
+		self.notify = lambda: None # set by the transfer scheduler, to wake whoever drives it
+		self.acked = ChunkBitmap(self.total_chunks)
+		for first, last in received_ranges: # chunks a resuming receiver already has
+			for index in range(max(first, 0), min(last, self.total_chunks - 1) + 1):
+				self.acked.add(index)
+		self.in_flight = {} # chunk index -> monotonic send time
+		self.resent = set() # chunks sent more than once (not used for RTT samples)
+		self.lost = deque() # chunks to retransmit before sending new ones
+		self.probe = None # chunk picked by the last timeout, resent even when the window is full
+		self.next_new = 0
+		self.cwnd = float(config.FILE_WINDOW_INITIAL)
+		self.ssthresh = float(config.FILE_WINDOW_MAX)
+		self.last_decrease = 0.0
+		self.stalls = 0 # consecutive timeouts without progress
+		self.started = time.monotonic()
+		self.finished_at = None
+		self.failed = None
+		self.stats = {"chunks_sent": 0, "bytes_sent": 0, "retransmits": 0, "timeouts": 0, "sacks": 0, "corrupt": 0}
+		if self.acked.complete(): # empty file, or a resume with nothing missing
+			self.finished_at = self.started
+		elif self.total_chunks - 1 in self.acked: # the receiver has the chunk that carries the file digest
+			self.frames.send_digest_with_every_chunk()
+
+	@property
+	def done(self):
+		return self.finished_at is not None or self.failed is not None
+
+	# next chunk index to put on the wire, or None while the window is full
+	def next_chunk(self, now):
+		with self.lock:
+			if self.done:
+				return None
+			if self.probe is not None: # sent regardless of the window
+				index, self.probe = self.probe, None
+				if index not in self.acked:
+					return self._resend_locked(index, now)
+			if len(self.in_flight) >= int(self.cwnd):
+				return None
+			while self.lost:
+				index = self.lost.popleft()
+				if index not in self.acked and index not in self.in_flight:
+					return self._resend_locked(index, now)
+			while self.next_new < self.total_chunks and self.next_new in self.acked:
+				self.next_new += 1
+			if self.next_new < self.total_chunks:
+				index = self.next_new
+				self.next_new += 1
+				self.in_flight[index] = now
+				self.stats["chunks_sent"] += 1
+				return index
+			return None
+
+	def _resend_locked(self, index, now):
+		self.in_flight[index] = now
+		self.resent.add(index)
+		self.stats["chunks_sent"] += 1
+		self.stats["retransmits"] += 1
+		return index
+
+	# encoded datagram for a chunk (valid until the next call; the driver sends it right away)
+	def encode_chunk(self, index):
+		with self.lock:
+			# ask for an immediate SACK when the window is full, since the receiver would
+			# otherwise wait for FILE_SACK_EVERY chunks that are not coming
+			sack_now = len(self.in_flight) >= int(self.cwnd) or index in self.resent
+		return self.frames.frame(index, sack_now)
+
+	# selective acknowledgement: everything below base plus the bits set in bitmap_hex.
+	# chunks the receiver reports as corrupt are queued for retransmission at once
+	def on_sack(self, base, bitmap_hex, now=None, corrupt=()):
+		now = time.monotonic() if now is None else now
+		with self.lock:
+			if self.done:
+				return
+			self.stats["sacks"] += 1
+			newly_acked = []
+			for index in range(self.acked.base, min(base, self.total_chunks)):
+				if self.acked.add(index):
+					newly_acked.append(index)
+			bits = int(bitmap_hex or "0", 16)
+			while bits:
+				low = bits & -bits
+				index = base + low.bit_length() - 1
+				if index < self.total_chunks and self.acked.add(index):
+					newly_acked.append(index)
+				bits ^= low
+			for index in corrupt:
+				if index in self.in_flight and index not in self.acked:
+					del self.in_flight[index]
+					self.lost.appendleft(index)
+					self.stats["corrupt"] += 1
+
+			# the newest acknowledged send gives an RTT sample (the receiver SACKs right away)
+			latest_sent, latest_index = None, None
+			for index in newly_acked:
+				sent_at = self.in_flight.pop(index, None)
+				if sent_at is not None and (latest_sent is None or sent_at > latest_sent):
+					latest_sent, latest_index = sent_at, index
+			if latest_sent is not None and latest_index not in self.resent:
+				self.peer_manager.rtt.sample(self.addr[0], now - latest_sent)
+
+			# chunks sent before one that already arrived are treated as lost
+			if latest_sent is not None:
+				lost = sorted(index for index, sent_at in self.in_flight.items() if sent_at < latest_sent)
+				if lost:
+					for index in lost:
+						del self.in_flight[index]
+					self.lost.extend(lost)
+					if now - self.last_decrease > self.peer_manager.rtt.rto(self.addr[0]):
+						self.cwnd = max(1.0, self.cwnd / 2)
+						self.ssthresh = self.cwnd
+						self.last_decrease = now
+
+			if newly_acked:
+				self.stalls = 0
+				if self.cwnd < self.ssthresh:
+					self.cwnd += len(newly_acked) # slow start
+				else:
+					self.cwnd += len(newly_acked) / self.cwnd # congestion avoidance
+				self.cwnd = min(self.cwnd, float(config.FILE_WINDOW_MAX))
+
+			if self.acked.complete():
+				self._finish_locked()
+		self.notify()
+
+	# retransmission timeout: resend only the most recently sent chunk as a probe (its SACK
+	# reveals which of the others are really missing) and restart the timer for the rest
+	def check_timeouts(self, now):
+		with self.lock:
+			if self.done or not self.in_flight:
+				return
+			rto = self.peer_manager.rtt.backoff(self.addr[0], self.stalls + 1)
+			if now - min(self.in_flight.values()) < rto:
+				return
+			probe = max(self.in_flight, key=lambda index: (self.in_flight[index], index))
+			del self.in_flight[probe]
+			for index in self.in_flight:
+				self.in_flight[index] = now
+			self.probe = probe
+			self.stats["timeouts"] += 1
+			self.ssthresh = max(2.0, self.cwnd / 2)
+			self.cwnd = 1.0
+			self.stalls += 1
+			if self.stalls > config.FILE_MAX_STALLS:
+				self.failed = f"no progress after {self.stalls} timeouts"
+				self.in_flight.clear()
+				self.lost.clear()
+
+	# seconds until the oldest chunk in flight times out (None when nothing is in flight)
+	def next_timeout(self, now):
+		with self.lock:
+			if self.done or not self.in_flight:
+				return None
+			rto = self.peer_manager.rtt.backoff(self.addr[0], self.stalls + 1)
+			return max(0.0, min(self.in_flight.values()) + rto - now)
+
+	# stop sending (e.g. superseded by a resumed transfer); the driver closes it
+	def cancel(self, reason):
+		with self.lock:
+			if not self.done:
+				self.failed = reason
+				self.in_flight.clear()
+				self.lost.clear()
+		self.notify()
+
+	# FILE_RECEIVED from the receiver also completes the transfer
+	def mark_complete(self):
+		with self.lock:
+			if not self.done:
+				self._finish_locked()
+		self.notify()
+
+	def _finish_locked(self):
+		self.finished_at = time.monotonic()
+		self.in_flight.clear()
+		self.lost.clear()
+
+	def elapsed(self):
+		end = self.finished_at if self.finished_at is not None else time.monotonic()
+		return max(end - self.started, 1e-9)
+
+	# chunks the receiver is known to have
+	def completed_chunks(self):
+		return self.acked.count
+
+	# file bytes acknowledged per second (retransmissions do not count)
+	def goodput(self):
+		acked_bytes = min(self.completed_chunks() * self.chunk_size, self.filesize)
+		return acked_bytes / self.elapsed()
+
+	def state(self):
+		if self.failed:
+			return "failed"
+		return "done" if self.finished_at is not None else "sending"
+
+	# one row for the shell's transfer view
+	def progress(self):
+		with self.lock:
+			return {
+				"file_id": self.file_id,
+				"filename": self.filename,
+				"receiver": self.receiver_id,
+				"state": self.state(),
+				"completed_chunks": self.completed_chunks(),
+				"total_chunks": self.total_chunks,
+				"bytes_sent": self.stats["bytes_sent"],
+				"goodput": self.goodput(),
+				"cwnd": self.cwnd,
+				"retransmits": self.stats["retransmits"],
+				"corrupt": self.stats["corrupt"],
+				"hash_seconds": self.frames.hash_seconds,
+				"elapsed": self.elapsed(),
+			}
+
+	# called by the driver once the transfer is done; the file is only read from the driver
+	def close(self):
+		self.frames.close()
+		if self.failed:
+			self.peer_manager.logger.log("FILE", f"Transfer of {self.filename} to {self.receiver_id} failed: {self.failed}")
+			return
+		self.peer_manager.logger.log("FILE", f"Sent {self.filename} to {self.receiver_id}: {self.filesize} bytes in {self.elapsed():.2f}s "
+								f"(goodput {self.goodput() / 1024:.1f} KB/s, {self.stats['retransmits']} chunks retransmitted, "
+								f"hashing {self.frames.hash_seconds * 1000:.1f} ms)")
+
+# plain chunk stream for receivers that do not send FILE_SACK: every chunk goes out once,
+# with no window or retransmission (pacing comes from the transfer scheduler's budgets)
+class StreamTransfer(OutgoingTransfer):
+	def next_chunk(self, now):
+		with self.lock:
+			if self.done:
+				return None
+			index = self.next_new
+			self.next_new += 1
+			if self.next_new >= self.total_chunks:
+				self.finished_at = now # the driver still sends this last chunk before closing
+			self.stats["chunks_sent"] += 1
+			return index
+
+	def encode_chunk(self, index):
+		return self.frames.frame(index)
+
+	def check_timeouts(self, now):
+		pass
+
+	def next_timeout(self, now):
+		return None
+
+	def completed_chunks(self):
+		return self.next_new # nothing is acknowledged, so sent is as good as it gets
+
+# start sending a file once the receiver accepted it. receivers that advertise SACK get
+# the windowed protocol, others the plain chunk stream; either way the transfer scheduler
+# drives it, off the receive path
+def start_outgoing_transfer(peer_manager, file_id, filepath, receiver_id, token, windowed, received_ranges=(), chunk_size=None,
+							binary=False):
+	previous = peer_manager.outgoing_transfers.get(file_id)
+	if previous and not previous.done:
+		previous.cancel("superseded by a resumed transfer")
+	chunk_size = chunk_size or CHUNK_SIZE
+	if windowed:
+		transfer = OutgoingTransfer(peer_manager, file_id, filepath, receiver_id, token, chunk_size, received_ranges, binary)
+	else:
+		transfer = StreamTransfer(peer_manager, file_id, filepath, receiver_id, token, chunk_size, binary=binary)
+	peer_manager.outgoing_transfers[file_id] = transfer
+	peer_manager.transfer_scheduler.add(transfer)
+	return transfer
+
+# ===== RECEIVER SIDE =====
+
+# receiver side of a transfer: chunks are written straight to a preallocated <name>.part
+# file at their offset and forgotten, so memory per transfer does not grow with the file.
+# progress is checkpointed to a <name>.part.json manifest (chunk bitmap plus a SHA-256 of
+# the contiguous prefix) so the transfer can be resumed after a restart.
+# the part file is renamed to the real name once every chunk is in
+class IncomingTransfer:
+	def __init__(self, filename, filesize, total_chunks, chunk_size, file_id=None, sender_id=None, received=None, binary=False):
+		self.filename = filename
+		self.part_path = filename + ".part"
+		self.manifest_path = self.part_path + ".json"
+		self.filesize = filesize
+		self.total_chunks = total_chunks
+		self.chunk_size = chunk_size
+		self.file_id = file_id
+		self.sender_id = sender_id
+		self.binary = binary # chunks were negotiated as raw binary DATA
+		self.received = received or ChunkBitmap(total_chunks)
+		self.since_sack = 0 # chunks since the last FILE_SACK
+		self.since_manifest = 0 # new chunks since the manifest was last written
+		self.highest = -1 # highest chunk index seen
+		self.completed = False
+		self.prefix_hash = hashlib.sha256() # over chunks 0 .. hashed_chunks - 1; the file digest once complete
+		self.hashed_chunks = 0
+		self.expected_sha256 = None # from the last chunk's SHA256 field
+		self.corrupt = [] # chunks that failed their CRC32 since the last FILE_SACK
+		self.hash_seconds = 0.0 # CPU time spent on CRC32 checks and the file digest
+		self.fd = os.open(self.part_path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+		self._preallocate()
+
+	# reserve the whole file up front (sparse if the filesystem cannot allocate)
+	def _preallocate(self):
+		if hasattr(os, "posix_fallocate") and self.filesize > 0:
+			try:
+				os.posix_fallocate(self.fd, 0, self.filesize)
+				return
+			except OSError:
+				pass
+		os.ftruncate(self.fd, self.filesize)
+
+	# expected payload length for a chunk (the last one may be short)
+	def chunk_length(self, index):
+		return min(self.chunk_size, self.filesize - index * self.chunk_size)
+
+	def _read_chunk(self, index):
+		offset = index * self.chunk_size
+		if hasattr(os, "pread"):
+			return os.pread(self.fd, self.chunk_length(index), offset)
+		os.lseek(self.fd, offset, os.SEEK_SET)
+		return os.read(self.fd, self.chunk_length(index))
+
+	# write one chunk at its offset; returns False for duplicates
+	def write(self, index, data):
+		if index in self.received:
+			return False
+		offset = index * self.chunk_size
+		if hasattr(os, "pwrite"):
+			os.pwrite(self.fd, data, offset)
+		else:
+			os.lseek(self.fd, offset, os.SEEK_SET)
+			os.write(self.fd, data)
+		self.received.add(index)
+		# extend the prefix hash; in-order chunks are hashed from memory, gaps filled later are read back
+		hash_started = time.perf_counter()
+		if index == self.hashed_chunks:
+			self.prefix_hash.update(data)
+			self.hashed_chunks += 1
+		self._hash_prefix()
+		self.hash_seconds += time.perf_counter() - hash_started
+		self.since_manifest += 1
+		if self.since_manifest >= config.FILE_MANIFEST_EVERY and not self.received.complete():
+			self.save_manifest()
+		return True
+
+	# check a chunk against the CRC32 it was sent with (chunks from older senders have none)
+	def verify(self, index, data, crc):
+		if crc is None:
+			return True
+		hash_started = time.perf_counter()
+		try:
+			valid = zlib.crc32(data) == int(crc, 16)
+		except ValueError:
+			valid = False
+		self.hash_seconds += time.perf_counter() - hash_started
+		if not valid:
+			self.corrupt.append(index)
+		return valid
+
+	# True unless the sender sent a file digest that the received data does not match
+	def digest_matches(self):
+		return self.expected_sha256 is None or self.prefix_hash.hexdigest() == self.expected_sha256.lower()
+
+	def _hash_prefix(self):
+		while self.hashed_chunks < self.received.base:
+			self.prefix_hash.update(self._read_chunk(self.hashed_chunks))
+			self.hashed_chunks += 1
+
+	# flush written chunks, then record them in the manifest (written atomically)
+	def save_manifest(self):
+		if hasattr(os, "fdatasync"):
+			os.fdatasync(self.fd)
+		else:
+			os.fsync(self.fd)
+		manifest = {
+			"file_id": self.file_id,
+			"from": self.sender_id,
+			"filename": self.filename,
+			"filesize": self.filesize,
+			"total_chunks": self.total_chunks,
+			"chunk_size": self.chunk_size,
+			"binary": self.binary,
+			"sha256": self.expected_sha256,
+			"bitmap": base64.b64encode(bytes(self.received.bits)).decode(),
+			"prefix_chunks": self.hashed_chunks,
+			"prefix_sha256": self.prefix_hash.hexdigest(),
+		}
+		tmp_path = self.manifest_path + ".tmp"
+		with open(tmp_path, "w") as f:
+			json.dump(manifest, f)
+		os.replace(tmp_path, self.manifest_path)
+		self.since_manifest = 0
+
+	# reopen a part file from its manifest. the prefix hash is recomputed from disk and
+	# compared with the manifest; a mismatch means the part file cannot be trusted and
+	# the transfer starts over
+	@classmethod
+	def from_manifest(cls, manifest_path):
+		with open(manifest_path) as f:
+			manifest = json.load(f)
+		received = ChunkBitmap.from_bytes(manifest["total_chunks"], base64.b64decode(manifest["bitmap"]))
+		part_exists = os.path.exists(manifest["filename"] + ".part")
+		transfer = cls(manifest["filename"], manifest["filesize"], manifest["total_chunks"], manifest["chunk_size"],
+					manifest["file_id"], manifest["from"], received, manifest.get("binary", False))
+		transfer.expected_sha256 = manifest.get("sha256")
+		prefix_chunks = min(manifest["prefix_chunks"], received.base)
+		while transfer.hashed_chunks < prefix_chunks:
+			transfer.prefix_hash.update(transfer._read_chunk(transfer.hashed_chunks))
+			transfer.hashed_chunks += 1
+		if (not part_exists or prefix_chunks != manifest["prefix_chunks"]
+				or transfer.prefix_hash.hexdigest() != manifest["prefix_sha256"]):
+			transfer.received = ChunkBitmap(transfer.total_chunks)
+			transfer.prefix_hash = hashlib.sha256()
+			transfer.hashed_chunks = 0
+		else:
+			transfer._hash_prefix()
+		return transfer
+
+	def _remove_manifest(self):
+		try:
+			os.remove(self.manifest_path)
+		except OSError:
+			pass
+
+	def finish(self):
+		os.close(self.fd)
+		os.replace(self.part_path, self.filename)
+		self._remove_manifest()
+		self.completed = True
+
+	def abort(self):
+		os.close(self.fd)
+		self._remove_manifest()
+		try:
+			os.remove(self.part_path)
+		except OSError:
+			pass
+
+def send_sack(context, file_id, peer_manager):
+	transfer = context["transfer"]
+	received = transfer.received
+	sack_msg = {
+		"TYPE": "FILE_SACK",
+		"FROM": peer_manager.get_own_profile().get("USER_ID"),
+		"TO": context["from"],
+		"FILEID": file_id,
+		"BASE": received.base,
+		"BITMAP": received.window_hex(config.FILE_SACK_BITS),
+		"RECEIVED": received.count,
+		"TOKEN": context["token"],
+		"TIMESTAMP": int(time.time())
+	}
+	if transfer.corrupt:
+		sack_msg["CORRUPT"] = ",".join(map(str, transfer.corrupt))
+	send_message(sack_msg, (context["from"].split("@")[1], config.PORT))
+	transfer.since_sack = 0
+	transfer.corrupt = []
+
+def handle_file_chunk(message, peer_manager):
+	file_id = message["FILEID"]
+	from_user = message["FROM"]
+
+	context = peer_manager.file_transfer_context.get(file_id)
+	if not context:
+		return  # No matching FILE_OFFER
+	if not context.get("accepted", False):
+		return  # User rejected the offer
+
+	# Extract chunk info
+	chunk_index = int(message["CHUNK_INDEX"])
+	transfer = context.get("transfer")
+	if transfer is None:
+		total_chunks = int(message["TOTAL_CHUNKS"])
+		chunk_size = int(message.get("CHUNK_SIZE", CHUNK_SIZE))
+		transfer = context["transfer"] = IncomingTransfer(context["filename"], context["filesize"], total_chunks, chunk_size,
+														file_id, from_user, binary=message.get("BINARY") == "DATA")
+		context["total_chunks"] = total_chunks
+	context["token"] = message["TOKEN"] # a resumed transfer may come with a fresh token
+	if int(message.get("CHUNK_SIZE", transfer.chunk_size)) != transfer.chunk_size:
+		peer_manager.logger.log_drop(f"FILE_CHUNK for {file_id} does not match the offered chunk size")
+		return
+	if not 0 <= chunk_index < transfer.total_chunks:
+		peer_manager.logger.log_drop(f"FILE_CHUNK {chunk_index} out of range for {file_id}")
+		return
+
+	is_new = chunk_index not in transfer.received
+	if is_new and not transfer.completed:
+		chunk_data = message["DATA"] # raw bytes in a binary frame, base64 otherwise
+		if message.get("BINARY") != "DATA":
+			chunk_data = binascii.a2b_base64(chunk_data) # decodes the memoryview without copying it first
+		if len(chunk_data) != transfer.chunk_length(chunk_index):
+			peer_manager.logger.log_drop(f"FILE_CHUNK {chunk_index} for {file_id} has the wrong length")
+			return
+		if not transfer.verify(chunk_index, chunk_data, message.get("CRC32")):
+			peer_manager.logger.log_drop(f"FILE_CHUNK {chunk_index} for {file_id} failed its CRC32 check")
+			send_sack(context, file_id, peer_manager) # ask for it again right away
+			return
+		if "SHA256" in message:
+			transfer.expected_sha256 = message["SHA256"]
+		transfer.write(chunk_index, chunk_data)
+	out_of_order = chunk_index > transfer.highest + 1
+	transfer.highest = max(transfer.highest, chunk_index)
+	transfer.since_sack += 1
+
+	# Check if all chunks are received
+	if transfer.received.complete() and not transfer.completed:
+		# the prefix hash now covers the whole file; a mismatch despite every CRC32 passing
+		# means the file is unusable, so it is discarded rather than renamed into place
+		status = "COMPLETE" if transfer.digest_matches() else "CORRUPT"
+		if status == "COMPLETE":
+			transfer.finish()
+			print(f"File transfer of {transfer.filename} is complete")
+		else:
+			transfer.abort()
+			context["accepted"] = False # ignore chunks still in flight
+			peer_manager.logger.log("FILE", f"{transfer.filename} does not match the sender's SHA-256; discarded")
+
+		# Send FILE_RECEIVED
+		file_received_msg = {
+			"TYPE": "FILE_RECEIVED",
+			"FROM": peer_manager.get_own_profile().get("USER_ID"),
+			"TO": from_user,
+			"FILEID": file_id,
+			"STATUS": status,
+			"TIMESTAMP": int(time.time())
+		}
+		send_message(file_received_msg, (from_user.split("@")[1], config.PORT))
+		if status == "CORRUPT":
+			return
+
+	# acknowledge periodically, right away on gaps and duplicates, and at the end
+	if (not is_new or out_of_order or message.get("SACK_NOW") == "1" or transfer.completed
+			or chunk_index == transfer.total_chunks - 1 or transfer.since_sack >= config.FILE_SACK_EVERY):
+		send_sack(context, file_id, peer_manager)
+
+@registry.register("FILE_SACK", required_fields=("FROM", "FILEID", "BASE", "TOKEN"), token_scope="file")
+def handle_file_sack(message, addr, peer_manager):
+	transfer = peer_manager.outgoing_transfers.get(message["FILEID"])
+	if not transfer:
+		return
+	try:
+		base = int(message["BASE"])
+	except ValueError:
+		peer_manager.logger.log_drop("Malformed FILE_SACK message.")
+		return
+	try:
+		corrupt = [int(index) for index in filter(None, message.get("CORRUPT", "").split(","))]
+	except ValueError:
+		corrupt = []
+	transfer.on_sack(base, message.get("BITMAP", "0"), corrupt=corrupt)
+
+@registry.register("FILE_RECEIVED", required_fields=("FILEID",))
+def handle_file_received(message, addr, peer_manager):
+	transfer = peer_manager.outgoing_transfers.get(message["FILEID"])
+	if message.get("STATUS") == "CORRUPT":
+		peer_manager.logger.log("FILE", f"{message.get('FROM')} discarded file {message['FILEID']}: SHA-256 mismatch")
+		if transfer:
+			transfer.cancel("receiver's SHA-256 did not match")
+	elif transfer:
+		transfer.mark_complete()
+	peer_manager.remove_pending_file(message["FILEID"])
+
+# ===== RESUME =====
+
+# FILE_RESUME lists the chunk ranges a receiver already has as "first-last,first-last"
+def format_ranges(ranges, limit):
+	parts = []
+	for first, last in ranges:
+		if len(parts) >= limit:
+			break # anything not listed is simply re-sent
+		parts.append(f"{first}-{last}")
+	return ",".join(parts)
+
+def parse_ranges(text):
+	ranges = []
+	for part in filter(None, text.split(",")):
+		first, last = part.split("-")
+		ranges.append((int(first), int(last)))
+	return ranges
+
+# part-file manifests in a directory that can be resumed
+def find_resumable(directory="."):
+	resumable = []
+	for path in sorted(glob.glob(os.path.join(directory, "*.part.json"))):
+		try:
+			with open(path) as f:
+				manifest = json.load(f)
+		except (OSError, ValueError):
+			continue
+		manifest["manifest_path"] = path
+		resumable.append(manifest)
+	return resumable
+
+# receiver: reopen a transfer from its manifest and ask the sender for the missing chunks
+def resume_incoming(peer_manager, manifest_path):
+	transfer = IncomingTransfer.from_manifest(manifest_path)
+	context = peer_manager.file_transfer_context[transfer.file_id] = {
+		"accepted": True,
+		"from": transfer.sender_id,
+		"filename": transfer.filename,
+		"filesize": transfer.filesize,
+		"token": None, # taken from the first resumed chunk
+		"total_chunks": transfer.total_chunks,
+		"transfer": transfer,
+	}
+	resume_msg = {
+		"TYPE": "FILE_RESUME",
+		"FROM": peer_manager.get_own_profile()["USER_ID"],
+		"TO": transfer.sender_id,
+		"FILEID": transfer.file_id,
+		"RANGES": format_ranges(transfer.received.ranges(), config.FILE_RESUME_MAX_RANGES),
+		"TIMESTAMP": int(time.time())
+	}
+	if transfer.binary:
+		resume_msg["BINARY"] = "YES" # the part file is laid out in binary-sized chunks
+	send_message(resume_msg, (transfer.sender_id.split("@")[1], config.PORT))
+	peer_manager.logger.log_send("FILE_RESUME", transfer.sender_id, resume_msg)
+	return context
+
+# sender: only the receiver the file was offered to can resume it. the original token
+# may have expired in the meantime, in which case a fresh one is issued
+@registry.register("FILE_RESUME", required_fields=("FROM", "FILEID"), token_required=False)
+def handle_file_resume(message, addr, peer_manager):
+	file_id = message["FILEID"]
+	pending = peer_manager.get_pending_file(file_id)
+	own_profile = peer_manager.get_own_profile()
+	if not pending or not own_profile:
+		return
+	if pending.get("receiver") != message["FROM"] or message["FROM"].split("@")[1] != addr:
+		peer_manager.logger.log_drop(f"FILE_RESUME for {file_id} from someone it was not offered to")
+		return
+	filepath = pending["filepath"]
+	if not os.path.isfile(filepath) or os.path.getsize(filepath) != pending.get("filesize", os.path.getsize(filepath)):
+		peer_manager.logger.log_drop(f"FILE_RESUME for {file_id}: {filepath} is gone or has changed")
+		return
+	try:
+		received_ranges = parse_ranges(message.get("RANGES", ""))
+	except ValueError:
+		peer_manager.logger.log_drop("Malformed FILE_RESUME message.")
+		return
+
+	token = pending["token"]
+	if not validate_token(token, "file", peer_manager.revoked_tokens)[0]:
+		token = f"{own_profile['USER_ID']}|{int(time.time()) + config.TTL}|file"
+		peer_manager.add_pending_file(file_id, filepath, token, message["FROM"], pending.get("chunk_size"),
+									pending.get("binary_chunk_size"))
+	binary = message.get("BINARY") == "YES" and bool(pending.get("binary_chunk_size"))
+	chunk_size = pending.get("binary_chunk_size") if binary else pending.get("chunk_size")
+	peer_manager.logger.log("FILE", f"Resuming {os.path.basename(filepath)} for {message['FROM']}")
+	start_outgoing_transfer(peer_manager, file_id, filepath, message["FROM"], token, windowed=True,
+							received_ranges=received_ranges, chunk_size=chunk_size, binary=binary)
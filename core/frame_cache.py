@@ -0,0 +1,46 @@
+import threading
+from parser.message_parser import encode_message
+
+# encoded frames for messages that are sent again and again (the periodic PING, the own
+# PROFILE). each frame is stored with the version of the data it was built from and rebuilt
+# only when the caller asks with a different version, e.g. after a profile update.
+# one-off messages that go to several recipients or may be retransmitted are encoded once
+# with encode_message() and the bytes are reused instead
+class FrameCache:
+	def __init__(self):
+		self.frames = {} # key -> (version, frame)
+		self.lock = threading.Lock()
+		self.stats = {"hits": 0, "builds": 0, "invalidated": 0}
+
+	# the frame for key at version; build() returns the message dict, or None if there is
+	# nothing to send (not cached, so it is asked again next time)
+	def get(self, key, version, build):
+		with self.lock:
+			cached = self.frames.get(key)
+			if cached is not None and cached[0] == version:
+				self.stats["hits"] += 1
+				return cached[1]
+		message = build()
+		if message is None:
+			return None
+		frame = encode_message(message)
+		with self.lock:
+			self.frames[key] = (version, frame)
+			self.stats["builds"] += 1
+		return frame
+
+	# forget one frame, or all of them
+	def invalidate(self, key=None):
+		with self.lock:
+			dropped = len(self.frames) if key is None else int(key in self.frames)
+			if key is None:
+				self.frames.clear()
+			else:
+				self.frames.pop(key, None)
+			self.stats["invalidated"] += dropped
+
+	def get_stats(self):
+		with self.lock:
+			stats = dict(self.stats)
+			stats["cached"] = len(self.frames)
+		return stats
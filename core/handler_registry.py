@@ -0,0 +1,111 @@
+import threading
+import bisect
+from utils.network_utils import validate_token
+
+# upper bounds (seconds) of the per-type handler latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS = (0.0001, 0.001, 0.01, 0.1, 1.0)
+
+# one LSNP message type: the function that handles it plus what dispatch() checks before calling it
+class MessageHandler:
+	def __init__(self, msg_type, func, required_fields=(), token_scope=None, token_required=True, addressed=False, needs_ack=False, dedup=True,
+				accept=None, log_recv=True):
+		self.msg_type = msg_type
+		self.func = func
+		self.required_fields = tuple(required_fields)
+		self.token_scope = token_scope # validate TOKEN against this scope (None = no token check)
+		self.token_required = token_required # False = only validate TOKEN when one is present
+		self.addressed = addressed # drop unless TO is our own USER_ID
+		self.needs_ack = needs_ack # reply with an ACK for MESSAGE_ID once the message is accepted
+		self.dedup = dedup # skip the handler for a MESSAGE_ID that was already handled
+		self.accept = accept # accept(message, peer_manager) -> False to ignore the message before any other check
+		self.log_recv = log_recv # log the message once it passes the checks (False = the handler logs it itself)
+
+	# returns None if the message may be handled, otherwise the reason to drop it.
+	# TO and TOKEN are checked before the other fields are touched, so a lazily parsed
+	# message that is not for us or not authorised is dropped without decoding them
+	def check(self, message, peer_manager):
+		if self.addressed:
+			own_profile = peer_manager.own_profile
+			my_user_id = own_profile.get("USER_ID") if own_profile else None
+			to_user = message.get("TO")
+			if to_user != my_user_id:
+				return f"Ignored {self.msg_type} not addressed to me: {to_user}"
+
+		if self.token_scope:
+			token = message.get("TOKEN")
+			if token or self.token_required:
+				is_valid, error = validate_token(token or "", self.token_scope, peer_manager.revoked_tokens)
+				if not is_valid:
+					return f"Invalid {self.msg_type} token: {error}"
+
+		for field in self.required_fields:
+			if not message.get(field):
+				return f"Malformed {self.msg_type} message."
+		return None
+
+# per-type counters and a latency histogram for every dispatched message
+class HandlerStats:
+	__slots__ = ("received", "handled", "dropped", "duplicates", "errors", "total_time", "max_time", "histogram")
+
+	def __init__(self):
+		self.received = 0
+		self.handled = 0
+		self.dropped = 0
+		self.duplicates = 0
+		self.errors = 0
+		self.total_time = 0.0
+		self.max_time = 0.0
+		self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+	def as_dict(self):
+		return {
+			"received": self.received,
+			"handled": self.handled,
+			"dropped": self.dropped,
+			"duplicates": self.duplicates,
+			"errors": self.errors,
+			"avg_time": self.total_time / self.received if self.received else 0.0,
+			"max_time": self.max_time,
+			"histogram": list(self.histogram),
+		}
+
+# maps TYPE -> MessageHandler. Lookup is a single dict access, so frequent types such as
+# FILE_CHUNK and ACK cost the same as any other. Modules can plug in new message types with
+# @registry.register(...) without touching dispatch()
+class HandlerRegistry:
+	def __init__(self):
+		self.handlers = {}
+		self.stats = {}
+		self.lock = threading.Lock()
+
+	def register(self, msg_type, required_fields=(), token_scope=None, token_required=True, addressed=False, needs_ack=False, dedup=True,
+				accept=None, log_recv=True):
+		def decorator(func):
+			self.add(MessageHandler(msg_type, func, required_fields, token_scope, token_required, addressed, needs_ack, dedup, accept, log_recv))
+			return func
+		return decorator
+
+	def add(self, handler):
+		self.handlers[handler.msg_type] = handler
+
+	def get(self, msg_type):
+		return self.handlers.get(msg_type)
+
+	# outcome is one of "handled", "dropped", "duplicates" or "errors"
+	def record(self, msg_type, outcome, elapsed):
+		with self.lock:
+			stats = self.stats.get(msg_type)
+			if stats is None:
+				stats = self.stats[msg_type] = HandlerStats()
+			stats.received += 1
+			setattr(stats, outcome, getattr(stats, outcome) + 1)
+			stats.total_time += elapsed
+			stats.max_time = max(stats.max_time, elapsed)
+			stats.histogram[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+
+	def get_stats(self):
+		with self.lock:
+			return {msg_type: stats.as_dict() for msg_type, stats in self.stats.items()}
+
+# default registry used by dispatch()
+registry = HandlerRegistry()
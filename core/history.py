@@ -0,0 +1,202 @@
+import bisect
+import json
+import os
+import re
+import threading
+import time
+from array import array
+from collections import deque
+
+# a record as the list of its fields, in __slots__ order
+def _row(record):
+	return [getattr(record, name) for name in record.__slots__]
+
+# append-only JSON-lines log of records spilled out of a BoundedHistory, one
+# [field, ...] row per line in the record's __slots__ order. byte offsets of the lines are
+# kept in an array (8 bytes per record) so any page can be read with one seek per record.
+# with expires_at, records past their expiry are left out of that index: the log is
+# rescanned whenever the earliest expiry in it has passed (on first use as well, so a
+# restart does not bring back records that expired while it was down)
+class HistoryLog:
+	def __init__(self, path, record_type, expires_at=None):
+		self.path = path
+		self.record_type = record_type
+		self.expires_at = expires_at # record -> epoch seconds or None
+		self.offsets = None # array of offsets of the live lines, loaded on first use
+		self.size = 0 # bytes in the file
+		self.next_expiry = None # earliest expiry among the live lines (None = none expires)
+		self.expired = 0 # lines dropped by rescans since the last expire()
+
+	def _load(self):
+		if self.offsets is None or (self.next_expiry is not None and self.next_expiry <= time.time()):
+			self._scan()
+
+	def _scan(self):
+		offsets = array("Q")
+		offset = 0
+		next_expiry = None
+		now = time.time()
+		if os.path.exists(self.path):
+			with open(self.path, "rb") as f:
+				for line in f:
+					expires_at = self.expires_at(self.record_type(*json.loads(line))) if self.expires_at else None
+					if expires_at is None or expires_at > now:
+						offsets.append(offset)
+						if expires_at is not None and (next_expiry is None or expires_at < next_expiry):
+							next_expiry = expires_at
+					offset += len(line)
+		if self.offsets is not None:
+			self.expired += len(self.offsets) - len(offsets)
+		self.offsets = offsets
+		self.size = offset
+		self.next_expiry = next_expiry
+
+	def __len__(self):
+		self._load()
+		return len(self.offsets)
+
+	# bytes in the file, for truncate()
+	def end(self):
+		self._load()
+		return self.size
+
+	def extend(self, records):
+		if self.offsets is None:
+			self._scan()
+		os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+		with open(self.path, "ab") as f:
+			offset = f.tell()
+			for record in records:
+				line = json.dumps(_row(record)).encode("utf-8") + b"\n"
+				f.write(line)
+				self.offsets.append(offset)
+				offset += len(line)
+				expires_at = self.expires_at(record) if self.expires_at else None
+				if expires_at is not None and (self.next_expiry is None or expires_at < self.next_expiry):
+					self.next_expiry = expires_at
+		self.size = offset
+
+	# drop the records that have expired by now; returns how many were dropped since the last
+	# call (reads may have rescanned first). the first scan leaves expired ones out uncounted
+	def expire(self):
+		if self.offsets is None:
+			return 0
+		self._load()
+		expired, self.expired = self.expired, 0
+		return expired
+
+	# cut the file back to its first `size` bytes (an earlier end())
+	def truncate(self, size):
+		self._load()
+		if size < self.size:
+			with open(self.path, "r+b") as f:
+				f.truncate(size)
+			del self.offsets[bisect.bisect_left(self.offsets, size):]
+			self.size = size
+
+	# records start .. end - 1, oldest first
+	def read(self, start, end):
+		self._load()
+		records = []
+		if start >= end:
+			return records
+		with open(self.path, "rb") as f:
+			for offset in self.offsets[start:end]:
+				f.seek(offset)
+				records.append(self.record_type(*json.loads(f.readline())))
+		return records
+
+# the newest `capacity` records of one history (a peer's posts or DMs, a group's messages)
+# in a deque. when it overflows, the oldest records are dropped, or, with a log, spilled to
+# it a quarter of the capacity at a time; page() reads across the log and memory.
+# other threads append while the expiry engine removes, so both go through one lock.
+# on_drop(records, spilled) is told about every record that leaves memory this way
+class BoundedHistory:
+	def __init__(self, capacity, log=None):
+		self.capacity = max(1, capacity)
+		self.log = log
+		self.items = deque()
+		self.lock = threading.Lock()
+		self.spilled = 0 # records moved to the log by this history
+		self.on_drop = None # on_drop(records, spilled), called outside the lock
+
+	def append(self, record):
+		dropped = None
+		with self.lock:
+			self.items.append(record)
+			if len(self.items) > self.capacity:
+				dropped = self._overflow()
+		if dropped and self.on_drop is not None:
+			self.on_drop(dropped, self.log is not None)
+
+	# returns the records that left memory
+	def _overflow(self):
+		if self.log is None:
+			return [self.items.popleft()]
+		batch = [self.items.popleft() for _ in range(max(1, self.capacity // 4))]
+		self.log.extend(batch)
+		self.spilled += len(batch)
+		return batch
+
+	# remove these expired records (by identity); returns how many were removed. the ones
+	# not in memory were spilled, so the log drops whatever has expired
+	def discard(self, records):
+		targets = set(map(id, records))
+		with self.lock:
+			kept = [record for record in self.items if id(record) not in targets]
+			removed = len(self.items) - len(kept)
+			if removed:
+				self.items = deque(kept)
+			if self.log is not None and removed < len(targets):
+				removed += self.log.expire()
+		return removed
+
+	# the records in memory as rows, and how far the log went, for a state snapshot
+	def state(self):
+		with self.lock:
+			return {"items": [_row(record) for record in self.items], "logged": self.log.end() if self.log else 0}
+
+	# put back what state() returned; returns the restored records. the log is cut back to
+	# what it held at the snapshot, since replaying later changes spills them again
+	def restore(self, state, record_type):
+		records = [record_type(*row) for row in state["items"]]
+		with self.lock:
+			if self.log:
+				self.log.truncate(state["logged"])
+			self.items = deque(records)
+		return records
+
+	def __len__(self):
+		return len(self.items)
+
+	def __bool__(self):
+		return bool(self.items)
+
+	def __iter__(self):
+		with self.lock:
+			return iter(list(self.items))
+
+	# the newest n records in memory, oldest first
+	def recent(self, n):
+		with self.lock:
+			return list(self.items)[-n:] if n > 0 else []
+
+	# records including spilled ones
+	def total(self):
+		with self.lock:
+			return (len(self.log) if self.log else 0) + len(self.items)
+
+	# one page of history, oldest first within the page; page 0 is the newest `size` records
+	def page(self, page=0, size=20):
+		with self.lock:
+			logged = len(self.log) if self.log else 0
+			total = logged + len(self.items)
+			end = max(0, total - page * size)
+			start = max(0, end - size)
+			older = self.log.read(start, min(end, logged)) if start < logged else []
+			newer = list(self.items)[max(0, start - logged):end - logged] if end > logged else []
+		return older + newer
+
+# a filesystem-safe file name for a user or group id
+def history_file(directory, kind, key):
+	return os.path.join(directory, kind, re.sub(r"[^A-Za-z0-9@._-]", "_", key) + ".jsonl")
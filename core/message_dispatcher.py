@@ -1,329 +1,322 @@
-from utils.network_utils import send_message, handle_file_offer, handle_file_chunk, send_file_chunks
+import base64
+import time
+from utils.network_utils import send_message, handle_file_offer
 import config
-from utils.network_utils import validate_token
 from utils.game_utils import print_board
 from utils.game_utils import check_game_result
 from utils.game_utils import send_result_message
-
-# Routes incoming LSNP messages to appropriate PeerManager handlers based on the message type
-def dispatch(message: dict, addr: str, peer_manager):
+from core.handler_registry import registry
+from core.file_transfer import handle_file_chunk, start_outgoing_transfer
+
+# Routes incoming LSNP messages to appropriate PeerManager handlers based on the message type.
+# the handler for each TYPE is looked up in the registry, which also declares the required
+# fields, token scope and ACK behaviour that are checked here before the handler runs.
+# messages whose MESSAGE_ID was already handled are re-ACKed but not handled again; one
+# whose handler raised is forgotten and un-ACKed, so its retransmission is handled.
+# received messages are LazyMessage views, so a message dropped by these checks never has
+# the fields it was not checked on decoded; only messages that pass them are logged
+def dispatch(message, addr: str, peer_manager):
 	msg_type = message.get("TYPE")
+	handler = registry.get(msg_type)
+	start = time.perf_counter()
+	if handler is None:
+		registry.record(msg_type or "UNKNOWN", "dropped", time.perf_counter() - start)
+		peer_manager.logger.log_ignored(msg_type or "UNKNOWN", addr, "unknown TYPE")
+		return
 
-	if msg_type == "PROFILE":
-		user_id = message.get("USER_ID")
-		name = message.get("DISPLAY_NAME")
-		status = message.get("STATUS")
-		avatar_type = message.get("AVATAR_TYPE")
-		avatar_encoding = message.get("AVATAR_ENCODING")
-		avatar_data = message.get("AVATAR_DATA")
-		if user_id and name:
-			peer_manager.add_peer(user_id, name, status, avatar_type, avatar_encoding, avatar_data)
-
-	elif msg_type == "POST":
-		user_id = message.get("USER_ID")
-		content = message.get("CONTENT")
-		timestamp = message.get("TIMESTAMP")
-		# Convert timestamp to integer to ensure consistency with locally created posts
-		try:
-			timestamp = int(timestamp) if timestamp else None
-		except (ValueError, TypeError):
-			timestamp = None
-		ttl = int(message.get("TTL", 3600)) # default is 3600 per RFC
-		message_id = message.get("MESSAGE_ID")
-		token = message.get("TOKEN")
-		if user_id and content:
-			# Only store posts from users we're following
-			if peer_manager.is_following(user_id):
-				peer_manager.add_post(user_id, content, timestamp, ttl, message_id, token)
-				#peer_manager.logger.log("POST", f"Received post from {user_id}: {content[:50]}...")
-
-	elif msg_type == "LIKE":
-		from_user = message.get("FROM")
-		to_user = message.get("TO")
-		post_timestamp = message.get("POST_TIMESTAMP")
-		# Convert post_timestamp to integer to ensure consistency
-		try:
-			post_timestamp = int(post_timestamp) if post_timestamp else None
-		except (ValueError, TypeError):
-			post_timestamp = None
-		action = message.get("ACTION")
-		timestamp = message.get("TIMESTAMP")
-		token = message.get("TOKEN")
-
-		# Validate input fields
-		if not (from_user and to_user and post_timestamp and action and timestamp and token):
-			peer_manager.logger.log_drop("Malformed LIKE message.")
-			return
-
-		# Check if this message is intended for the user
-		my_user_id = peer_manager.own_profile.get("USER_ID")
-		if to_user != my_user_id:
-			peer_manager.logger.log_drop(f"Ignored LIKE not addressed to me: {to_user}")
+	outcome = "handled"
+	try:
+		# messages the handler would ignore anyway (not an error, so only noted in verbose mode)
+		if handler.accept and not handler.accept(message, peer_manager):
+			peer_manager.logger.log_ignored(msg_type, addr, "ignored by its handler")
+			outcome = "dropped"
 			return
 
-		# Validate token
-		is_valid, error = validate_token(token, "broadcast", peer_manager.revoked_tokens)
-		if not is_valid:
-			peer_manager.logger.log_drop(f"Invalid LIKE token: {error}")
+		reason = handler.check(message, peer_manager)
+		if reason:
+			peer_manager.logger.log_drop(reason)
+			outcome = "dropped"
 			return
 
-		# Find the post being liked/unliked
-		post_content = ""
-		if hasattr(peer_manager, 'own_posts') and peer_manager.own_posts:
-			for post in peer_manager.own_posts:
-				if post.get('timestamp') == post_timestamp:
-					post_content = post.get('content', '')
-					break
-		
-		# Handle the like/unlike
-		peer_manager.handle_like_received(from_user, post_timestamp, action, post_content)
-		peer_manager.logger.log_recv("LIKE", addr, message, peer_manager)
-
-	elif msg_type == "DM":
-		from_user = message.get("FROM")
-		to_user = message.get("TO")
-		timestamp = message.get("TIMESTAMP")
-		# Convert timestamp to integer to ensure consistency
-		try:
-			timestamp = int(timestamp) if timestamp else None
-		except (ValueError, TypeError):
-			timestamp = None
-		content = message.get("CONTENT")
+		# a retransmission of something already handled only needs a (re-)ACK. the MESSAGE_ID
+		# is claimed before the handler runs, so a copy arriving meanwhile is not handled twice
 		message_id = message.get("MESSAGE_ID")
-		token = message.get("TOKEN")
-
-		# validate input fields
-		if not (from_user and to_user and content and message_id and timestamp and token):
-			peer_manager.logger.log_drop("Malformed DM message.")
-			return
-
-		# makes sure this message is intended for the user
-		my_user_id = peer_manager.own_profile.get("USER_ID")
-		if to_user != my_user_id:
-			peer_manager.logger.log_drop(f"Ignored DM not addressed to me: {to_user}")
+		seen_key = f"{msg_type}:{message_id}" if handler.dedup and message_id else None
+		if seen_key and peer_manager.seen_messages.check_and_add(seen_key):
+			if handler.needs_ack:
+				send_ack(message_id, addr)
+			outcome = "duplicates"
 			return
 
-		# store the DM
-		peer_manager.add_dm(from_user, content, timestamp, message_id, token)
-		# peer_manager.logger.log("DM", f"Received DM from {from_user}: {content[:50]}...")
-
-		# send an ACK back to the sender
-		if message_id:
-			ack_msg = {
-				"TYPE": "ACK",
-				"MESSAGE_ID": message_id,
-				"STATUS": "RECEIVED"
-			}
-			send_message(ack_msg, (addr, config.PORT))
-
-	elif msg_type == "PING":
-		user_id = message.get("USER_ID")
-		# if peer_manager.logger.verbose:
-		# 	print(f"[PING] Received ping from {user_id}")
-
-		# resgister peer if not already known (optional)
-		# if user_id and user_id not in peer_manager.peers:
-		# 		peer_manager.add_peer(user_id, user_id, "", None, None)
-
-	elif msg_type == "ACK":
-		message_id = message.get("MESSAGE_ID")
-		status = message.get("STATUS")
+		if handler.log_recv:
+			peer_manager.logger.log_recv(msg_type, addr, message, peer_manager)
+		try:
+			handler.func(message, addr, peer_manager)
+		except Exception:
+			if seen_key:
+				peer_manager.seen_messages.discard(seen_key) # not handled: let a retransmission try again
+			raise
+
+		# ACK only once the message is handled, so the sender keeps retransmitting until it is
+		if handler.needs_ack and message_id:
+			send_ack(message_id, addr)
+	except Exception:
+		outcome = "errors"
+		raise
+	finally:
+		registry.record(msg_type, outcome, time.perf_counter() - start)
+
+def send_ack(message_id, addr):
+	ack_msg = {
+		"TYPE": "ACK",
+		"MESSAGE_ID": message_id,
+		"STATUS": "RECEIVED"
+	}
+	send_message(ack_msg, (addr, config.PORT))
+
+@registry.register("PROFILE", required_fields=("USER_ID", "DISPLAY_NAME"))
+def handle_profile(message, addr, peer_manager):
+	user_id = message.get("USER_ID")
+	name = message.get("DISPLAY_NAME")
+	status = message.get("STATUS")
+	avatar_type = message.get("AVATAR_TYPE")
+	avatar_encoding = message.get("AVATAR_ENCODING")
+	avatar_data = message.get("AVATAR_DATA")
+	if message.get("BINARY") == "AVATAR_DATA": # binary frame: stored base64 like text profiles
+		avatar_data = base64.b64encode(avatar_data).decode()
+		avatar_encoding = "base64"
+	elif isinstance(avatar_data, memoryview): # the parser hands text fields over as memoryviews too
+		avatar_data = bytes(avatar_data).decode("utf-8")
+	peer_manager.add_peer(user_id, name, status, avatar_type, avatar_encoding, avatar_data)
+
+# posts are broadcast; only those from users we follow are kept
+@registry.register("POST", required_fields=("USER_ID", "CONTENT"),
+				accept=lambda message, peer_manager: peer_manager.is_following(message.get("USER_ID")))
+def handle_post(message, addr, peer_manager):
+	user_id = message.get("USER_ID")
+	content = message.get("CONTENT")
+	timestamp = message.get("TIMESTAMP")
+	# Convert timestamp to integer to ensure consistency with locally created posts
+	try:
+		timestamp = int(timestamp) if timestamp else None
+	except (ValueError, TypeError):
+		timestamp = None
+	ttl = min(int(message.get("TTL", 3600)), config.MAX_TTL) # default is 3600 per RFC
+	message_id = message.get("MESSAGE_ID")
+	token = message.get("TOKEN")
+	peer_manager.add_post(user_id, content, timestamp, ttl, message_id, token)
+	#peer_manager.logger.log("POST", f"Received post from {user_id}: {content[:50]}...")
+
+@registry.register("LIKE", required_fields=("FROM", "TO", "POST_TIMESTAMP", "ACTION", "TIMESTAMP", "TOKEN"), token_scope="broadcast", addressed=True, log_recv=False)
+def handle_like(message, addr, peer_manager):
+	from_user = message.get("FROM")
+	post_timestamp = message.get("POST_TIMESTAMP")
+	# Convert post_timestamp to integer to ensure consistency
+	try:
+		post_timestamp = int(post_timestamp) if post_timestamp else None
+	except (ValueError, TypeError):
+		post_timestamp = None
+	if not post_timestamp:
+		peer_manager.logger.log_drop("Malformed LIKE message.")
+		return
+	action = message.get("ACTION")
+
+	# Find the post being liked/unliked
+	post_content = ""
+	if hasattr(peer_manager, 'own_posts') and peer_manager.own_posts:
+		for post in peer_manager.own_posts:
+			if post.timestamp == post_timestamp:
+				post_content = post.content
+				break
+
+	# Handle the like/unlike
+	peer_manager.handle_like_received(from_user, post_timestamp, action, post_content)
+	peer_manager.logger.log_recv("LIKE", addr, message, peer_manager)
+
+@registry.register("DM", required_fields=("FROM", "TO", "CONTENT", "MESSAGE_ID", "TIMESTAMP", "TOKEN"), addressed=True, needs_ack=True)
+def handle_dm(message, addr, peer_manager):
+	from_user = message.get("FROM")
+	timestamp = message.get("TIMESTAMP")
+	# Convert timestamp to integer to ensure consistency
+	try:
+		timestamp = int(timestamp) if timestamp else None
+	except (ValueError, TypeError):
+		timestamp = None
+	content = message.get("CONTENT")
+	message_id = message.get("MESSAGE_ID")
+	token = message.get("TOKEN")
+
+	# store the DM
+	peer_manager.add_dm(from_user, content, timestamp, message_id, token)
+	# peer_manager.logger.log("DM", f"Received DM from {from_user}: {content[:50]}...")
+
+@registry.register("PING")
+def handle_ping(message, addr, peer_manager):
+	user_id = message.get("USER_ID")
+	# if peer_manager.logger.verbose:
+	# 	print(f"[PING] Received ping from {user_id}")
+
+	# resgister peer if not already known (optional)
+	# if user_id and user_id not in peer_manager.peers:
+	# 		peer_manager.add_peer(user_id, user_id, "", None, None)
+
+@registry.register("ACK", required_fields=("MESSAGE_ID",), dedup=False)
+def handle_ack(message, addr, peer_manager):
+	message_id = message.get("MESSAGE_ID")
+	status = message.get("STATUS")
+
+	peer_manager.ack_received(message_id)
+	#peer_manager.logger.log("ACK", f"ACK received for {message_id}: {status}")
+
+@registry.register("FOLLOW", required_fields=("FROM", "TO"))
+def handle_follow(message, addr, peer_manager):
+	message_id = message.get("MESSAGE_ID")
+	from_user = message.get("FROM")
+	to_user = message.get("TO")
+	timestamp = message.get("TIMESTAMP")
+	token = message.get("TOKEN")
+
+	peer_manager.add_follower(to_user, from_user, token, timestamp, message_id)
+	# peer_manager.logger.log("FOLLOW", f"{from_user} is now following {to_user}")
+
+@registry.register("UNFOLLOW")
+def handle_unfollow(message, addr, peer_manager):
+	from_user = message.get("FROM")
+	to_user = message.get("TO")
+	message_id = message.get("MESSAGE_ID")
+	timestamp = message.get("TIMESTAMP")
+	token = message.get("TOKEN")
+
+	peer_manager.remove_follower(to_user, from_user, token, timestamp, message_id)
+
+	# Only show unfollow notification in non-verbose mode
+	# if not peer_manager.logger.verbose:
+	# 	print(f"User {from_user} has unfollowed you")
+
+@registry.register("REVOKE", required_fields=("TOKEN",))
+def handle_revoke(message, addr, peer_manager):
+	token = message.get("TOKEN")
+	peer_manager.revoke_token(token)
+	peer_manager.logger.log("REVOKE", f"Token revoked: {token}")
+
+@registry.register("TICTACTOE_INVITE", required_fields=("GAMEID", "FROM"), token_scope="game", needs_ack=True)
+def handle_tictactoe_invite(message, addr, peer_manager):
+	token = message.get("TOKEN")
+	game_id = message.get("GAMEID")
+	from_user = message.get("FROM")
+	if game_id in peer_manager.games:
+		peer_manager.logger.log("TICTACTOE_INVITE", f"Duplicate game invite for GAMEID {game_id} ignored.")
+		return
 
-		if message_id in peer_manager.pending_acks:
-			del peer_manager.pending_acks[message_id]
-			#peer_manager.logger.log("ACK", f"ACK received for {message_id}: {status}")
+	sender_symbol = message.get("SYMBOL", "X")  # Default to X if missing
+	my_symbol = "O" if sender_symbol == "X" else "X"
+
+	peer_manager.create_game(game_id, from_user, is_initiator=False, token=token, my_symbol=my_symbol, opponent_symbol=sender_symbol)
+	# peer_manager.logger.log("TICTACTOE_INVITE", addr, message)
+	print(f"New Tic Tac Toe game started with {from_user}.")
+	print_board(peer_manager.games[game_id]["board"])
+
+@registry.register("TICTACTOE_MOVE", required_fields=("GAMEID", "TURN", "POSITION"), needs_ack=True)
+def handle_tictactoe_move(message, addr, peer_manager):
+	game_id = message.get("GAMEID")
+	turn = int(message.get("TURN"))
+	pos = int(message.get("POSITION"))
+	symbol = message.get("SYMBOL")
+	from_user = message.get("FROM")
+
+	game = peer_manager.games.get(game_id)
+	if not game:
+		peer_manager.logger.log_drop(f"TICTACTOE_MOVE from {addr}: Unknown GAMEID {game_id}")
+		return
 
-	elif msg_type == "FOLLOW":
-		message_id = message.get("MESSAGE_ID")
-		from_user = message.get("FROM")
-		to_user = message.get("TO")
-		timestamp = message.get("TIMESTAMP")
-		token = message.get("TOKEN")
-
-		if from_user and to_user:
-			peer_manager.add_follower(to_user, from_user, token, timestamp, message_id)
-			# peer_manager.logger.log("FOLLOW", f"{from_user} is now following {to_user}")
-
-	elif msg_type == "UNFOLLOW":
-		from_user = message.get("FROM")
-		to_user = message.get("TO")
-		message_id = message.get("MESSAGE_ID")
-		timestamp = message.get("TIMESTAMP")
-		token = message.get("TOKEN")
+	if turn != game["turn"]:
+		peer_manager.logger.log_drop(f"TICTACTOE_MOVE from {addr}: Unexpected TURN: got {turn}, expected {game['turn']}")
+		return
 
-		peer_manager.remove_follower(to_user, from_user, token, timestamp, message_id)
+	if pos < 0 or pos > 8:
+		peer_manager.logger.log_drop(f"TICTACTOE_MOVE from {addr}: Invalid position: out of range")
+		return
 
-		# Only show unfollow notification in non-verbose mode
-		# if not peer_manager.logger.verbose:
-		# 	print(f"User {from_user} has unfollowed you")
+	if game["board"][pos] != " ":
+		peer_manager.logger.log_drop(f"TICTACTOE_MOVE from {addr}: Invalid move: position already taken")
+		return
 
-	elif msg_type == "REVOKE":
-		token = message.get("TOKEN")
+	success = peer_manager.apply_move(game_id, pos, is_self=False, symbol=symbol)
+	if success:
+		# peer_manager.logger.log("TICTACTOE_MOVE", addr, message)
+		print_board(game["board"])
+
+		# check win/draw?
+		# result, winning_line = check_game_result(game["board"])
+		# if result:
+		# 	send_result_message(game_id, result, from_user, peer_manager.get_own_profile().get("USER_ID"), symbol, winning_line)
+	else:
+		peer_manager.logger.log_drop(f"TICTACTOE_MOVE from {addr}: Failed to apply move")
+
+@registry.register("TICTACTOE_RESULT", required_fields=("GAMEID",))
+def handle_tictactoe_result(message, addr, peer_manager):
+	game_id = message.get("GAMEID")
+	result = message.get("RESULT")
+	winner = message.get("WINNER")
+	winning_symbol = message.get("SYMBOL")
+	winning_line = message.get("WINNING_LINE")
+
+	game = peer_manager.end_game(game_id)
+	if game:
+		token = game.get("token")
 		if token:
-			peer_manager.revoked_tokens.add(token)
-			peer_manager.logger.log("REVOKE", f"Token revoked: {token}")
+			peer_manager.revoke_token(token)
+	if not game:
+		peer_manager.logger.log_drop(f"TICTACTOE_RESULT from {addr}: No active game with GAMEID {game_id}")
 		return
-	
-	elif msg_type == "TICTACTOE_INVITE":
-		token = message.get("TOKEN")
-		valid, reason = validate_token(token, "game", peer_manager.revoked_tokens)
-		if not valid:
-			peer_manager.logger.log_drop("TICTACTOE_INVITE", addr, reason)
-			return
-
-		game_id = message.get("GAMEID")
-		from_user = message.get("FROM")
-		if game_id in peer_manager.games:
-			peer_manager.logger.log_info(f"Duplicate game invite for GAMEID {game_id} ignored.")
-			return
-		
-		sender_symbol = message.get("SYMBOL", "X")  # Default to X if missing
-		my_symbol = "O" if sender_symbol == "X" else "X"
-
-		message_id = message.get("MESSAGE_ID")
-		if message_id:
-			ack_msg = {
-				"TYPE": "ACK",
-				"MESSAGE_ID": message_id,
-				"STATUS": "RECEIVED"
-			}
-			send_message(ack_msg, (addr, config.PORT))
-
-		peer_manager.create_game(game_id, from_user, is_initiator=False, token=token, my_symbol=my_symbol, opponent_symbol=sender_symbol)
-		# peer_manager.logger.log("TICTACTOE_INVITE", addr, message)
-		print(f"New Tic Tac Toe game started with {from_user}.")
-		print_board(peer_manager.games[game_id]["board"])
-
-	elif msg_type == "TICTACTOE_MOVE":
-		game_id = message.get("GAMEID")
-		turn = int(message.get("TURN"))
-		pos = int(message.get("POSITION"))
-		symbol = message.get("SYMBOL")
-		from_user = message.get("FROM")
-
-		message_id = message.get("MESSAGE_ID")
-		if message_id:
-			ack_msg = {
-				"TYPE": "ACK",
-				"MESSAGE_ID": message_id,
-				"STATUS": "RECEIVED"
-			}
-			send_message(ack_msg, (addr, config.PORT))
-
-		game = peer_manager.games.get(game_id)
-		if not game:
-			peer_manager.logger.log_drop("TICTACTOE_MOVE", addr, f"Unknown GAMEID {game_id}")
-			return
-
-		if turn != game["turn"]:
-			peer_manager.logger.log_drop("TICTACTOE_MOVE", addr, f"Unexpected TURN: got {turn}, expected {game['turn']}")
-			return
-
-		if pos < 0 or pos > 8:
-			peer_manager.logger.log_drop("TICTACTOE_MOVE", addr, "Invalid position: out of range")
-			return
-		
-		if game["board"][pos] != " ":
-			peer_manager.logger.log_drop("TICTACTOE_MOVE", addr, "Invalid move: position already taken")
-			return
-
-		success = peer_manager.apply_move(game_id, pos, is_self=False, symbol=symbol)
-		if success:
-			# peer_manager.logger.log("TICTACTOE_MOVE", addr, message)
-			print_board(game["board"])
-			
-			# check win/draw?
-			# result, winning_line = check_game_result(game["board"])
-			# if result:
-			# 	send_result_message(game_id, result, from_user, peer_manager.get_own_profile().get("USER_ID"), symbol, winning_line)
-		else:
-			peer_manager.logger.log_drop("TICTACTOE_MOVE", addr, "Failed to apply move")
-
-	elif msg_type == "TICTACTOE_RESULT":
-		game_id = message.get("GAMEID")
-		result = message.get("RESULT")
-		winner = message.get("WINNER")
-		winning_symbol = message.get("SYMBOL")
-		winning_line = message.get("WINNING_LINE")
-
-		game = peer_manager.games.pop(game_id, None)
-		if game:
-			token = game.get("token")
-			if token:
-				peer_manager.revoked_tokens.add(token)
-		if not game:
-			peer_manager.logger.log_drop("TICTACTOE_RESULT", addr, f"No active game with GAMEID {game_id}")
-			return
 
-		# peer_manager.logger.log("TICTACTOE_RESULT", addr, message)
+	# peer_manager.logger.log("TICTACTOE_RESULT", addr, message)
 
-		if result == "DRAW":
-			print(f"Game {game_id} ended in a draw.")
+	if result == "DRAW":
+		print(f"Game {game_id} ended in a draw.")
+	else:
+		# Figure out if you won based on the symbol
+		own_symbol = game.get("symbol")  # You should store this during invite/accept phase
+		if winning_symbol == own_symbol:
+			print(f"You won game {game_id}!")
 		else:
-			# Figure out if you won based on the symbol
-			own_symbol = game.get("symbol")  # You should store this during invite/accept phase
-			if winning_symbol == own_symbol:
-				print(f"You won game {game_id}!")
-			else:
-				display_name = peer_manager.get_display_name(message.get("FROM"))
-				print(f"You lost game {game_id}. Winner: {display_name}")
-
-	# group message handle
-	elif msg_type == "GROUP_CREATE":
-		token = message.get("TOKEN")
-		if token:
-			# Validate token with group scope
-			# from utils.network_utils import validate_token
-			is_valid, error = validate_token(token, "group", peer_manager.revoked_tokens)
-			if not is_valid:
-				peer_manager.logger.log_drop(f"Invalid GROUP_CREATE token: {error}")
-				return
-		
-		if peer_manager.handle_group_create(message):
-			group_name = message.get("GROUP_NAME", "Unknown Group")
-			peer_manager.logger.log_recv("GROUP_CREATE", addr, message, peer_manager)
-
-	elif msg_type == "GROUP_UPDATE":
-		token = message.get("TOKEN")
-		if token:
-			# Validate token with group scope
-			# from utils.network_utils import validate_token
-			is_valid, error = validate_token(token, "group", peer_manager.revoked_tokens)
-			if not is_valid:
-				peer_manager.logger.log_drop(f"Invalid GROUP_UPDATE token: {error}")
-				return
-		
-		if peer_manager.handle_group_update(message):
-			group_id = message.get("GROUP_ID")
-			group = peer_manager.groups.get(group_id)
-			group_name = group["group_name"] if group else "Unknown Group"
-			peer_manager.logger.log_recv("GROUP_UPDATE", addr, message, peer_manager)
-
-	elif msg_type == "GROUP_MESSAGE":
-		token = message.get("TOKEN")
-		if token:
-			# Validate token with group scope
-			# from utils.network_utils import validate_token
-			is_valid, error = validate_token(token, "group", peer_manager.revoked_tokens)
-			if not is_valid:
-				peer_manager.logger.log_drop(f"Invalid GROUP_MESSAGE token: {error}")
-				return
-		
-		if peer_manager.handle_group_message(message):
-			peer_manager.logger.log_recv("GROUP_MESSAGE", addr, message, peer_manager)
-	
-	elif msg_type == "FILE_OFFER":
-		handle_file_offer(message, peer_manager)
-	
-	elif msg_type == "FILE_CHUNK":
-		handle_file_chunk(message, peer_manager)
-
-	elif msg_type == "FILE_ACCEPTED":
-		from_user = message["FROM"]
-		file_id = message["FILEID"]
-
-		# Retrieve saved filepath and token from somewhere (dict, etc.)
-		file_info = peer_manager.get_pending_file(file_id)
-		if file_info:
-			filepath, token = file_info["filepath"], file_info["token"]
-			send_file_chunks(file_id, filepath, from_user, token, peer_manager)
+			display_name = peer_manager.get_display_name(message.get("FROM"))
+			print(f"You lost game {game_id}. Winner: {display_name}")
+
+# group message handle (tokens are validated with group scope when present)
+@registry.register("GROUP_CREATE", token_scope="group", token_required=False, log_recv=False)
+def handle_group_create(message, addr, peer_manager):
+	if peer_manager.handle_group_create(message):
+		peer_manager.logger.log_recv("GROUP_CREATE", addr, message, peer_manager)
+
+@registry.register("GROUP_UPDATE", token_scope="group", token_required=False, log_recv=False)
+def handle_group_update(message, addr, peer_manager):
+	if peer_manager.handle_group_update(message):
+		peer_manager.logger.log_recv("GROUP_UPDATE", addr, message, peer_manager)
+
+@registry.register("GROUP_MESSAGE", token_scope="group", token_required=False, log_recv=False)
+def handle_group_message(message, addr, peer_manager):
+	if peer_manager.handle_group_message(message):
+		peer_manager.logger.log_recv("GROUP_MESSAGE", addr, message, peer_manager)
+
+@registry.register("FILE_OFFER", required_fields=("FROM", "FILEID", "FILENAME", "FILESIZE", "FILETYPE", "TOKEN"), token_scope="file")
+def handle_file_offer_message(message, addr, peer_manager):
+	handle_file_offer(message, peer_manager)
+
+@registry.register("FILE_CHUNK", required_fields=("FROM", "FILEID", "CHUNK_INDEX", "TOTAL_CHUNKS", "DATA", "TOKEN"), token_scope="file")
+def handle_file_chunk_message(message, addr, peer_manager):
+	handle_file_chunk(message, peer_manager)
+
+@registry.register("FILE_ACCEPTED", required_fields=("FROM", "FILEID"))
+def handle_file_accepted(message, addr, peer_manager):
+	from_user = message["FROM"]
+	file_id = message["FILEID"]
+
+	# Retrieve saved filepath and token from somewhere (dict, etc.)
+	file_info = peer_manager.get_pending_file(file_id)
+	if file_info:
+		filepath, token = file_info["filepath"], file_info["token"]
+		binary = message.get("BINARY") == "YES" and bool(file_info.get("binary_chunk_size"))
+		chunk_size = file_info.get("binary_chunk_size") if binary else file_info.get("chunk_size")
+		start_outgoing_transfer(peer_manager, file_id, filepath, from_user, token, windowed=message.get("SACK") == "YES",
+								chunk_size=chunk_size, binary=binary)
@@ -1,32 +1,135 @@
 from utils.network_utils import get_local_ip
 from utils.network_utils import send_message
+from parser.message_parser import encode_message
 import config
+import functools
+import gc
+import json
+import os
 import threading
 import time
-from utils.network_utils import validate_token
+from utils.network_utils import validate_token, token_expiry
+from core.dedup_cache import SeenCache
+from core.expiry import ExpiryEngine
+from core.frame_cache import FrameCache
+from core.records import Peer, Post, DM, Like, GroupMessage
+from core.history import BoundedHistory, HistoryLog, history_file
+from core.state_store import StateStore
+from core.retransmit import RetransmitScheduler
+from core.rtt import RttTracker
+from core.transfer_scheduler import TransferScheduler
 
-#  keeps track of all known peers and their data in a dictionary
+# when a post, DM or token stops being valid (epoch seconds), or None if it never does.
+# a post expires at TIMESTAMP + TTL or when its token does, whichever is first
+def _expiry_of(item):
+	if isinstance(item, str):
+		return token_expiry(item)
+	expires_at = token_expiry(item.token) if item.token else None
+	if isinstance(item, Post) and item.ttl is not None and item.timestamp is not None:
+		ends = int(item.timestamp) + int(item.ttl)
+		if expires_at is None or ends < expires_at:
+			expires_at = ends
+	return expires_at
+
+# when a post or DM is let go: at its expiry, but no later than MAX_TTL from now whatever TTL
+# or token the sender gave it. (revoked tokens are kept until they expire, or they would be
+# accepted again)
+def _retention_of(record):
+	expires_at = _expiry_of(record)
+	if expires_at is None:
+		return None
+	return min(expires_at, time.time() + config.MAX_TTL)
+
+# expiry pruner for the post / DM / group message histories
+def _prune_history(history, expired):
+	return history.discard(expired)
+
+# expiry pruner for the issued token dict and the revoked token set
+def _prune_tokens(tokens, expired):
+	removed = 0
+	for token in expired:
+		if token in tokens:
+			if isinstance(tokens, set):
+				tokens.discard(token)
+			else:
+				tokens.pop(token, None)
+			removed += 1
+	return removed
+
+# marks a PeerManager method whose changes are persisted: with a state store attached, the
+# call is made under the store's lock and then logged to its WAL (method name and arguments),
+# so recovery can replay it and a snapshot never holds a change whose record comes after it.
+# persisted methods must not call each other
+def _persisted(method):
+	name = method.__name__
+	@functools.wraps(method)
+	def logged(self, *args, **kwargs):
+		store = self.store
+		if store is None:
+			return method(self, *args, **kwargs)
+		with store.lock:
+			result = method(self, *args, **kwargs)
+			store.append_locked(name, args, kwargs)
+		return result
+	return logged
+
+#  keeps track of all known peers and their data in a dictionary.
+# the listener (dispatch workers), the ACK watcher, the expiry thread and the shell all use
+# one PeerManager, so each shared collection has its own lock: anything that iterates it or
+# checks then changes it holds that lock, and readers get copies taken under it rather than
+# the live collection. single lookups and inserts (peers.get, is_following, the token dicts)
+# are atomic and take no lock. histories lock themselves (BoundedHistory).
+# with a state store attached, a persisted change takes the store's lock before any of these
 class PeerManager:
 	def __init__(self, logger):
 		self.profile_updated = False # flag to indicate if the profile was updated
 		self.profile_created = False # flag to indicate if the profile was created
 		self.logger = logger
-		self.peers = {} # stores disctionary of peers by USER_ID
-						# user_id -> {display_name, status, posts: [], dms: []}
+		self.peers = {} # USER_ID -> Peer record (display_name, status, avatar, posts, dms, likes)
+		self.peers_lock = threading.Lock()
 		self.own_profile = None
-		self.own_posts = [] # track our own posts for like reference
+		self.profile_version = 0 # bumped on every profile change; frames built from the profile are keyed on it
+		self.frames = FrameCache() # encoded PING / PROFILE frames
+		self.own_posts = BoundedHistory(config.HISTORY_PEER_POSTS) # Post records of our own posts, for like reference
+		self.received_likes = [] # Like records on our posts
+		self.likes_lock = threading.Lock() # received_likes and every peer's likes
 		self.following = set()
-		self.pending_acks = {}  # KEY: MESSAGE_ID, VALUE: {message, addr, timestamp, attempts}
-		self.followers = [] # composed of user_id of followers
-		self.revoked_tokens = set()
-		self.issued_tokens = [] # token is added everytime the user sends a message with a token
+		self.pending_acks = {}  # KEY: MESSAGE_ID, VALUE: {message, frame, addr, timestamp, attempts}
+		self.acks_lock = threading.Lock()
+		self.followers = {} # follower user_id -> IP, in the order they followed
+		self.follower_ips = {} # IP -> follower user_id (one follower per IP)
+		self.followers_lock = threading.Lock() # followers and follower_ips
+		self.user_ips = {} # user_id -> IP, filled by user_ip()
+		self.revoked_tokens = set() # dropped once each token is past its own expiry
+		self.issued_tokens = {} # token -> None, in issue order; added everytime the user sends a message with a token (until it expires)
+		self.expiry = ExpiryEngine(config.EXPIRY_GRANULARITY) # evicts posts, DMs and tokens past their expiry
+		self.expiry.register("posts", _prune_history)
+		self.expiry.register("dms", _prune_history)
+		self.expiry.register("issued_tokens", _prune_tokens)
+		self.expiry.register("revoked_tokens", _prune_tokens)
+		self._expiring(self.own_posts)
 		self.games = {}  # key = GAMEID, value = game info dict
+		self.games_lock = threading.Lock()
 		
 		# Group functionality data structures
-		self.groups = {} # GROUP_ID -> {group_name, members: [], creator, created_timestamp, messages: []}
+		self.groups = {} # GROUP_ID -> {group_name, members: {user_id: IP}, creator, created_timestamp, messages: [GroupMessage]}
+						# (members is an insertion-ordered dict used as a set)
 		self.owned_groups = set() # GROUP_IDs that this user created
+		self.groups_lock = threading.Lock() # groups, their member dicts and owned_groups
 		self.file_transfer_context = {} # for file transfer
-		self.pending_files = {}
+		self.file_offers = {} # FILEID -> FILE_OFFER message waiting for 'accept' / 'reject' in the shell
+		self.pending_files = {} # FILEID -> {filepath, token, receiver, filesize, chunk_size, binary_chunk_size} for files we offered
+		self.pending_files_path = None # set by load_pending_files() to persist pending_files
+		self.pending_files_lock = threading.Lock() # pending_files and its file (shell and dispatch threads change both)
+		self.outgoing_transfers = {} # FILEID -> OutgoingTransfer for windowed sends
+		self.engine = None # AsyncEngine when running in asyncio mode (timers and transfers run on its loop)
+		self.seen_messages = SeenCache(config.DEDUP_CAPACITY, config.DEDUP_TTL) # MESSAGE_IDs already handled by dispatch
+		self.retransmit_scheduler = RetransmitScheduler(self.retransmit_due) # deadlines for pending_acks (threaded mode)
+		self.rtt = RttTracker() # per-peer RTT estimates that drive the retransmission timeout
+		self.store = None # StateStore once load_state() is called (None = state is not persisted)
+		self.replaying = False # set while load_state() replays the WAL
+		self.transfer_scheduler = TransferScheduler(config.MAX_ACTIVE_TRANSFERS, config.TRANSFER_RATE_LIMIT,
+												config.TRANSFER_PEER_RATE_LIMIT, config.TRANSFER_BURST) # outgoing file transfers
 
 	# set the user's profile data
 	def set_own_profile(self, username, display_name, status, avatar_type=None, avatar_encoding=None, avatar_data=None):
@@ -44,6 +147,7 @@ class PeerManager:
 			"AVATAR_ENCODING": avatar_encoding,
 			"AVATAR_DATA": avatar_data
 		}
+		self.profile_version += 1
 		self.profile_updated = not is_first_time
 		self.profile_created = True
 
@@ -52,7 +156,11 @@ class PeerManager:
 		# broadcast profile everytime peer sets profile
 		profile = self.get_own_profile()
 		self.logger.log_send("PROFILE", f"{config.BROADCAST_ADDR}:{config.PORT}", profile)
-		send_message(profile, (config.BROADCAST_ADDR, config.PORT))
+		send_message(self.profile_frame(), (config.BROADCAST_ADDR, config.PORT))
+
+	# the encoded own PROFILE, rebuilt only after the profile changes
+	def profile_frame(self):
+		return self.frames.get("PROFILE", self.profile_version, self.get_own_profile)
 
 	# for broadcasting own profile periodically
 	def get_own_profile(self):
@@ -62,84 +170,113 @@ class PeerManager:
 		return self.own_profile.get("USER_ID") is not None
 	
 	# add or update a peer's profile info
+	@_persisted
 	def add_peer(self, user_id, display_name, status, avatar_type=None, avatar_encoding=None, avatar_data=None):
-		if user_id not in self.peers:
-			self.peers[user_id] = {
-				'display_name': display_name,
-				'status': status,
-				'avatar_type': avatar_type,
-				'avatar_encoding': avatar_encoding,
-				'avatar_data': avatar_data,
-				'posts': [],
-				'dms': [],
-				'followers': []
-			}
+		with self.peers_lock:
+			peer = self.peers.get(user_id)
+			if peer is None:
+				self.peers[user_id] = self._with_history(user_id, Peer(display_name, status, avatar_type, avatar_encoding, avatar_data))
+			else:
+				peer.display_name = display_name
+				peer.status = status
+				if avatar_type and avatar_data:
+					peer.avatar_type = avatar_type
+					peer.avatar_encoding = avatar_encoding
+					peer.avatar_data = avatar_data
+
+	# the peer record for user_id, created from the user_id if it is not known yet
+	def _get_or_create_peer(self, user_id):
+		with self.peers_lock:
+			peer = self.peers.get(user_id)
+			if peer is None:
+				# display name from user_id until a PROFILE arrives
+				peer = self.peers[user_id] = self._with_history(user_id, Peer.unknown(user_id))
+			return peer
+
+	# a bounded history, spilling to a log under HISTORY_DIR when persistence is enabled
+	def _history(self, kind, key, capacity, record_type, expires_at=None):
+		log = HistoryLog(history_file(config.HISTORY_DIR, kind, key), record_type, expires_at) if config.HISTORY_DIR else None
+		if log is not None and self.replaying:
+			log.truncate(0) # created after the snapshot: replaying the WAL spills its records again
+		return BoundedHistory(capacity, log)
+
+	def _with_history(self, user_id, peer):
+		peer.posts = self._expiring(self._history("posts", user_id, config.HISTORY_PEER_POSTS, Post, _expiry_of))
+		peer.dms = self._expiring(self._history("dms", user_id, config.HISTORY_PEER_DMS, DM, _expiry_of))
+		return peer
+
+	# a history whose records are tracked by the expiry engine: the ones it drops are
+	# forgotten there, so the heap does not keep them alive until they expire
+	def _expiring(self, history):
+		history.on_drop = lambda records, spilled: self.expiry.forget(history, records, keep=spilled)
+		return history
+
+	# one page of a peer's "posts" or "dms" (or a group's messages), oldest first;
+	# page 0 is the newest. reaches into the spilled log when persistence is enabled
+	def get_history(self, kind, key, page=0, size=20):
+		if kind == "groups":
+			group = self.groups.get(key)
+			history = group["messages"] if group else None
 		else:
-			self.peers[user_id]['display_name'] = display_name
-			self.peers[user_id]['status'] = status
-			if avatar_type and avatar_data:
-				self.peers[user_id]['avatar_type'] = avatar_type
-				self.peers[user_id]['avatar_encoding'] = avatar_encoding
-				self.peers[user_id]['avatar_data'] = avatar_data
-			if 'followers' not in self.peers[user_id]:
-				self.peers[user_id]['followers'] = []
+			peer = self.peers.get(key)
+			history = getattr(peer, kind) if peer else None
+		return history.page(page, size) if history is not None else []
 
 	# add a new post to the peer's post list
+	@_persisted
 	def add_post(self, user_id, content, timestamp=None, ttl=None, message_id=None, token=None):
 		# Create peer entry if we're following them but they're not in peers list yet
-		if user_id not in self.peers and self.is_following(user_id):
-			# Extract display name from user_id if no PROFILE received yet
-			display_name = user_id.split('@')[0] if '@' in user_id else user_id
-			self.peers[user_id] = {
-				'display_name': display_name,
-				'status': 'Unknown',
-				'avatar_type': None,
-				'avatar_encoding': None,
-				'avatar_data': None,
-				'posts': [],
-				'dms': [],
-				'followers': []
-			}
+		peer = self._get_or_create_peer(user_id) if self.is_following(user_id) else self.peers.get(user_id)
 		
-		if user_id in self.peers:
-			self.peers[user_id]['posts'].append({
-			'content': content,
-			'timestamp': timestamp,
-			'ttl': ttl,
-			'message_id': message_id,
-			'token': token
-		})
+		if peer is not None:
+			post = Post(content, timestamp, ttl, message_id, token)
+			peer.posts.append(post)
+			self._track_expiry("posts", peer.posts, post)
 
 	# add our own post for tracking purposes (for likes)
+	@_persisted
 	def add_own_post(self, content, timestamp, ttl, message_id, token):
 		"""Track our own posts for like functionality"""
-		self.own_posts.append({
-			'content': content,
-			'timestamp': timestamp,
-			'ttl': ttl,
-			'message_id': message_id,
-			'token': token
-		})
+		post = Post(content, timestamp, ttl, message_id, token)
+		self.own_posts.append(post)
+		self._track_expiry("posts", self.own_posts, post)
+
+	# the IP part of a user_id ("" if there is none), split once per user
+	def user_ip(self, user_id):
+		ip = self.user_ips.get(user_id)
+		if ip is None:
+			ip = self.user_ips[user_id] = user_id.partition('@')[2]
+		return ip
 
 	# add a new follower to a peer's followers list
+	@_persisted
 	def add_follower(self, to_user, from_user, token=None, timestamp=None, message_id=None):
-		follower_ips = self.get_follower_ips()
 		if from_user in self.peers:
-			ip = from_user.split('@')[1]  # Extract IP from user_id
-			if ip not in follower_ips:
-				self.followers.append(from_user)
+			ip = self.user_ip(from_user)
+			with self.followers_lock:
+				if ip not in self.follower_ips:
+					self.followers[from_user] = ip
+					self.follower_ips[ip] = from_user
 
 	# remove a follower from a peer's followers list
+	@_persisted
 	def remove_follower(self, to_user, from_user, token=None, timestamp=None, message_id=None):
-		if from_user in self.peers and from_user in self.followers:
-			self.followers.remove(from_user)
-		else:
+		with self.followers_lock:
+			removed = from_user in self.peers and from_user in self.followers
+			if removed:
+				del self.follower_ips[self.followers.pop(from_user)]
+		if not removed:
 			print(f"Peer {from_user} not found or invalid message.")
 	
 	# func for following a user
+	@_persisted
 	def follow(self, user_id):
 		self.following.add(user_id)
 		# self.logger.log("FOLLOW", f"You are now following {user_id}")
+
+	@_persisted
+	def unfollow(self, user_id):
+		self.following.discard(user_id)
 	
 	# func for checking if following a user
 	def is_following(self, user_id):
@@ -149,50 +286,60 @@ class PeerManager:
 		if user_id == self.own_profile.get("USER_ID"):
 			return self.own_profile.get("DISPLAY_NAME", user_id)
 		peer = self.peers.get(user_id)
-		return peer.get("display_name", user_id) if peer else user_id
+		return peer.display_name if peer else user_id
 
 	# return a list of ip address of peers who follow the current user
 	def get_follower_ips(self):
-		followers = []
-		
-		for user_id in self.followers:
-			ip = user_id.split('@')[1]  # Extract IP from user_id
-			followers.append(ip)
-		return followers
+		with self.followers_lock:
+			return list(self.follower_ips)
 	
 	def get_known_peer_ips(self):
-		known_peers = []
-		for peer in self.peers:
-			ip = peer.get["USER_ID"].split('@')[1]
-			known_peers.append(ip)
-		return known_peers
+		with self.peers_lock:
+			user_ids = list(self.peers)
+		return [self.user_ip(user_id) for user_id in user_ids]
 
+	@_persisted
 	def add_dm(self, from_user, content, timestamp, message_id, token):
-		if from_user not in self.peers:
-			self.peers[from_user] = {}
+		peer = self._get_or_create_peer(from_user)
+		dm = DM(content, timestamp, message_id, token)
+		peer.dms.append(dm)
+		self._track_expiry("dms", peer.dms, dm)
+	
+	# remember a token we put in an outgoing message (revoked on exit unless it expired first)
+	def issue_token(self, token):
+		self.issued_tokens[token] = None
+		self._track_expiry("issued_tokens", self.issued_tokens, token)
 
-		if "dms" not in self.peers[from_user]:
-			self.peers[from_user]["dms"] = []
+	# a REVOKE arrived. a token that is malformed or already past its expiry is rejected
+	# by validate_token anyway, so it is not kept
+	@_persisted
+	def revoke_token(self, token):
+		expires_at = token_expiry(token)
+		if expires_at is None or expires_at <= time.time():
+			return
+		self.revoked_tokens.add(token)
+		self._track_expiry("revoked_tokens", self.revoked_tokens, token)
 
-		self.peers[from_user]["dms"].append({
-			"content": content,
-			"timestamp": timestamp,
-			"message_id": message_id,
-			"token": token
-		})
+	def _track_expiry(self, kind, container, item):
+		expires_at = _expiry_of(item) if isinstance(item, str) else _retention_of(item)
+		if expires_at is not None:
+			self.expiry.track(kind, container, item, expires_at)
 	
 	# returns a list of (user_id, display_name) for all known peers
 	def list_peers(self):
-		return [(uid, info['display_name']) for uid, info in self.peers.items()]
+		with self.peers_lock:
+			return [(uid, peer.display_name) for uid, peer in self.peers.items()]
+
+	# (user_id, Peer) pairs for all known peers, safe to iterate while peers are added
+	def peer_items(self):
+		with self.peers_lock:
+			return list(self.peers.items())
 	
 	def get_peer_ips(self):
 		"""Get all IP addresses of known peers"""
-		peer_ips = []
-		for user_id in self.peers:
-			if "@" in user_id:
-				ip = user_id.split("@")[1]
-				peer_ips.append(ip)
-		return peer_ips
+		with self.peers_lock:
+			user_ids = list(self.peers)
+		return [self.user_ip(user_id) for user_id in user_ids if "@" in user_id]
 	
 	def validate_member_ip(self, member):
 		"""Validate that a member has a valid format and exists in our peer list or is ourselves"""
@@ -210,9 +357,7 @@ class PeerManager:
 				return True
 			
 			# Check if this user_id exists in our peer list
-			peer_list = self.list_peers()
-			known_user_ids = [user_id for user_id, display_name in peer_list]
-			return member in known_user_ids
+			return member in self.peers
 			
 		except ValueError:
 			return False
@@ -226,12 +371,12 @@ class PeerManager:
 			return
 		
 		print(f"\nPeer: {display_name} ({user_id})")
-		print(f"Status: {peer_info.get('status', 'No status')}")
+		print(f"Status: {peer_info.status}")
 		
 		# Show avatar information
-		if peer_info.get('avatar_type') and peer_info.get('avatar_data'):
-			avatar_size = len(peer_info.get('avatar_data', ''))
-			print(f"Avatar: {peer_info.get('avatar_type')} ({avatar_size} characters, base64 encoded)")
+		if peer_info.has_avatar():
+			avatar_size = len(peer_info.avatar_data)
+			print(f"Avatar: {peer_info.avatar_type} ({avatar_size} characters, base64 encoded)")
 		else:
 			print("Avatar: No profile picture")
 		
@@ -245,21 +390,21 @@ class PeerManager:
 		# print(f"Followers: {followers_count}")
 		
 		# Show Posts
-		posts = peer_info.get('posts', [])
+		posts = peer_info.posts
 		print(f"\nPosts ({len(posts)}):")
 		if posts:
 			# checks if a valid post exists
 			valid_exists = False
-			for i, post in enumerate([posts], 1):
-				is_valid, error = validate_token(post.get("token"), "broadcast", self.revoked_tokens)
+			for i, post in enumerate(posts, 1):
+				is_valid, error = validate_token(post.token, "broadcast", self.revoked_tokens)
 				if is_valid:
 					valid_exists = True
 					break
 			if valid_exists:
 				for i, post in enumerate(posts, 1):
-					content = post.get('content', 'No content')
-					message_id = post.get('message_id', 'N/A')
-					ttl = post.get('ttl', 'N/A')
+					content = post.content
+					message_id = post.message_id
+					ttl = post.ttl
 					print(f"  {i}. {content}")
 					print(f"     ID: {message_id} | TTL: {ttl}")
 			else:
@@ -268,23 +413,23 @@ class PeerManager:
 			print("  No posts from this peer.")
 		
 		# Show DMs
-		dms = peer_info.get('dms', [])
+		dms = peer_info.dms
 		print(f"\nDirect Messages ({len(dms)}):")
 		if dms:
 			# checks if a valid dm exists
 			valid_exists = False
 			for i, dm in enumerate(dms, 1):
-				is_valid, error = validate_token(dm.get("token"), "chat", self.revoked_tokens)
+				is_valid, error = validate_token(dm.token, "chat", self.revoked_tokens)
 				if is_valid:
 					valid_exists = True
 					break
 			if valid_exists:
 				for i, dm in enumerate(dms, 1):
-					is_valid, error = validate_token(dm.get("token"), "chat", self.revoked_tokens)
+					is_valid, error = validate_token(dm.token, "chat", self.revoked_tokens)
 					if is_valid:
-						content = dm.get('content', 'No content')
-						timestamp = dm.get('timestamp', 'N/A')
-						message_id = dm.get('message_id', 'N/A')
+						content = dm.content
+						timestamp = dm.timestamp
+						message_id = dm.message_id
 						
 						# Convert timestamp to readable format if it's a number
 						try:
@@ -305,26 +450,69 @@ class PeerManager:
 		
 		print()  # Empty line for spacing
 
-	# start a background thread for watching ACKs
+	# track a sent message until its ACK arrives (retransmitted on timeout).
+	# retransmissions resend `frame`, the bytes of the first send (encoded here if not given)
+	def track_ack(self, message_id, message, addr, frame=None):
+		entry = {
+			"message": message,
+			"frame": encode_message(message) if frame is None else frame,
+			"addr": addr,
+			"timestamp": time.time(),
+			"sent_at": time.monotonic(), # for the RTT sample when the ACK arrives
+			"attempts": 1
+		}
+		with self.acks_lock:
+			self.pending_acks[message_id] = entry
+		delay = self.rtt.backoff(addr[0], 1)
+		if self.engine:
+			self.engine.schedule_retransmit(message_id, delay)
+		else:
+			self.retransmit_scheduler.schedule(message_id, delay)
+
+	# called when an ACK arrives; returns the pending entry if there was one
+	def ack_received(self, message_id):
+		with self.acks_lock:
+			entry = self.pending_acks.pop(message_id, None)
+		if entry:
+			if self.engine:
+				self.engine.cancel_retransmit(message_id)
+			else:
+				self.retransmit_scheduler.cancel(message_id)
+			# an ACK for a retransmitted message is ambiguous, so only first sends are sampled
+			if entry["attempts"] == 1:
+				self.rtt.sample(entry["addr"][0], time.monotonic() - entry["sent_at"])
+		return entry
+
+	# a retransmission deadline passed: resend or give up.
+	# returns the delay until the next deadline, or None once the message is no longer pending
+	def retransmit_due(self, message_id, send=send_message):
+		with self.acks_lock:
+			entry = self.pending_acks.get(message_id)
+			if not entry:
+				return None # ACK arrived in the meantime
+			gave_up = entry["attempts"] >= config.ACK_MAX_ATTEMPTS
+			if gave_up:
+				del self.pending_acks[message_id]
+			else:
+				entry["timestamp"] = time.time()
+				entry["attempts"] += 1
+			attempts = entry["attempts"]
+		ip = entry["addr"][0]
+		if gave_up:
+			self.logger.log("DROP", f"Gave up on {message_id} after {config.ACK_MAX_ATTEMPTS} attempts")
+			self.rtt.count_timeout(ip)
+			return None
+		send(entry["frame"], entry["addr"]) # outside the lock, so ACKs are not held up by the send
+		self.rtt.count_retransmit(ip)
+		self.logger.log("RETRY", f"Retransmitted {message_id} (attempt {attempts})")
+		return self.rtt.backoff(ip, attempts)
+
+	# start the background thread that retransmits unacknowledged messages
 	def start_ack_watcher(self):
-		def retransmit_loop():
-			while True:
-				now = time.time()
-				for message_id, entry in list(self.pending_acks.items()):
-					if now - entry["timestamp"] > 2: # timeout of 2 seconds
-						if entry["attempts"] < 3: # 3 attemps max
-							send_message(entry["message"], entry["addr"])
-							entry["timestamp"] = now
-							entry["attempts"] += 1
-							self.logger.log("RETRY", f"Retransmitted {message_id} (attempt {entry['attempts']})")
-						else:
-							self.logger.log("DROP", f"Gave up on {message_id} after 3 attempts")
-							del self.pending_acks[message_id]
-				time.sleep(0.5)
-
-		threading.Thread(target=retransmit_loop, daemon=True).start()
+		self.retransmit_scheduler.start()
 
 	# create a new game when sending or receiving a game invite
+	@_persisted
 	def create_game(self, game_id, opponent_id, is_initiator, token, my_symbol=None, opponent_symbol=None):
 		if my_symbol is None or opponent_symbol is None:
 			symbol = "X" if is_initiator else "O"
@@ -332,7 +520,7 @@ class PeerManager:
 		else:
 			symbol = my_symbol
 		
-		self.games[game_id] = {
+		game = {
 			"board": [" "] * 9,
 			"turn": 1,
 			"symbol": symbol,
@@ -342,47 +530,50 @@ class PeerManager:
 			"last_message_id": None,
 			"token": token
 		}
+		with self.games_lock:
+			self.games[game_id] = game
 	
+	@_persisted
 	def apply_move(self, game_id, position, is_self, symbol=None):
-		game = self.games.get(game_id)
-		if not game:
-			return False
+		with self.games_lock:
+			game = self.games.get(game_id)
+			if not game:
+				return False
 
-		if position < 0 or position >= 9 or game["board"][position] != " ":
-			return False
+			if position < 0 or position >= 9 or game["board"][position] != " ":
+				return False
 
-		if symbol is None:
-			symbol = game["symbol"] if is_self else game["opponent_symbol"]
+			if symbol is None:
+				symbol = game["symbol"] if is_self else game["opponent_symbol"]
 
-		game["board"][position] = symbol
-		game["turn"] += 1
-		game["my_turn"] = not is_self  # It will be their turn if is_self is False
-		return True
+			game["board"][position] = symbol
+			game["turn"] += 1
+			game["my_turn"] = not is_self  # It will be their turn if is_self is False
+			return True
+
+	# a game ended; returns its state (None if there was no such game)
+	@_persisted
+	def end_game(self, game_id):
+		with self.games_lock:
+			return self.games.pop(game_id, None)
 	
 	def add_like(self, target_user, post_timestamp, action, post_content):
 		"""Add a like/unlike record for tracking purposes"""
-		if target_user not in self.peers:
+		peer = self.peers.get(target_user)
+		if peer is None:
 			return False
 		
-		if 'likes' not in self.peers[target_user]:
-			self.peers[target_user]['likes'] = []
-		
 		# Remove any existing like/unlike for this post from this user
-		likes_list = self.peers[target_user]['likes']
-		self.peers[target_user]['likes'] = [
-			like for like in likes_list 
-			if like.get('post_timestamp') != post_timestamp or like.get('from_user') != self.own_profile["USER_ID"]
-		]
-		
-		# Add the new like/unlike
-		if action == "LIKE":
-			self.peers[target_user]['likes'].append({
-				'from_user': self.own_profile["USER_ID"],
-				'post_timestamp': post_timestamp,
-				'action': action,
-				'post_content': post_content,
-				'timestamp': int(time.time())
-			})
+		own_id = self.own_profile["USER_ID"]
+		with self.likes_lock:
+			peer.likes = [
+				like for like in peer.likes
+				if like.post_timestamp != post_timestamp or like.from_user != own_id
+			]
+			
+			# Add the new like/unlike
+			if action == "LIKE":
+				peer.likes.append(Like(own_id, post_timestamp, action, post_content, int(time.time())))
 		
 		return True
 	
@@ -391,25 +582,16 @@ class PeerManager:
 		if not self.own_profile:
 			return False
 		
-		# Initialize likes structure if it doesn't exist
-		if not hasattr(self, 'received_likes'):
-			self.received_likes = []
-		
 		# Remove any existing like/unlike for this post from this user
-		self.received_likes = [
-			like for like in self.received_likes 
-			if not (like.get('from_user') == from_user and like.get('post_timestamp') == post_timestamp)
-		]
-		
-		# Add the new like (but not unlike - unlikes just remove the like)
-		if action == "LIKE":
-			self.received_likes.append({
-				'from_user': from_user,
-				'post_timestamp': post_timestamp,
-				'action': action,
-				'post_content': post_content,
-				'timestamp': int(time.time())
-			})
+		with self.likes_lock:
+			self.received_likes = [
+				like for like in self.received_likes 
+				if not (like.from_user == from_user and like.post_timestamp == post_timestamp)
+			]
+			
+			# Add the new like (but not unlike - unlikes just remove the like)
+			if action == "LIKE":
+				self.received_likes.append(Like(from_user, post_timestamp, action, post_content, int(time.time())))
 		
 		return True
 	# ===== GROUP MANAGEMENT METHODS =====
@@ -432,14 +614,7 @@ class PeerManager:
 		timestamp = int(time.time())
 		
 		# Store group locally
-		self.groups[group_id] = {
-			"group_name": group_name,
-			"members": members.copy(),
-			"creator": creator,
-			"created_timestamp": timestamp,
-			"messages": []
-		}
-		self.owned_groups.add(group_id)
+		self._add_group(group_id, group_name, members, creator, timestamp, owned=True)
 		
 		return {
 			"TYPE": "GROUP_CREATE",
@@ -479,15 +654,7 @@ class PeerManager:
 			raise ValueError("Group creator cannot remove himself from the group.")
 		
 		# Update local membership
-		if add_members:
-			for member in add_members:
-				if member not in group["members"]:
-					group["members"].append(member)
-		
-		if remove_members:
-			for member in remove_members:
-				if member in group["members"]:
-					group["members"].remove(member)
+		self._update_members(group_id, add_members, remove_members)
 		
 		# Create update message
 		message = {
@@ -517,12 +684,7 @@ class PeerManager:
 		timestamp = int(time.time())
 		
 		# Store message locally
-		message_data = {
-			"from": sender,
-			"content": content,
-			"timestamp": timestamp
-		}
-		self.groups[group_id]["messages"].append(message_data)
+		self._add_group_message(group_id, sender, content, timestamp)
 		
 		return {
 			"TYPE": "GROUP_MESSAGE",
@@ -546,13 +708,7 @@ class PeerManager:
 		# Check if we're in the group
 		my_user_id = self.own_profile.get("USER_ID") if self.own_profile else None
 		if my_user_id and my_user_id in members:
-			self.groups[group_id] = {
-				"group_name": group_name,
-				"members": members,
-				"creator": creator,
-				"created_timestamp": timestamp,
-				"messages": []
-			}
+			self._add_group(group_id, group_name, members, creator, timestamp)
 			return True
 		return False
 	
@@ -565,21 +721,9 @@ class PeerManager:
 		if group_id not in self.groups:
 			return False
 		
-		group = self.groups[group_id]
-		
-		# Add members
-		if add_members_str:
-			add_members = [m.strip() for m in add_members_str.split(",") if m.strip()]
-			for member in add_members:
-				if member not in group["members"]:
-					group["members"].append(member)
-		
-		# Remove members
-		if remove_members_str:
-			remove_members = [m.strip() for m in remove_members_str.split(",") if m.strip()]
-			for member in remove_members:
-				if member in group["members"]:
-					group["members"].remove(member)
+		add_members = [m.strip() for m in add_members_str.split(",") if m.strip()]
+		remove_members = [m.strip() for m in remove_members_str.split(",") if m.strip()]
+		self._update_members(group_id, add_members, remove_members)
 		
 		return True
 	
@@ -590,52 +734,201 @@ class PeerManager:
 		sender = message.get("FROM")
 		timestamp = int(message.get("TIMESTAMP", 0))
 		
-		if group_id not in self.groups:
+		group = self.groups.get(group_id)
+		if group is None:
 			return False
 		
 		# Check if sender is a group member
-		if sender not in self.groups[group_id]["members"]:
+		if sender not in group["members"]:
 			return False
 		
 		# Store message
-		message_data = {
-			"from": sender,
-			"content": content,
-			"timestamp": timestamp
-		}
-		self.groups[group_id]["messages"].append(message_data)
+		self._add_group_message(group_id, sender, content, timestamp)
 		return True
 
 	# List all groups
 	def list_groups(self):
-		return [(gid, gdata["group_name"], len(gdata["members"])) 
-				for gid, gdata in self.groups.items()]
+		with self.groups_lock:
+			return [(gid, gdata["group_name"], len(gdata["members"])) 
+					for gid, gdata in self.groups.items()]
 	
-	# Get detailed information about a group
-	def get_group_details(self, group_id):
-		if group_id not in self.groups:
-			return None
-		
-		group = self.groups[group_id]
-		return {
-			"id": group_id,
-			"name": group["group_name"],
-			"members": group["members"],
-			"creator": group["creator"],
-			"created": group["created_timestamp"],
-			"messages": group["messages"]
-		}
+	# Get detailed information about a group: a copy of its fields and its newest `recent`
+	# messages, read under the lock (None if there is no such group)
+	def get_group_details(self, group_id, recent=10):
+		with self.groups_lock:
+			group = self.groups.get(group_id)
+			if group is None:
+				return None
+			return {
+				"id": group_id,
+				"name": group["group_name"],
+				"members": list(group["members"]),
+				"creator": group["creator"],
+				"created": group["created_timestamp"],
+				"messages": group["messages"].recent(recent),
+				"message_count": group["messages"].total()
+			}
 	
 	# Get all members ip
 	def get_group_member_ips(self, group_id):
-		member_ips = []
-		for member in self.groups[group_id]["members"]:
-			ip = member.split("@")[1]
-			member_ips.append(ip)
-		return member_ips
+		with self.groups_lock:
+			return list(self.groups[group_id]["members"].values())
 
-	def add_pending_file(self, file_id, filepath, token):
-		self.pending_files[file_id] = {"filepath": filepath, "token": token}
+	# group members as {user_id: IP}, keeping their order
+	def _member_index(self, members):
+		return {member: self.user_ip(member) for member in members}
+
+	@_persisted
+	def _add_group(self, group_id, group_name, members, creator, created_timestamp, owned=False):
+		group = {
+			"group_name": group_name,
+			"members": self._member_index(members),
+			"creator": creator,
+			"created_timestamp": created_timestamp,
+			"messages": self._history("groups", group_id, config.HISTORY_GROUP_MESSAGES, GroupMessage)
+		}
+		with self.groups_lock:
+			self.groups[group_id] = group
+			if owned:
+				self.owned_groups.add(group_id)
+
+	@_persisted
+	def _update_members(self, group_id, add_members, remove_members):
+		with self.groups_lock:
+			group = self.groups.get(group_id)
+			if group is None:
+				return
+			for member in add_members or ():
+				if member not in group["members"]:
+					group["members"][member] = self.user_ip(member)
+			for member in remove_members or ():
+				group["members"].pop(member, None)
+
+	@_persisted
+	def _add_group_message(self, group_id, sender, content, timestamp):
+		group = self.groups.get(group_id)
+		if group is not None:
+			group["messages"].append(GroupMessage(sender, content, timestamp))
+
+	def add_pending_file(self, file_id, filepath, token, receiver_id=None, chunk_size=None, binary_chunk_size=None):
+		pending = {
+			"filepath": filepath,
+			"token": token,
+			"receiver": receiver_id,
+			"filesize": os.path.getsize(filepath) if os.path.isfile(filepath) else None,
+			"chunk_size": chunk_size,
+			"binary_chunk_size": binary_chunk_size, # set when binary FILE_CHUNKs were offered
+		}
+		with self.pending_files_lock:
+			self.pending_files[file_id] = pending
+			self._write_pending_files()
 
 	def get_pending_file(self, file_id):
 		return self.pending_files.get(file_id)
+
+	def remove_pending_file(self, file_id):
+		with self.pending_files_lock:
+			if self.pending_files.pop(file_id, None) is not None:
+				self._write_pending_files()
+
+	# offered files survive a restart so receivers can still resume them
+	def load_pending_files(self, path):
+		self.pending_files_path = path
+		try:
+			with open(path) as f:
+				loaded = json.load(f)
+			with self.pending_files_lock:
+				self.pending_files.update(loaded)
+		except FileNotFoundError:
+			pass
+		except (OSError, ValueError) as e:
+			self.logger.log("ERROR", f"Could not load pending files from {path}: {e}")
+
+	# restore peers, follows, posts, DMs, groups and games from the state store in directory
+	# (its snapshot, then the WAL records after it) and persist every later change there
+	def load_state(self, directory):
+		store = StateStore(directory, self._state, config.STATE_FSYNC_INTERVAL, config.STATE_SNAPSHOT_EVERY)
+		started = time.perf_counter()
+		# everything loaded stays alive, so the collector's passes over it while loading are
+		# wasted (they more than doubled the load time of 100k messages)
+		gc_enabled = gc.isenabled()
+		gc.disable()
+		try:
+			snapshot, records = store.load()
+			if snapshot:
+				self._restore(snapshot)
+			self.replaying = True
+			for seq, method, args, kwargs in records:
+				try:
+					getattr(self, method)(*args, **kwargs)
+				except Exception as e:
+					self.logger.log("ERROR", f"Could not replay state record {seq} ({method}): {e}")
+		finally:
+			self.replaying = False
+			if gc_enabled:
+				gc.enable()
+		self.store = store
+		store.start()
+		self.logger.log("PEER", f"Restored {len(self.peers)} peers from {directory} "
+			f"({len(records)} changes replayed) in {(time.perf_counter() - started) * 1000:.0f} ms.")
+
+	# everything load_state() restores as JSON-ready data; called by the store with its lock
+	# held, so no persisted change is half made
+	def _state(self):
+		with self.peers_lock:
+			peers = {user_id: [peer.display_name, peer.status, peer.avatar_type, peer.avatar_encoding, peer.avatar_data,
+					peer.posts.state(), peer.dms.state()] for user_id, peer in self.peers.items()}
+		with self.followers_lock:
+			followers = list(self.followers)
+		with self.groups_lock:
+			groups = {group_id: [group["group_name"], list(group["members"]), group["creator"], group["created_timestamp"],
+					group["messages"].state(), group_id in self.owned_groups] for group_id, group in self.groups.items()}
+		with self.games_lock:
+			games = {game_id: dict(game, board=list(game["board"])) for game_id, game in self.games.items()}
+		return {
+			"peers": peers,
+			"own_posts": self.own_posts.state(),
+			"following": list(self.following),
+			"followers": followers,
+			"revoked_tokens": list(self.revoked_tokens),
+			"groups": groups,
+			"games": games
+		}
+
+	def _restore(self, state):
+		expiring = [] # (kind, history, record, expires_at), tracked in one go at the end
+		for user_id, (display_name, status, avatar_type, avatar_encoding, avatar_data, posts, dms) in state["peers"].items():
+			peer = self.peers[user_id] = self._with_history(user_id, Peer(display_name, status, avatar_type, avatar_encoding, avatar_data))
+			self._restore_history("posts", peer.posts, posts, Post, expiring)
+			self._restore_history("dms", peer.dms, dms, DM, expiring)
+		self._restore_history("posts", self.own_posts, state["own_posts"], Post, expiring)
+		self.expiry.track_many(expiring)
+		self.following.update(state["following"])
+		for user_id in state["followers"]:
+			ip = self.followers[user_id] = self.user_ip(user_id)
+			self.follower_ips[ip] = user_id
+		for token in state["revoked_tokens"]:
+			self.revoke_token(token)
+		for group_id, (group_name, members, creator, created_timestamp, messages, owned) in state["groups"].items():
+			self._add_group(group_id, group_name, members, creator, created_timestamp, owned)
+			self.groups[group_id]["messages"].restore(messages, GroupMessage)
+		self.games.update(state["games"])
+
+	def _restore_history(self, kind, history, state, record_type, expiring):
+		for record in history.restore(state, record_type):
+			expires_at = _retention_of(record)
+			if expires_at is not None:
+				expiring.append((kind, history, record, expires_at))
+
+	def save_pending_files(self):
+		with self.pending_files_lock:
+			self._write_pending_files()
+
+	# caller holds pending_files_lock, so concurrent saves never share the .tmp file
+	def _write_pending_files(self):
+		if not self.pending_files_path:
+			return
+		tmp_path = self.pending_files_path + ".tmp"
+		with open(tmp_path, "w") as f:
+			json.dump(self.pending_files, f)
+		os.replace(tmp_path, self.pending_files_path)
@@ -0,0 +1,73 @@
+# compact records for what PeerManager keeps about peers, posts, DMs, likes and group
+# messages. __slots__ classes carry no per-instance __dict__, so a record costs a fixed
+# handful of pointers instead of a hash table, which matters with thousands of peers and
+# hundreds of thousands of posts. these are the one schema used by core, dispatch and the shell
+class Record:
+	__slots__ = ()
+
+	def __eq__(self, other):
+		return type(self) is type(other) and all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+	def __repr__(self):
+		fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+		return f"{type(self).__name__}({fields})"
+
+# what we know about another user (posts, dms and likes are lists of the records below)
+class Peer(Record):
+	__slots__ = ("display_name", "status", "avatar_type", "avatar_encoding", "avatar_data", "posts", "dms", "likes")
+
+	def __init__(self, display_name, status, avatar_type=None, avatar_encoding=None, avatar_data=None):
+		self.display_name = display_name
+		self.status = status
+		self.avatar_type = avatar_type
+		self.avatar_encoding = avatar_encoding
+		self.avatar_data = avatar_data # base64 text
+		self.posts = []
+		self.dms = []
+		self.likes = [] # our likes on this peer's posts
+
+	# a placeholder for a user we heard from before their PROFILE arrived
+	@classmethod
+	def unknown(cls, user_id):
+		return cls(user_id.split('@')[0] if '@' in user_id else user_id, 'Unknown')
+
+	def has_avatar(self):
+		return bool(self.avatar_type and self.avatar_data)
+
+class Post(Record):
+	__slots__ = ("content", "timestamp", "ttl", "message_id", "token")
+
+	def __init__(self, content, timestamp=None, ttl=None, message_id=None, token=None):
+		self.content = content
+		self.timestamp = timestamp
+		self.ttl = ttl
+		self.message_id = message_id
+		self.token = token
+
+class DM(Record):
+	__slots__ = ("content", "timestamp", "message_id", "token")
+
+	def __init__(self, content, timestamp=None, message_id=None, token=None):
+		self.content = content
+		self.timestamp = timestamp
+		self.message_id = message_id
+		self.token = token
+
+# a LIKE on a post, identified by the post's timestamp
+class Like(Record):
+	__slots__ = ("from_user", "post_timestamp", "action", "post_content", "timestamp")
+
+	def __init__(self, from_user, post_timestamp, action, post_content, timestamp):
+		self.from_user = from_user
+		self.post_timestamp = post_timestamp
+		self.action = action
+		self.post_content = post_content
+		self.timestamp = timestamp
+
+class GroupMessage(Record):
+	__slots__ = ("sender", "content", "timestamp")
+
+	def __init__(self, sender, content, timestamp):
+		self.sender = sender
+		self.content = content
+		self.timestamp = timestamp
@@ -0,0 +1,116 @@
+import heapq
+import itertools
+import threading
+import time
+
+# min-heap of retransmission deadlines driven by one thread that sleeps exactly until the
+# next deadline. cancel() is O(1): it only forgets the key, and the stale heap entry is
+# skipped when it reaches the top (the heap is compacted if stale entries pile up)
+class RetransmitScheduler:
+	def __init__(self, on_due):
+		self.on_due = on_due # on_due(key) -> delay in seconds to fire again, or None when done
+		self.heap = [] # (deadline, seq, key)
+		self.live = {} # key -> seq of its current heap entry
+		self.seq = itertools.count()
+		self.cond = threading.Condition()
+		self.running = False
+		self.stats = {"scheduled": 0, "fired": 0, "cancelled": 0, "wakeups": 0}
+
+	def start(self):
+		with self.cond:
+			if self.running:
+				return
+			self.running = True
+		threading.Thread(target=self._loop, name="retransmit", daemon=True).start()
+
+	def stop(self):
+		with self.cond:
+			self.running = False
+			self.cond.notify_all()
+
+	# (re)arm key to fire after delay seconds
+	def schedule(self, key, delay):
+		deadline = time.monotonic() + delay
+		with self.cond:
+			seq = next(self.seq)
+			self.live[key] = seq
+			heapq.heappush(self.heap, (deadline, seq, key))
+			self.stats["scheduled"] += 1
+			if self.heap[0][1] == seq:
+				self.cond.notify() # new earliest deadline, wake the timer thread early
+			self._compact_locked()
+
+	def cancel(self, key):
+		with self.cond:
+			if self.live.pop(key, None) is not None:
+				self.stats["cancelled"] += 1
+				return True
+			return False
+
+	def __len__(self):
+		return len(self.live)
+
+	def next_deadline(self):
+		with self.cond:
+			self._drop_stale_locked()
+			return self.heap[0][0] if self.heap else None
+
+	# pops every key whose deadline has passed (the caller invokes on_due for each)
+	def pop_due(self, now=None):
+		now = time.monotonic() if now is None else now
+		with self.cond:
+			return self._pop_due_locked(now)
+
+	# fire every due key once; used by the timer thread and usable from other loops
+	def run_due(self, now=None):
+		for key in self.pop_due(now):
+			self._fire(key)
+
+	def _fire(self, key):
+		self.stats["fired"] += 1
+		delay = self.on_due(key)
+		if delay is not None:
+			self.schedule(key, delay)
+
+	def _loop(self):
+		while True:
+			with self.cond:
+				due = []
+				while self.running:
+					due = self._pop_due_locked(time.monotonic())
+					if due:
+						break
+					self._drop_stale_locked()
+					timeout = self.heap[0][0] - time.monotonic() if self.heap else None
+					self.cond.wait(timeout)
+					self.stats["wakeups"] += 1
+				if not self.running:
+					return
+			for key in due:
+				self._fire(key)
+
+	def _pop_due_locked(self, now):
+		due = []
+		while self.heap and self.heap[0][0] <= now:
+			_, seq, key = heapq.heappop(self.heap)
+			if self.live.get(key) == seq:
+				del self.live[key]
+				due.append(key)
+		return due
+
+	def _drop_stale_locked(self):
+		while self.heap and self.live.get(self.heap[0][2]) != self.heap[0][1]:
+			heapq.heappop(self.heap)
+
+	# rebuild the heap once cancelled/rescheduled entries outnumber live ones
+	def _compact_locked(self):
+		if len(self.heap) > 64 and len(self.heap) > 2 * len(self.live):
+			self.heap = [entry for entry in self.heap if self.live.get(entry[2]) == entry[1]]
+			heapq.heapify(self.heap)
+
+	def get_stats(self):
+		with self.cond:
+			stats = dict(self.stats)
+			stats["pending"] = len(self.live)
+			stats["heap_size"] = len(self.heap)
+		return stats
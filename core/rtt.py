@@ -0,0 +1,85 @@
+import random
+import threading
+import config
+
+# smoothed round-trip estimate for one peer (Jacobson/Karels, as in RFC 6298)
+class RttEstimator:
+	__slots__ = ("srtt", "rttvar", "rto", "samples", "retransmits", "timeouts", "last_rtt")
+
+	ALPHA = 1 / 8
+	BETA = 1 / 4
+
+	def __init__(self):
+		self.srtt = None
+		self.rttvar = None
+		self.rto = None # None until the first sample; config.ACK_TIMEOUT is used until then
+		self.samples = 0
+		self.retransmits = 0
+		self.timeouts = 0 # messages given up on
+		self.last_rtt = None
+
+	def sample(self, rtt):
+		if self.srtt is None:
+			self.srtt = rtt
+			self.rttvar = rtt / 2
+		else:
+			self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+			self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+		self.rto = self.srtt + max(0.01, 4 * self.rttvar) # 10ms clock granularity floor
+		self.samples += 1
+		self.last_rtt = rtt
+
+# per-peer RTT estimators keyed by IP, plus the RTO / backoff policy built on them
+class RttTracker:
+	def __init__(self):
+		self.peers = {}
+		self.lock = threading.Lock()
+
+	def _get(self, ip):
+		estimator = self.peers.get(ip)
+		if estimator is None:
+			estimator = self.peers[ip] = RttEstimator()
+		return estimator
+
+	# record the time between sending a message and receiving its ACK.
+	# only call this for messages that were never retransmitted (Karn's algorithm)
+	def sample(self, ip, rtt):
+		with self.lock:
+			self._get(ip).sample(rtt)
+
+	def count_retransmit(self, ip):
+		with self.lock:
+			self._get(ip).retransmits += 1
+
+	def count_timeout(self, ip):
+		with self.lock:
+			self._get(ip).timeouts += 1
+
+	# base RTO for a peer, clamped to [RTO_MIN, RTO_MAX]
+	def rto(self, ip):
+		with self.lock:
+			estimator = self.peers.get(ip)
+			rto = estimator.rto if estimator and estimator.rto is not None else config.ACK_TIMEOUT
+		return min(max(rto, config.RTO_MIN), config.RTO_MAX)
+
+	# timeout before the next send after `attempts` sends: RTO doubled per retransmission,
+	# with random jitter so peers that lost packets together do not retransmit together
+	def backoff(self, ip, attempts):
+		delay = self.rto(ip) * (2 ** max(0, attempts - 1))
+		delay *= 1 + random.uniform(-config.RTO_JITTER, config.RTO_JITTER)
+		return min(delay, config.RTO_MAX)
+
+	def get_stats(self):
+		with self.lock:
+			return {
+				ip: {
+					"samples": e.samples,
+					"srtt": e.srtt,
+					"rttvar": e.rttvar,
+					"rto": min(max(e.rto if e.rto is not None else config.ACK_TIMEOUT, config.RTO_MIN), config.RTO_MAX),
+					"last_rtt": e.last_rtt,
+					"retransmits": e.retransmits,
+					"timeouts": e.timeouts,
+				}
+				for ip, e in self.peers.items()
+			}
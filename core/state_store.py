@@ -0,0 +1,162 @@
+import json
+import os
+import threading
+
+# persistent PeerManager state: a snapshot of all of it plus a write-ahead log (WAL) of every
+# change made since. a WAL line is [seq, method, args, kwargs], the PeerManager method that made
+# the change and what it was called with, so recovery loads the snapshot and replays the tail
+# through the same methods; startup costs the snapshot plus the tail, not the whole history.
+# once the WAL holds snapshot_every records it is compacted: a new snapshot (stamped with the
+# last seq it covers) replaces the old one and the WAL restarts with the records appended
+# while it was written. a crash in between only leaves records that replay skips by seq.
+# each record reaches the OS when it is appended; fsyncs are batched, one per fsync_interval,
+# so a power loss costs at most that much of the WAL (0 = fsync every record, None = never)
+class StateStore:
+	def __init__(self, directory, capture, fsync_interval=1.0, snapshot_every=50000):
+		self.directory = directory
+		self.wal_path = os.path.join(directory, "wal.jsonl")
+		self.snapshot_path = os.path.join(directory, "snapshot.json")
+		self.capture = capture # capture() -> the state to snapshot, called with self.lock held
+		self.fsync_interval = fsync_interval
+		self.snapshot_every = snapshot_every
+		self.lock = threading.Lock() # held by writers across their change and its WAL record
+		self.wal = None
+		self.seq = 0 # seq of the last record
+		self.wal_records = 0 # records in the WAL file
+		self.tail = None # records appended while a snapshot is written (None = not compacting)
+		self.dirty = False # appended since the last fsync
+		self.running = False
+		self.thread = None
+		self.wakeup = threading.Event()
+		self.stats = {"appended": 0, "fsyncs": 0, "snapshots": 0, "replayed": 0, "skipped": 0}
+
+	# the last snapshot (None if there is none) and the WAL records after it, oldest first.
+	# a torn record at the end of the WAL (a write cut short by a crash) is cut off
+	def load(self):
+		os.makedirs(self.directory, exist_ok=True)
+		snapshot = None
+		try:
+			with open(self.snapshot_path, "rb") as f:
+				snapshot = json.load(f)
+		except FileNotFoundError:
+			pass
+		covered = snapshot["seq"] if snapshot else 0
+		records = []
+		good = 0 # offset after the last complete record
+		if os.path.exists(self.wal_path):
+			with open(self.wal_path, "rb") as f:
+				for line in f:
+					if not line.endswith(b"\n"):
+						break
+					try:
+						record = json.loads(line)
+					except ValueError:
+						break
+					good += len(line)
+					self.wal_records += 1
+					if record[0] > covered:
+						records.append(record)
+					else:
+						self.stats["skipped"] += 1
+			if good < os.path.getsize(self.wal_path):
+				with open(self.wal_path, "r+b") as f:
+					f.truncate(good)
+		self.seq = records[-1][0] if records else covered
+		self.stats["replayed"] = len(records)
+		self.wal = open(self.wal_path, "ab", buffering=0)
+		return snapshot, records
+
+	# log a change; the caller holds self.lock from before the change until this returns
+	def append_locked(self, method, args, kwargs):
+		if self.wal is None:
+			return # closed (shutting down)
+		self.seq += 1
+		line = json.dumps([self.seq, method, args, kwargs], separators=(",", ":")).encode("utf-8") + b"\n"
+		self.wal.write(line)
+		self.wal_records += 1
+		self.stats["appended"] += 1
+		if self.tail is not None:
+			self.tail.append(line)
+		if self.fsync_interval == 0:
+			os.fsync(self.wal.fileno())
+			self.stats["fsyncs"] += 1
+		else:
+			self.dirty = True
+
+	# fsync what was appended since the last fsync
+	def sync(self):
+		with self.lock:
+			if not self.dirty or self.wal is None:
+				return
+			self.dirty = False
+			fileno = self.wal.fileno()
+		if self.fsync_interval is not None:
+			os.fsync(fileno)
+			self.stats["fsyncs"] += 1
+
+	# write a new snapshot and restart the WAL from it. writers are only held up while the
+	# state is captured, not while it is written
+	def compact(self):
+		with self.lock:
+			if self.tail is not None or self.wal is None:
+				return
+			state = self.capture()
+			state["seq"] = self.seq
+			self.tail = []
+		_write_file(self.snapshot_path, json.dumps(state, separators=(",", ":")).encode("utf-8"))
+		with self.lock:
+			tail, self.tail = self.tail, None
+			_write_file(self.wal_path, b"".join(tail))
+			self.wal.close()
+			self.wal = open(self.wal_path, "ab", buffering=0)
+			self.wal_records = len(tail)
+			self.dirty = False
+			self.stats["snapshots"] += 1
+
+	def start(self):
+		with self.lock:
+			if self.running:
+				return
+			self.running = True
+		self.thread = threading.Thread(target=self._loop, name="state-store", daemon=True)
+		self.thread.start()
+
+	# compact (so the next startup only loads the snapshot) and close the WAL
+	def close(self):
+		self.running = False
+		self.wakeup.set()
+		if self.thread:
+			self.thread.join() # may be in the middle of a sync or compaction
+		if self.wal is None:
+			return
+		if self.wal_records:
+			self.compact()
+		self.sync()
+		with self.lock:
+			self.wal.close()
+			self.wal = None
+
+	def _loop(self):
+		while self.running:
+			self.wakeup.wait(self.fsync_interval or 1.0)
+			if not self.running:
+				return
+			self.sync()
+			if self.wal_records >= self.snapshot_every:
+				self.compact()
+
+	def get_stats(self):
+		with self.lock:
+			stats = dict(self.stats)
+			stats["wal_records"] = self.wal_records
+			stats["seq"] = self.seq
+		return stats
+
+# replace path with data atomically, fsynced before the rename
+def _write_file(path, data):
+	tmp_path = path + ".tmp"
+	with open(tmp_path, "wb") as f:
+		f.write(data)
+		f.flush()
+		os.fsync(f.fileno())
+	os.replace(tmp_path, path)
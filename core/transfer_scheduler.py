@@ -0,0 +1,200 @@
+import threading
+import time
+from collections import deque
+import config
+from network.send_pool import send_pool
+
+# byte budget refilled at `rate` bytes/s up to `burst` bytes. a send may overdraw it,
+# after which nothing is sent until it is positive again (rate 0 means unlimited)
+class TokenBucket:
+	def __init__(self, rate, burst):
+		self.rate = rate
+		self.burst = burst
+		self.tokens = burst
+		self.updated = time.monotonic()
+
+	def _refill(self, now):
+		self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+		self.updated = now
+
+	def ready(self, now):
+		if not self.rate:
+			return True
+		self._refill(now)
+		return self.tokens > 0
+
+	def consume(self, amount, now):
+		if self.rate:
+			self._refill(now)
+			self.tokens -= amount
+
+	# seconds until ready() turns true
+	def delay(self, now):
+		if not self.rate:
+			return 0.0
+		self._refill(now)
+		return 0.0 if self.tokens > 0 else (-self.tokens + 1) / self.rate
+
+# runs outgoing file transfers side by side: up to max_active at once (the rest queue),
+# one chunk per transfer per round-robin turn, within a global and a per-peer bytes/s budget.
+# pump() does one round of work and says how long to sleep, so the same scheduler is driven
+# by its own thread in threaded mode or by a task on the asyncio engine's loop
+class TransferScheduler:
+	def __init__(self, max_active=4, rate=0, peer_rate=0, burst=0.1):
+		self.max_active = max(1, max_active)
+		self.peer_rate = peer_rate
+		self.burst = burst # seconds of traffic a bucket can save up
+		self.global_bucket = TokenBucket(rate, self._burst_bytes(rate))
+		self.peer_buckets = {} # receiver IP -> TokenBucket
+		self.active = []
+		self.queued = deque()
+		self.finished = deque(maxlen=20) # recent transfers kept for the shell
+		self.turn = 0 # round-robin position in self.active
+		self.lock = threading.Lock()
+		self.wakeup = threading.Event()
+		self.notify = self.wakeup.set # replaced by the asyncio engine with a loop-safe wakeup
+		self.running = False
+		self.stats = {"added": 0, "completed": 0, "failed": 0, "chunks": 0, "bytes": 0, "throttled": 0}
+
+	def _burst_bytes(self, rate):
+		return max(rate * self.burst, 65536)
+
+	def _peer_bucket(self, ip):
+		bucket = self.peer_buckets.get(ip)
+		if bucket is None:
+			bucket = self.peer_buckets[ip] = TokenBucket(self.peer_rate, self._burst_bytes(self.peer_rate))
+		return bucket
+
+	def add(self, transfer):
+		transfer.notify = self._wake # SACKs and cancellations wake whoever drives the scheduler
+		with self.lock:
+			if len(self.active) < self.max_active:
+				self.active.append(transfer)
+			else:
+				self.queued.append(transfer)
+			self.stats["added"] += 1
+		self._wake()
+
+	def _wake(self):
+		self.notify()
+
+	def start(self):
+		with self.lock:
+			if self.running:
+				return
+			self.running = True
+		threading.Thread(target=self._loop, name="transfers", daemon=True).start()
+
+	def stop(self):
+		self.running = False
+		self.notify()
+
+	def _loop(self):
+		while self.running:
+			self.wakeup.clear()
+			timeout = self.pump(send_pool.sendto)
+			if timeout != 0:
+				self.wakeup.wait(config.ACK_TIMEOUT if timeout is None else timeout)
+
+	# send up to `limit` chunks round-robin across active transfers. returns 0 if there is
+	# more to send right away, otherwise seconds until the next timeout or budget refill
+	# (None when only a SACK or a new transfer can make progress)
+	def pump(self, send, now=None, limit=None):
+		now = time.monotonic() if now is None else now
+		limit = config.TRANSFER_BATCH if limit is None else limit
+		with self.lock:
+			active = list(self.active)
+		for transfer in active:
+			transfer.check_timeouts(now)
+
+		sent = 0
+		throttled = None
+		turn = self.turn
+		while active and sent < limit:
+			progress = False
+			for offset in range(len(active)):
+				position = (turn + offset) % len(active)
+				transfer = active[position]
+				if transfer.done:
+					continue
+				peer_bucket = self._peer_bucket(transfer.addr[0])
+				if not self.global_bucket.ready(now) or not peer_bucket.ready(now):
+					delay = max(self.global_bucket.delay(now), peer_bucket.delay(now))
+					throttled = delay if throttled is None else min(throttled, delay)
+					self.stats["throttled"] += 1
+					continue
+				index = transfer.next_chunk(now)
+				if index is None:
+					continue
+				frame = transfer.encode_chunk(index)
+				try:
+					send(frame, transfer.addr)
+				except OSError as e:
+					transfer.cancel(f"send failed: {e}")
+					continue
+				size = len(frame)
+				transfer.stats["bytes_sent"] += size
+				transfer.peer_manager.logger.log_send("FILE_CHUNK", transfer.receiver_id, frame)
+				self.global_bucket.consume(size, now)
+				peer_bucket.consume(size, now)
+				self.stats["chunks"] += 1
+				self.stats["bytes"] += size
+				sent += 1
+				progress = True
+				if sent >= limit:
+					break
+			turn = (position + 1) % len(active) # next round starts after the last transfer served
+			if not progress:
+				break
+			now = time.monotonic()
+		self.turn = turn
+
+		if self._retire() or sent >= limit:
+			return 0
+		waits = [throttled] + [transfer.next_timeout(now) for transfer in active if not transfer.done]
+		waits = [wait for wait in waits if wait is not None]
+		return min(waits) if waits else None
+
+	# close finished transfers and admit queued ones; True if any were admitted
+	def _retire(self):
+		with self.lock:
+			done = [transfer for transfer in self.active if transfer.done]
+			if not done:
+				return False
+			self.active = [transfer for transfer in self.active if not transfer.done]
+			admitted = False
+			while self.queued and len(self.active) < self.max_active:
+				transfer = self.queued.popleft()
+				transfer.started = time.monotonic() # throughput counts from admission, not from queueing
+				self.active.append(transfer)
+				admitted = True
+			self.turn = 0
+		for transfer in done:
+			transfer.close()
+			if transfer.peer_manager.outgoing_transfers.get(transfer.file_id) is transfer:
+				del transfer.peer_manager.outgoing_transfers[transfer.file_id]
+			self.stats["failed" if transfer.failed else "completed"] += 1
+			self.finished.append(transfer)
+		return admitted
+
+	# progress rows for active, queued and recently finished transfers
+	def get_transfers(self):
+		with self.lock:
+			transfers = list(self.active) + list(self.queued) + list(self.finished)
+			queued = set(map(id, self.queued))
+		rows = []
+		for transfer in transfers:
+			row = transfer.progress()
+			if id(transfer) in queued:
+				row["state"] = "queued"
+			rows.append(row)
+		return rows
+
+	def get_stats(self):
+		with self.lock:
+			stats = dict(self.stats)
+			stats["active"] = len(self.active)
+			stats["queued"] = len(self.queued)
+		stats["rate"] = self.global_bucket.rate
+		stats["peer_rate"] = self.peer_rate
+		return stats
@@ -4,21 +4,59 @@ from parser.message_parser import parse_message
 from utils.logger import Logger
 from core.peer import PeerManager
 from core.message_dispatcher import dispatch
+from core.dispatch_pool import DispatchPool
 from cli.interactive_shell import run_shell
 from core.broadcaster import broadcast_profile_periodically
+from network.send_pool import send_pool
+from network.async_engine import AsyncEngine
+import config
 
 if __name__ == "__main__":
-	
+	arg_parser = argparse.ArgumentParser(description="LSNP peer")
+	arg_parser.add_argument("--engine", choices=["threaded", "asyncio"], default="threaded",
+							help="threaded: listener/ACK watcher/broadcaster threads; asyncio: one event loop for all network work")
+	args = arg_parser.parse_args()
+
 	verbose = True # default is verbose mode
 	logger = Logger(verbose)
 	peer_manager = PeerManager(logger)
-	peer_manager.start_ack_watcher()
-	udp = UDPHandler(logger, peer_manager, dispatch)
-	udp.start()
+	peer_manager.load_pending_files(config.PENDING_FILES_PATH)
+	if config.STATE_DIR:
+		peer_manager.load_state(config.STATE_DIR)
+	send_pool.size = config.SEND_POOL_SIZE
+	dispatch_pool = None
+	if config.DISPATCH_WORKERS > 0:
+		dispatch_pool = DispatchPool(dispatch, logger, config.DISPATCH_WORKERS, config.DISPATCH_QUEUE_SIZE, config.DISPATCH_OVERFLOW)
+		dispatch_pool.start()
+	dispatcher = dispatch_pool.submit if dispatch_pool else dispatch
+
+	udp = None
+	engine = None
+	if args.engine == "asyncio":
+		engine = AsyncEngine(logger, peer_manager, dispatcher)
+		engine.start()
+	else:
+		peer_manager.start_ack_watcher()
+		peer_manager.transfer_scheduler.start()
+		peer_manager.expiry.start()
+		udp = UDPHandler(logger, peer_manager, dispatcher)
+		udp.start()
+		broadcast_profile_periodically(logger, peer_manager)
 
-	broadcast_profile_periodically(logger, peer_manager)
 	# start interactive shell
 	try:
-		run_shell(logger, peer_manager)
+		run_shell(logger, peer_manager, udp, dispatch_pool)
 	except KeyboardInterrupt:
-		print("\nShutting down...")
\ No newline at end of file
+		print("\nShutting down...")
+	finally:
+		# stop receiving, let queued messages finish, and only then close the state they write to
+		if engine:
+			engine.stop()
+		if udp:
+			udp.stop()
+		if dispatch_pool:
+			dispatch_pool.drain(timeout=5)
+			dispatch_pool.stop()
+		if peer_manager.store:
+			peer_manager.store.close()
+		send_pool.close()
\ No newline at end of file
@@ -0,0 +1,200 @@
+import asyncio
+import socket
+import threading
+import time
+import config
+from parser.message_parser import parse_datagram, encode_message
+from core.broadcaster import ping_frame
+from network.send_pool import send_pool
+
+# datagram protocol that feeds every received datagram into the engine
+class LSNPProtocol(asyncio.DatagramProtocol):
+	def __init__(self, engine):
+		self.engine = engine
+
+	def datagram_received(self, data, addr):
+		self.engine.handle_datagram(data, addr)
+
+	def error_received(self, exc):
+		self.engine.logger.log("ERROR", str(exc))
+
+# asyncio alternative to the UDPHandler / ACK watcher / broadcaster threads.
+# receive, retransmission timers, periodic PING and file transfers all run on one event loop;
+# the loop lives in a background thread so the interactive shell keeps the main thread
+class AsyncEngine:
+	def __init__(self, logger, peer_manager, dispatcher, ping_interval=300):
+		self.logger = logger
+		self.peer_manager = peer_manager
+		self.dispatch = dispatcher
+		self.ping_interval = ping_interval
+		self.loop = None
+		self.thread = None
+		self.transport = None
+		self.sock = None # the bound socket, also the send pool's primary socket
+		self.own_ip = None
+		self.timers = {} # MESSAGE_ID -> asyncio.TimerHandle for pending retransmissions
+		self.ping_task = None
+		self.transfer_task = None
+		self.expiry_task = None
+		self.stats = {"datagrams": 0, "errors": 0, "sends": 0, "retransmits": 0, "gave_up": 0}
+
+	# start the event loop thread and wait until the socket is bound
+	def start(self):
+		self.loop = asyncio.new_event_loop()
+		ready = threading.Event()
+		failure = []
+		self.thread = threading.Thread(target=self._run, args=(ready, failure), daemon=True)
+		self.thread.start()
+		ready.wait()
+		if failure:
+			raise failure[0]
+		self.peer_manager.engine = self
+		self.logger.log("AsyncEngine", "Listening for messages...")
+
+	def _run(self, ready, failure):
+		asyncio.set_event_loop(self.loop)
+		try:
+			self.loop.run_until_complete(self._open())
+		except Exception as e:
+			failure.append(e)
+			ready.set()
+			return
+		ready.set()
+		self.ping_task = self.loop.create_task(self._ping_loop())
+		self.transfer_task = self.loop.create_task(self._transfer_loop())
+		self.expiry_task = self.loop.create_task(self._expiry_loop())
+		self.loop.run_forever()
+		# let cancelled tasks unwind before closing the loop
+		pending = [task for task in asyncio.all_tasks(self.loop) if not task.done()]
+		self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+		self.loop.close()
+
+	async def _open(self):
+		self.own_ip = socket.gethostbyname(socket.gethostname())
+		sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+		sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, config.RECV_BUFFER_SIZE)
+		sock.bind(("", config.PORT))
+		self.transport, _ = await self.loop.create_datagram_endpoint(lambda: LSNPProtocol(self), sock=sock)
+		self.sock = sock
+		send_pool.attach(sock) # messages sent from other threads leave from the LSNP port too
+
+	# stop receiving and the loop's tasks, waiting (up to timeout) for the loop to wind down
+	def stop(self, timeout=2.0):
+		if self.loop and self.loop.is_running():
+			self.loop.call_soon_threadsafe(self._shutdown)
+		if self.thread:
+			self.thread.join(timeout)
+
+	def _shutdown(self):
+		for handle in self.timers.values():
+			handle.cancel()
+		self.timers.clear()
+		for task in (self.ping_task, self.transfer_task, self.expiry_task):
+			if task:
+				task.cancel()
+		if self.transport:
+			send_pool.detach(self.sock)
+			self.transport.close()
+		self.loop.stop()
+
+	# runs on the loop: parse and dispatch one datagram (dispatch logs it if accepted)
+	def handle_datagram(self, data, addr):
+		self.stats["datagrams"] += 1
+		if addr[0] == self.own_ip: # skip messages from self
+			return
+		try:
+			message = parse_datagram(data)
+			self.dispatch(message, addr[0], self.peer_manager)
+		except Exception as e:
+			self.stats["errors"] += 1
+			self.logger.log("ERROR", str(e))
+
+	# loop-thread only
+	def _send(self, message, addr):
+		self._send_frame(encode_message(message), addr)
+
+	# loop-thread only; the transport copies the frame if it has to queue it
+	def _send_frame(self, frame, addr):
+		self.transport.sendto(frame, addr)
+		self.stats["sends"] += 1
+
+	# ===== RETRANSMISSION TIMERS =====
+
+	# thread-safe: arm a retransmission timer for a message tracked in pending_acks
+	def schedule_retransmit(self, message_id, delay):
+		self.loop.call_soon_threadsafe(self._arm_retransmit, message_id, delay)
+
+	# thread-safe: disarm the timer once the ACK is in
+	def cancel_retransmit(self, message_id):
+		self.loop.call_soon_threadsafe(self._disarm_retransmit, message_id)
+
+	def _arm_retransmit(self, message_id, delay):
+		self._disarm_retransmit(message_id)
+		self.timers[message_id] = self.loop.call_later(delay, self._retransmit, message_id)
+
+	def _disarm_retransmit(self, message_id):
+		handle = self.timers.pop(message_id, None)
+		if handle:
+			handle.cancel()
+
+	def _retransmit(self, message_id):
+		self.timers.pop(message_id, None)
+		was_pending = message_id in self.peer_manager.pending_acks
+		delay = self.peer_manager.retransmit_due(message_id, send=self._send_frame)
+		if delay is not None:
+			self.stats["retransmits"] += 1
+			self._arm_retransmit(message_id, delay)
+		elif was_pending:
+			self.stats["gave_up"] += 1
+
+	# ===== PERIODIC PING =====
+
+	async def _ping_loop(self):
+		while True:
+			ping = ping_frame(self.peer_manager)
+			if ping:
+				self._send_frame(ping, (config.BROADCAST_ADDR, config.PORT))
+				self.logger.log_send("PING", f"{config.BROADCAST_ADDR}:{config.PORT}", ping)
+			await asyncio.sleep(self.ping_interval)
+
+	# ===== FILE TRANSFERS =====
+
+	# drives the peer manager's TransferScheduler on the loop; SACKs and new transfers
+	# arrive on other threads and wake it through call_soon_threadsafe
+	async def _transfer_loop(self):
+		scheduler = self.peer_manager.transfer_scheduler
+		wakeup = asyncio.Event()
+		scheduler.notify = lambda: self.loop.call_soon_threadsafe(wakeup.set)
+		while True:
+			wakeup.clear()
+			timeout = scheduler.pump(self._send_frame)
+			if timeout == 0:
+				await asyncio.sleep(0) # let receive and timers run between batches
+				continue
+			try:
+				await asyncio.wait_for(wakeup.wait(), timeout)
+			except asyncio.TimeoutError:
+				pass
+
+	# ===== EXPIRY =====
+
+	# drives the peer manager's ExpiryEngine on the loop; posts, DMs and tokens are tracked
+	# from other threads, which wake it through call_soon_threadsafe
+	async def _expiry_loop(self):
+		expiry = self.peer_manager.expiry
+		wakeup = asyncio.Event()
+		expiry.notify = lambda: self.loop.call_soon_threadsafe(wakeup.set)
+		while True:
+			wakeup.clear()
+			timeout = expiry.pump()
+			try:
+				await asyncio.wait_for(wakeup.wait(), timeout)
+			except asyncio.TimeoutError:
+				pass
+
+	def get_stats(self):
+		stats = dict(self.stats)
+		stats["timers"] = len(self.timers)
+		return stats
@@ -0,0 +1,86 @@
+import socket
+import threading
+
+# owns a small pool of long-lived UDP sockets used for every outgoing LSNP datagram.
+# the bound UDPHandler socket is attached as the primary socket so replies leave from
+# the LSNP port; extra sockets are created lazily and reused round-robin.
+class SendPool:
+	def __init__(self, size=2):
+		self.size = max(1, size)
+		self.lock = threading.Lock()
+		self.sockets = [] # long-lived sockets, attached socket (if any) first
+		self.owned = set() # sockets created by the pool (closed on close())
+		self.next_index = 0
+		self.stats = {
+			"sends": 0,
+			"bytes": 0,
+			"errors": 0,
+			"sockets_created": 0,
+			"sockets_attached": 0,
+		}
+
+	# reuse an already bound socket (e.g. UDPHandler.sock) as the primary send socket
+	def attach(self, sock):
+		with self.lock:
+			if sock in self.sockets:
+				return
+			self.sockets.insert(0, sock)
+			self.stats["sockets_attached"] += 1
+
+	# stop using a socket that is about to be closed by its owner
+	def detach(self, sock):
+		with self.lock:
+			if sock in self.sockets:
+				self.sockets.remove(sock)
+				self.next_index = 0
+
+	def _new_socket(self):
+		sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+		self.owned.add(sock)
+		self.stats["sockets_created"] += 1
+		return sock
+
+	# pick the next socket round-robin, creating pool sockets up to `size`
+	def acquire(self):
+		with self.lock:
+			if self.next_index >= len(self.sockets) and len(self.sockets) < self.size:
+				self.sockets.append(self._new_socket())
+			sock = self.sockets[self.next_index % len(self.sockets)]
+			self.next_index = (self.next_index + 1) % max(self.size, len(self.sockets))
+			return sock
+
+	# send raw bytes to addr using a pooled socket
+	def sendto(self, data, addr):
+		sock = self.acquire()
+		try:
+			sent = sock.sendto(data, addr)
+		except Exception:
+			with self.lock:
+				self.stats["errors"] += 1
+			raise
+		with self.lock:
+			self.stats["sends"] += 1
+			self.stats["bytes"] += sent
+		return sent
+
+	def get_stats(self):
+		with self.lock:
+			stats = dict(self.stats)
+			stats["pool_size"] = len(self.sockets)
+		return stats
+
+	# close the sockets the pool created; attached sockets belong to their owner
+	def close(self):
+		with self.lock:
+			for sock in self.owned:
+				try:
+					sock.close()
+				except OSError:
+					pass
+			self.sockets = [s for s in self.sockets if s not in self.owned]
+			self.owned.clear()
+			self.next_index = 0
+
+# process-wide pool shared by the listener, ACK watcher, broadcaster and shell threads
+send_pool = SendPool()
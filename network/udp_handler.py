@@ -1,30 +1,59 @@
+import os
 import socket
+import selectors
 import threading
-from parser.message_parser import parse_message
+from parser.message_parser import parse_datagram
 import config
 from utils.network_utils import get_broadcast_address
+from network.send_pool import send_pool
 
 # sets up a UDP socket for LSNP communication.
-# listens for incoming messages in a background thread, decodes, parses, logs, and dispatches them
+# listens for incoming messages in a background thread, parses and dispatches them
 class UDPHandler:
-	def __init__(self, logger, peer_manager, dispatcher):
+	def __init__(self, logger, peer_manager, dispatcher, batch_size=None, recv_buffer=None):
 		self.logger = logger
 		self.peer_manager = peer_manager
 		self.dispatch = dispatcher
 		self.running = True
+		self.thread = None
+		self.batch_size = batch_size or config.RECV_BATCH_SIZE
+		self.stats = {"datagrams": 0, "batches": 0, "largest_batch": 0, "errors": 0}
 
 		# set up UDP socket with broadcast capability
 		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 		self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
 		self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.set_recv_buffer(recv_buffer or config.RECV_BUFFER_SIZE)
 		self.sock.bind(("", config.PORT)) # when testing on multiple terminals on the same device,
 				                          # you have to change the port to a different one
-	
+		send_pool.attach(self.sock) # outgoing messages reuse the bound socket
+
+		# preallocated receive buffers, reused for every batch
+		self.buffers = [bytearray(65535) for _ in range(self.batch_size)] # 65535 -> maximum size of a UDP datagram
+		self.views = [memoryview(buf) for buf in self.buffers]
+
+	# request a kernel receive buffer size; the kernel may clamp (or, on Linux, double) it
+	def set_recv_buffer(self, size):
+		try:
+			self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+		except OSError as e:
+			self.logger.log("UDPHandler", f"Could not set SO_RCVBUF to {size}: {e}")
+		return self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
 	# start background listener thread
 	def start(self):
-		threading.Thread(target=self.listen, daemon=True).start()
+		target = self.listen_batched if config.BATCH_RECV else self.listen
+		self.thread = threading.Thread(target=target, daemon=True)
+		self.thread.start()
 		self.logger.log("UDPHandler", "Listening for messages...")
 
+	# stop handing datagrams downstream and wait (up to timeout) for the listener to exit;
+	# the socket stays open for the send pool
+	def stop(self, timeout=2.0):
+		self.running = False
+		if self.thread:
+			self.thread.join(timeout)
+
 	# blocking loop to listen for incoming UDP packets
 	# each message is parsed and dispatched
 	def listen(self):
@@ -32,11 +61,86 @@ class UDPHandler:
 		while self.running:
 			try:
 				data, addr = self.sock.recvfrom(65535) # 65535 -> maximum size of a UDP datagram
-				if addr[0] == own_ip: # skip messages from self
+				if not self.running:
+					break
+				self.handle_batch([(data, addr)], own_ip)
+			except Exception as e:
+				self.logger.log("ERROR", str(e))
+
+	# waits for the socket to become readable, then drains every ready datagram
+	# into the preallocated buffers and hands the whole batch downstream
+	def listen_batched(self):
+		own_ip = socket.gethostbyname(socket.gethostname())
+		selector = selectors.DefaultSelector()
+		selector.register(self.sock, selectors.EVENT_READ)
+		while self.running:
+			try:
+				if not selector.select(timeout=1.0) or not self.running:
 					continue
-				raw = data.decode("utf-8")
-				message = parse_message(raw)
-				self.logger.log_recv(message.get("TYPE", "UNKNOWN"), addr[0], message, self.peer_manager)
+				batch = self.drain()
+				if batch:
+					self.handle_batch(batch, own_ip)
+			except Exception as e:
+				self.logger.log("ERROR", str(e))
+		selector.close()
+
+	# read up to batch_size datagrams without blocking once the first one is in.
+	# the datagrams are memoryview slices of the reusable buffers, only valid until the
+	# next drain: short datagrams are decoded straight from them, large ones are copied
+	# once by parse_datagram
+	def drain(self):
+		dontwait = getattr(socket, "MSG_DONTWAIT", None)
+		if dontwait is None:
+			self.sock.setblocking(False) # platforms without MSG_DONTWAIT (e.g. Windows)
+		batch = []
+		try:
+			for view in self.views:
+				try:
+					if dontwait is None:
+						nbytes, addr = self.sock.recvfrom_into(view)
+					else:
+						nbytes, addr = self.sock.recvfrom_into(view, 0, dontwait)
+				except (BlockingIOError, InterruptedError):
+					break
+				batch.append((view[:nbytes], addr))
+		finally:
+			if dontwait is None:
+				self.sock.setblocking(True)
+		if batch:
+			self.stats["batches"] += 1
+			self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+		return batch
+
+	# parse and dispatch every datagram of a batch (dispatch logs the ones it accepts)
+	def handle_batch(self, batch, own_ip):
+		for data, addr in batch:
+			self.stats["datagrams"] += 1
+			if addr[0] == own_ip: # skip messages from self
+				continue
+			try:
+				message = parse_datagram(data)
 				self.dispatch(message, addr[0], self.peer_manager)
 			except Exception as e:
-				self.logger.log("ERROR", str(e))
\ No newline at end of file
+				self.stats["errors"] += 1
+				self.logger.log("ERROR", str(e))
+
+	# datagrams the kernel dropped on this socket because the receive buffer was full.
+	# read from /proc/net/udp (Linux); returns None where the counter is not exposed
+	def get_kernel_drops(self):
+		try:
+			inode = str(os.fstat(self.sock.fileno()).st_ino)
+			with open("/proc/net/udp") as f:
+				next(f) # header
+				for line in f:
+					fields = line.split()
+					if len(fields) >= 13 and fields[9] == inode:
+						return int(fields[12])
+		except (OSError, ValueError, StopIteration):
+			pass
+		return None
+
+	def get_stats(self):
+		stats = dict(self.stats)
+		stats["recv_buffer"] = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+		stats["kernel_drops"] = self.get_kernel_drops()
+		return stats
@@ -1,3 +1,6 @@
+import struct
+from collections.abc import Mapping
+
 
 # parses a raw LSNP message (key-value format) into a Python dictionary
 # each message is separated by `\n`, terminated with `\n\n`
@@ -13,9 +16,333 @@ def parse_message(raw: str) -> dict:
     return message
 
 
+# field names used by the protocol. parse_message_bytes stores these shared str objects
+# as keys of bulk messages, so those do not each hold their own copy of every key
+KNOWN_KEYS = {key: key for key in (
+    "TYPE", "FROM", "TO", "USER_ID", "DISPLAY_NAME", "STATUS", "AVATAR_TYPE", "AVATAR_ENCODING",
+    "AVATAR_DATA", "MESSAGE_ID", "TIMESTAMP", "TOKEN", "TTL", "CONTENT", "POST_TIMESTAMP", "ACTION",
+    "GROUP_ID", "GROUP_NAME", "MEMBERS", "ADD", "REMOVE", "GAMEID", "SYMBOL", "TURN", "POSITION",
+    "RESULT", "WINNER", "WINNING_LINE", "RECIPIENT", "FILEID", "FILENAME", "FILESIZE", "FILETYPE",
+    "DESCRIPTION", "CHUNK_INDEX", "TOTAL_CHUNKS", "CHUNK_SIZE", "DATA", "SACK_NOW", "CRC32", "SHA256",
+    "SACK", "BASE", "BITMAP", "RECEIVED", "CORRUPT", "RANGES", "BINARY", "BINARY_CHUNK_SIZE",
+)}
+
+# bulk fields returned by parse_message_bytes as memoryview slices instead of str
+BULK_FIELDS = {b"DATA": "DATA", b"AVATAR_DATA": "AVATAR_DATA"}
+
+# datagrams shorter than this are parsed as text even with a bulk field: below a few KB,
+# decoding the whole datagram costs less than finding and slicing the bulk line
+BULK_MIN_SIZE = 4096
+
+# the ASCII characters str.strip() removes, as byte values
+_STRIP_BYTES = frozenset(b" \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f")
+
+# same result as parse_message(data.decode('utf-8')), but DATA / AVATAR_DATA come back as
+# memoryview slices of data instead of being decoded, split and stripped into str copies.
+# those lines are located with bytes.find (a bulk value is skipped over, never scanned
+# line by line); the short fields around them are decoded and parsed as usual.
+# bulk values are not checked for valid UTF-8 (they hold base64 text or raw bytes).
+# a datagram without a bulk field (PING, DM, ...) or under BULK_MIN_SIZE is just
+# decoded and parse_message'd, which is faster for those than any of the above
+def parse_message_bytes(data) -> dict:
+    if len(data) < BULK_MIN_SIZE:
+        return parse_message(str(data, 'utf-8'))
+    raw = data if isinstance(data, bytes) else bytes(data)
+    if b'DATA' not in raw:
+        return parse_message(raw.decode('utf-8'))
+    message = {}
+    parsed_to = 0 # raw[:parsed_to] is already in message
+    for line_start, line_end, key, value in _bulk_lines(raw):
+        if line_start > parsed_to:
+            _parse_into(message, raw[parsed_to:line_start].decode('utf-8'))
+        message[key] = value
+        parsed_to = line_end
+    if parsed_to < len(raw):
+        _parse_into(message, raw[parsed_to:].decode('utf-8'))
+    return message
+
+# (line_start, line_end, key, stripped memoryview value) for each DATA / AVATAR_DATA line.
+# "DATA" is searched for with bytes.find; a hit inside another line is skipped, and a bulk
+# value is jumped over rather than scanned
+def _bulk_lines(raw):
+    search = raw.find(b'DATA')
+    view = None
+    while search >= 0:
+        line_start = raw.rfind(b'\n', 0, search) + 1
+        line_end = raw.find(b'\n', search)
+        if line_end < 0:
+            line_end = len(raw)
+        colon = raw.find(b':', line_start, line_end)
+        key = BULK_FIELDS.get(raw[line_start:colon].strip()) if colon >= search else None
+        if key is None:
+            search = raw.find(b'DATA', search + 4)
+            continue
+        if view is None:
+            view = memoryview(raw)
+        yield line_start, line_end, key, _stripped_view(raw, view, colon + 1, line_end)
+        search = raw.find(b'DATA', line_end)
+
+# parse_message's loop, adding to an existing dict and sharing the known key objects
+def _parse_into(message, raw):
+    known = KNOWN_KEYS
+    for line in raw.strip().split('\n'):
+        if ':' not in line:
+            continue
+        key, value = line.split(':', 1)
+        key = key.strip()
+        message[known.get(key, key)] = value.strip()
+
+# key names as bytes, for looking up keys without decoding them
+_KNOWN_KEY_BYTES = {key.encode('ascii'): key for key in KNOWN_KEYS}
+_BULK_KEYS = frozenset(BULK_FIELDS.values())
+
+_MISSING = object()
+
+# "\nKEY:" and "KEY:" for each known key (a field as craft_message writes it), and the bare name
+_KEY_NEEDLES = {key: (b'\n' + name + b':', name + b':', name) for name, key in _KNOWN_KEY_BYTES.items()}
+
+# read-only view of a text LSNP message that decodes only what is asked for, so dispatch
+# can look at TYPE, TO or TOKEN and drop a message without touching the rest.
+# bulk fields are located first (cheap: their lines are skipped with a single-byte find).
+# a known key is then looked for, in the short stretches between bulk lines, as a line
+# starting "KEY:" (the form craft_message writes; the last such line wins), and is missing
+# if its name is not in those stretches at all (optional fields cost a find, not a parse).
+# anything else falls back to splitting the whole datagram into fields, parsed like parse_message
+# (so " KEY : v" still works), with values left undecoded until read.
+# a value, once read, never changes for this view. values match parse_message_bytes
+# unless a key is written both plainly and with padding in the same message
+class LazyMessage(Mapping):
+    __slots__ = ("raw", "_values", "_fields", "_bulk", "_segments")
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+        self._values = {} # key -> value already read
+        self._fields = None # key -> value for every field; bytes until decoded
+        self._bulk = None # bulk key -> memoryview
+        self._segments = None # (start, end) of the stretches between bulk lines, last first
+
+    def _find_bulk(self):
+        raw = self.raw
+        bulk = {}
+        segments = []
+        parsed_to = 0
+        for line_start, line_end, key, value in _bulk_lines(raw):
+            bulk[key] = value
+            segments.append((parsed_to, line_start))
+            parsed_to = line_end
+        segments.append((parsed_to, len(raw)))
+        segments.reverse()
+        self._bulk = bulk
+        self._segments = segments
+
+    def _index(self):
+        raw = self.raw
+        fields = {}
+        parsed_to = 0
+        for line_start, line_end, key, value in _bulk_lines(raw):
+            if line_start > parsed_to:
+                _index_into(fields, raw[parsed_to:line_start])
+            fields[key] = value
+            parsed_to = line_end
+        if parsed_to < len(raw):
+            _index_into(fields, raw[parsed_to:] if parsed_to else raw)
+        fields.update(self._values) # keep what was already handed out
+        self._fields = fields
+        return fields
+
+    # value for key (first read), or _MISSING
+    def _resolve(self, key):
+        raw = self.raw
+        if self._fields is None:
+            if self._segments is None:
+                self._find_bulk()
+            if key in self._bulk:
+                value = self._values[key] = self._bulk[key]
+                return value
+            if key in _BULK_KEYS:
+                return _MISSING # _find_bulk already looked for every DATA / AVATAR_DATA line
+            needles = _KEY_NEEDLES.get(key)
+            if needles is not None:
+                needle = needles[0]
+                for first, last in self._segments:
+                    start = raw.rfind(needle, first, last)
+                    if start >= 0:
+                        start += len(needle)
+                    elif first == 0 and raw.startswith(needles[1]):
+                        start = len(needles[1])
+                    else:
+                        continue
+                    end = raw.find(b'\n', start)
+                    value = self._values[key] = raw[start:end if end >= 0 else len(raw)].decode('utf-8').strip()
+                    return value
+                name = needles[2]
+                for first, last in self._segments:
+                    if raw.find(name, first, last) >= 0:
+                        break # maybe a padded " KEY :" line; the full parse decides
+                else:
+                    return _MISSING
+        fields = self._fields or self._index()
+        value = fields.get(key, _MISSING)
+        if value.__class__ is bytes:
+            value = fields[key] = value.decode('utf-8').strip()
+        if value is not _MISSING:
+            self._values[key] = value
+        return value
+
+    def __getitem__(self, key):
+        value = self._values.get(key, _MISSING)
+        if value is _MISSING:
+            value = self._resolve(key)
+            if value is _MISSING:
+                raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._values.get(key, _MISSING)
+        if value is _MISSING:
+            value = self._resolve(key)
+            if value is _MISSING:
+                return default
+        return value
+
+    def __contains__(self, key):
+        return key in self._values or self._resolve(key) is not _MISSING
+
+    def __iter__(self):
+        return iter(self._fields or self._index())
+
+    def __len__(self):
+        return len(self._fields or self._index())
+
+    # keys whose values have been decoded so far
+    def decoded(self):
+        return set(self._values)
+
+    # (key, value) for every line of the message in order, for logging: text lines are
+    # decoded one at a time as they are reached, bulk values stay memoryviews
+    def iter_fields(self):
+        raw = self.raw
+        parsed_to = 0
+        for line_start, line_end, key, value in _bulk_lines(raw):
+            yield from _iter_lines(raw, parsed_to, line_start)
+            yield key, value
+            parsed_to = line_end
+        yield from _iter_lines(raw, parsed_to, len(raw))
+
+    # every field at once; a plain dict like parse_message_bytes returns
+    def to_dict(self):
+        message = parse_message_bytes(self.raw)
+        message.update(self._values)
+        return message
+
+    def __repr__(self):
+        return f"LazyMessage({self.raw[:60]!r}...)" if len(self.raw) > 60 else f"LazyMessage({self.raw!r})"
+
+# _parse_into for LazyMessage: split on bytes and keep the values undecoded
+def _index_into(fields, raw):
+    known = _KNOWN_KEY_BYTES
+    for line in raw.split(b'\n'):
+        key, colon, value = line.partition(b':')
+        if colon:
+            name = known.get(key.strip())
+            if name is None:
+                name = key.decode('utf-8').strip()
+            fields[name] = value
+
+# the fields of raw[first:last], one decoded line at a time
+def _iter_lines(raw, first, last):
+    known = _KNOWN_KEY_BYTES
+    while first < last:
+        end = raw.find(b'\n', first, last)
+        if end < 0:
+            end = last
+        key, colon, value = raw[first:end].partition(b':')
+        if colon:
+            name = known.get(key.strip())
+            yield name or key.decode('utf-8').strip(), value.decode('utf-8').strip()
+        first = end + 1
+
+# view[first:last] without the whitespace str.strip() would remove. a non-ASCII byte at
+# either end could be Unicode whitespace, so that rare case goes through str
+def _stripped_view(raw, view, first, last):
+    while first < last and raw[first] in _STRIP_BYTES:
+        first += 1
+    while last > first and raw[last - 1] in _STRIP_BYTES:
+        last -= 1
+    if first < last and (raw[first] >= 0x80 or raw[last - 1] >= 0x80):
+        return memoryview(raw[first:last].decode('utf-8').strip().encode('utf-8'))
+    return view[first:last]
+
+
 # creates a LSNP message from a dictionary of fields into a raw string
 # appends the terminating blank line (\n\n) as per MP spec
  
+# bytes-like values (e.g. bulk fields of a parsed message) are written as their text
 def craft_message(fields: dict) -> str:
-    lines = [f"{key}: {value}" for key, value in fields.items()]
-    return '\n'.join(lines) + '\n\n'
\ No newline at end of file
+    lines = [f"{key}: {bytes(value).decode('utf-8') if isinstance(value, (bytes, bytearray, memoryview)) else value}"
+             for key, value in fields.items()]
+    return '\n'.join(lines) + '\n\n'
+
+# the datagram for a message, to encode once and send as many times as needed
+def encode_message(fields: dict) -> bytes:
+    return craft_message(fields).encode('utf-8')
+
+
+# binary LSNP frame for messages whose bulk field would otherwise be base64 text:
+# the magic, a 2-byte big-endian header length, a text header in the usual key: value
+# format that names the bulk field in "BINARY: <field>", then that field's raw bytes.
+# only used with peers that advertised support; everything else stays text
+BINARY_MAGIC = b"LSNB"
+BINARY_PREFIX = struct.Struct("!4sH")
+
+def craft_binary_message(fields: dict, binary_field: str) -> bytes:
+    header = {key: value for key, value in fields.items() if key != binary_field}
+    header["BINARY"] = binary_field
+    header_bytes = craft_message(header).encode('utf-8')
+    return BINARY_PREFIX.pack(BINARY_MAGIC, len(header_bytes)) + header_bytes + bytes(fields[binary_field])
+
+def is_binary_message(data) -> bool:
+    return bytes(data[:4]) == BINARY_MAGIC
+
+# the bulk field comes back as a memoryview into data (no copy); BINARY is kept so
+# handlers can tell raw bytes from a text frame's base64
+def parse_binary_message(data) -> dict:
+    view = memoryview(data)
+    if len(view) < BINARY_PREFIX.size or not is_binary_message(view):
+        raise ValueError("Not a binary LSNP frame")
+    _, header_length = BINARY_PREFIX.unpack_from(view)
+    end = BINARY_PREFIX.size + header_length
+    if end > len(view):
+        raise ValueError("Truncated binary LSNP frame")
+    message = parse_message_bytes(bytes(view[BINARY_PREFIX.size:end]))
+    binary_field = message.get("BINARY")
+    if binary_field:
+        message[binary_field] = view[end:]
+    return message
+
+# a received datagram in either format: binary frames (whose bulk field is already raw) as
+# a dict, large text with a bulk field as a LazyMessage, so one dispatch drops never has
+# its DATA touched. anything else is cheaper to parse outright than to read lazily.
+# data may be a view of a receive buffer that is reused. short text is decoded straight
+# from it; large text is copied into bytes once, because LazyMessage searches with
+# bytes.find (memoryview has no find, and searching one from Python costs far more than
+# the copy) and a message queued for dispatch has to own its data anyway. a binary frame's
+# bulk field is still a view of data (copy_bulk() it if the message is kept past the next receive)
+def parse_datagram(data) -> Mapping:
+    if is_binary_message(data):
+        return parse_binary_message(data)
+    if len(data) < BULK_MIN_SIZE:
+        return parse_message(str(data, 'utf-8'))
+    raw = data if isinstance(data, bytes) else bytes(data)
+    if b'DATA' not in raw:
+        return parse_message(raw.decode('utf-8'))
+    return LazyMessage(raw)
+
+# detach a parsed binary frame from the (mutable) buffer it was received into, by copying
+# its bulk field; other messages from parse_datagram own their data already
+def copy_bulk(message):
+    if message.__class__ is dict:
+        value = message.get(message.get("BINARY"))
+        if isinstance(value, memoryview) and not isinstance(value.obj, bytes):
+            message[message["BINARY"]] = bytes(value)
+    return message
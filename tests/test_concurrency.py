@@ -0,0 +1,191 @@
+import unittest
+import contextlib
+import io
+import json
+import queue
+import tempfile
+import threading
+import time
+import sys
+import os
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from core.dispatch_pool import DispatchPool
+from core.message_dispatcher import dispatch
+from core.peer import PeerManager
+from utils.logger import Logger
+
+ME = "me@127.0.0.1"
+SENDERS = [f"user{i}@127.0.1.{i + 1}" for i in range(24)]
+ROUNDS = 100
+LIKE_EVERY = 5 # rounds between LIKEs (every LIKE rebuilds received_likes)
+
+def guarded(errors, func):
+    def run():
+        try:
+            func()
+        except Exception as e:
+            errors.append(e)
+    return run
+
+class TestPeerManagerConcurrency(unittest.TestCase):
+    """Listener, ACK watcher, expiry and shell threads mutating one PeerManager at once"""
+
+    def setUp(self):
+        self.old = (config.HISTORY_PEER_DMS, config.HISTORY_GROUP_MESSAGES, config.HISTORY_DIR)
+        config.HISTORY_PEER_DMS = config.HISTORY_GROUP_MESSAGES = len(SENDERS) * ROUNDS # nothing is dropped for the counts below
+        config.HISTORY_DIR = None
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6) # switch threads as often as possible, so races show up
+
+    def tearDown(self):
+        config.HISTORY_PEER_DMS, config.HISTORY_GROUP_MESSAGES, config.HISTORY_DIR = self.old
+        sys.setswitchinterval(self.switch_interval)
+
+    def make_peer_manager(self):
+        peer_manager = PeerManager(Logger(verbose=False))
+        peer_manager.own_profile = {"TYPE": "PROFILE", "USER_ID": ME, "DISPLAY_NAME": "Me"}
+        for user_id in SENDERS:
+            peer_manager.add_peer(user_id, user_id.split("@")[0], "ok")
+        peer_manager.handle_group_create({"GROUP_ID": "g0", "GROUP_NAME": "all", "FROM": SENDERS[0],
+                                          "MEMBERS": ",".join([ME] + SENDERS), "TIMESTAMP": "0"})
+        peer_manager.add_own_post("mine", 1700000000, 3600, "p0", None)
+        peer_manager.expiry.granularity = 0.01
+        return peer_manager
+
+    def listener(self, peer_manager, pool, acks, done):
+        now = int(time.time())
+        for round_ in range(ROUNDS):
+            for i, user_id in enumerate(SENDERS):
+                ip = user_id.split("@")[1]
+                pool.submit({"TYPE": "PROFILE", "USER_ID": user_id, "DISPLAY_NAME": f"user {round_}"}, ip, peer_manager)
+                pool.submit({"TYPE": "PROFILE", "USER_ID": f"guest{round_}@{ip}", "DISPLAY_NAME": "guest"}, ip, peer_manager) # peers keep growing
+                pool.submit({"TYPE": "DM", "FROM": user_id, "TO": ME, "CONTENT": "hi", "TIMESTAMP": str(now),
+                             "MESSAGE_ID": f"dm-{i}-{round_}", "TOKEN": f"{user_id}|{now + 3600}|chat"}, ip, peer_manager)
+                pool.submit({"TYPE": "POST", "USER_ID": user_id, "CONTENT": "post", "TIMESTAMP": str(now), "TTL": "3600",
+                             "MESSAGE_ID": f"post-{i}-{round_}", "TOKEN": f"{user_id}|{now + 3600}|broadcast"}, ip, peer_manager)
+                pool.submit({"TYPE": "GROUP_MESSAGE", "FROM": user_id, "GROUP_ID": "g0", "CONTENT": "yo",
+                             "TIMESTAMP": str(now), "MESSAGE_ID": f"gm-{i}-{round_}"}, ip, peer_manager)
+                pool.submit({"TYPE": "FOLLOW" if round_ % 2 == (ROUNDS - 1) % 2 else "UNFOLLOW", "FROM": user_id, "TO": ME,
+                             "MESSAGE_ID": f"f-{i}-{round_}"}, ip, peer_manager)
+                if round_ % LIKE_EVERY == 0:
+                    pool.submit({"TYPE": "LIKE", "FROM": user_id, "TO": ME, "POST_TIMESTAMP": str(1700000000 + round_),
+                                 "ACTION": "LIKE", "TIMESTAMP": str(now), "MESSAGE_ID": f"l-{i}-{round_}",
+                                 "TOKEN": f"{user_id}|{now + 3600}|broadcast"}, ip, peer_manager)
+            pool.submit({"TYPE": "GROUP_CREATE", "FROM": SENDERS[0], "GROUP_ID": f"g{round_ + 1}", "GROUP_NAME": "more",
+                         "MEMBERS": f"{ME},{SENDERS[0]}", "TIMESTAMP": str(now)}, "127.0.1.1", peer_manager)
+            while not acks.empty():
+                message_id, ip = acks.get()
+                pool.submit({"TYPE": "ACK", "MESSAGE_ID": message_id}, ip, peer_manager)
+        done.wait() # the ACK watcher has tracked everything
+        while not acks.empty():
+            message_id, ip = acks.get()
+            pool.submit({"TYPE": "ACK", "MESSAGE_ID": message_id}, ip, peer_manager)
+
+    # tracks outgoing messages and retransmits them until the listener delivers their ACKs
+    def ack_watcher(self, peer_manager, acks, done):
+        sent = []
+        for n in range(len(SENDERS) * ROUNDS // 4):
+            user_id = SENDERS[n % len(SENDERS)]
+            ip = user_id.split("@")[1]
+            message_id = f"out-{n}"
+            peer_manager.track_ack(message_id, {"TYPE": "DM", "MESSAGE_ID": message_id}, (ip, config.PORT))
+            acks.put((message_id, ip))
+            for message_id in sent[-8:]:
+                peer_manager.retransmit_due(message_id, send=lambda frame, addr: None)
+            sent.append(message_id)
+        done.set()
+
+    def shell(self, peer_manager, stop):
+        n = 0
+        while not stop.is_set():
+            n += 1
+            user_id = SENDERS[n % len(SENDERS)]
+            peer_manager.list_peers()
+            peer_manager.get_peer_ips()
+            peer_manager.get_known_peer_ips()
+            for other, peer in peer_manager.peer_items():
+                peer.has_avatar()
+            if n % 2:
+                peer_manager.follow(user_id)
+            else:
+                peer_manager.unfollow(user_id)
+            peer_manager.get_follower_ips()
+            peer_manager.add_like(user_id, 1700000000 + n % 7, "LIKE", "post")
+            peer_manager.issue_token(f"{ME}|{int(time.time())}|chat") # due at once: pruned by the expiry thread
+            peer_manager.show_peer_details(user_id, "user")
+            if n % 10 == 0:
+                peer_manager.create_group(f"s{n}", "mine", [ME, user_id])
+                peer_manager.update_group(f"s{n}", add_members=[SENDERS[0]])
+            peer_manager.list_groups()
+            details = peer_manager.get_group_details("g0")
+            self.assertLessEqual(len(details["messages"]), 10)
+            time.sleep(0)
+
+    def test_threads_do_not_lose_updates(self):
+        peer_manager = self.make_peer_manager()
+        pool = DispatchPool(dispatch, Logger(verbose=False), workers=4, queue_size=4096, overflow="block")
+        errors = []
+        acks = queue.Queue()
+        tracked, stop = threading.Event(), threading.Event()
+        threads = [
+            threading.Thread(target=guarded(errors, lambda: self.listener(peer_manager, pool, acks, tracked))),
+            threading.Thread(target=guarded(errors, lambda: self.ack_watcher(peer_manager, acks, tracked))),
+        ]
+        shell = threading.Thread(target=guarded(errors, lambda: self.shell(peer_manager, stop)))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            pool.start()
+            peer_manager.expiry.start()
+            shell.start()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(60)
+            deadline = time.time() + 30
+            while pool.get_stats()["processed"] < pool.get_stats()["enqueued"] and time.time() < deadline:
+                time.sleep(0.01)
+            stop.set()
+            shell.join(10)
+            pool.stop()
+            peer_manager.expiry.stop()
+            peer_manager.retransmit_scheduler.stop()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(pool.get_stats()["errors"], 0)
+        self.assertEqual(sum(len(peer_manager.peers[user_id].dms) for user_id in SENDERS), len(SENDERS) * ROUNDS)
+        self.assertEqual(peer_manager.groups["g0"]["messages"].total(), len(SENDERS) * ROUNDS)
+        self.assertEqual(len(peer_manager.peers), len(SENDERS) * (ROUNDS + 1))
+        self.assertEqual(len(peer_manager.received_likes), len(SENDERS) * len(range(0, ROUNDS, LIKE_EVERY)))
+        self.assertEqual(set(peer_manager.followers), set(SENDERS)) # the last round was a FOLLOW
+        self.assertEqual(len(peer_manager.followers), len(peer_manager.follower_ips))
+        self.assertEqual(peer_manager.pending_acks, {})
+
+    def test_pending_files_are_saved_from_many_threads(self):
+        peer_manager = self.make_peer_manager()
+        errors = []
+        with tempfile.TemporaryDirectory() as directory:
+            peer_manager.load_pending_files(os.path.join(directory, "pending_files.json"))
+
+            def offer_and_finish(worker):
+                for i in range(50):
+                    peer_manager.add_pending_file(f"f{worker}-{i}", __file__, None)
+                    if i % 2:
+                        peer_manager.remove_pending_file(f"f{worker}-{i}")
+
+            threads = [threading.Thread(target=guarded(errors, lambda worker=worker: offer_and_finish(worker))) for worker in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(30)
+            with open(peer_manager.pending_files_path) as f:
+                saved = json.load(f)
+        self.assertEqual(errors, []) # no thread lost the shared .tmp file to another's os.replace
+        self.assertEqual(sorted(saved), sorted(f"f{worker}-{i}" for worker in range(4) for i in range(0, 50, 2)))
+        self.assertEqual(saved, peer_manager.pending_files)
+
+if __name__ == '__main__':
+    unittest.main()
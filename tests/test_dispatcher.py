@@ -0,0 +1,245 @@
+import unittest
+import threading
+import time
+import sys
+import os
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from core.dispatch_pool import DispatchPool
+from core.handler_registry import HandlerRegistry
+from core.message_dispatcher import dispatch
+from core import message_dispatcher
+from core.peer import PeerManager
+from core.dedup_cache import SeenCache
+from parser.message_parser import craft_message, LazyMessage
+from utils.logger import Logger
+
+def make_peer_manager(user_id="me@127.0.0.1"):
+    peer_manager = PeerManager(Logger(verbose=False))
+    peer_manager.own_profile = {"TYPE": "PROFILE", "USER_ID": user_id, "DISPLAY_NAME": "Me"}
+    return peer_manager
+
+def make_dm(message_id="abc", to_user="me@127.0.0.1"):
+    now = int(time.time())
+    return {
+        "TYPE": "DM",
+        "FROM": "bob@127.0.0.2",
+        "TO": to_user,
+        "CONTENT": "hello",
+        "TIMESTAMP": str(now),
+        "MESSAGE_ID": message_id,
+        "TOKEN": f"bob@127.0.0.2|{now + 3600}|chat"
+    }
+
+class TestDispatchPool(unittest.TestCase):
+    """Staged receive -> queue -> worker dispatch"""
+
+    def test_per_sender_order_is_preserved(self):
+        seen = {}
+        lock = threading.Lock()
+
+        def record(message, addr, peer_manager):
+            with lock:
+                seen.setdefault(addr, []).append(int(message["SEQ"]))
+
+        pool = DispatchPool(record, Logger(verbose=False), workers=4, queue_size=4096)
+        pool.start()
+        for seq in range(200):
+            for sender in ("10.0.0.1", "10.0.0.2", "10.0.0.3"):
+                pool.submit({"TYPE": "DM", "SEQ": seq}, sender, None)
+        deadline = time.time() + 5
+        while pool.get_stats()["processed"] < 600 and time.time() < deadline:
+            time.sleep(0.01)
+        pool.stop()
+        for sender, order in seen.items():
+            self.assertEqual(order, list(range(200)), sender)
+
+    def test_drain_waits_for_queued_and_running_messages(self):
+        handled = []
+        pool = DispatchPool(lambda m, a, p: time.sleep(0.01) or handled.append(m["SEQ"]), Logger(verbose=False), workers=2, queue_size=64)
+        pool.start()
+        for seq in range(20):
+            pool.submit({"SEQ": seq}, f"10.0.0.{seq % 2}", None)
+        self.assertTrue(pool.drain(timeout=5))
+        self.assertEqual(sorted(handled), list(range(20))) # none still queued or being handled
+        pool.stop()
+
+    def test_overflow_policies(self):
+        blocker = threading.Event()
+        pool = DispatchPool(lambda m, a, p: blocker.wait(), Logger(verbose=False), workers=1, queue_size=2, overflow="drop-newest")
+        pool.start()
+        pool.submit({"SEQ": 0}, "10.0.0.1", None)
+        while pool.get_stats()["depth"]:
+            time.sleep(0.01) # worker is now stuck on message 0
+        for seq in range(1, 5):
+            pool.submit({"SEQ": seq}, "10.0.0.1", None)
+        stats = pool.get_stats()
+        self.assertEqual(stats["depth"], 2)
+        self.assertEqual(stats["dropped_newest"], 2)
+        blocker.set()
+        pool.stop()
+
+        pool = DispatchPool(lambda m, a, p: None, Logger(verbose=False), workers=1, queue_size=2, overflow="drop-oldest")
+        for seq in range(5):
+            pool.submit({"SEQ": seq}, "10.0.0.1", None)
+        self.assertEqual([item[1]["SEQ"] for item in pool.lanes[0].queue], [3, 4])
+        self.assertEqual(pool.get_stats()["dropped_oldest"], 3)
+
+        blocker = threading.Event()
+        pool = DispatchPool(lambda m, a, p: blocker.wait(), Logger(verbose=False), workers=1, queue_size=1, overflow="block")
+        pool.start()
+        pool.submit({"SEQ": 0}, "10.0.0.1", None)
+        while pool.get_stats()["depth"]:
+            time.sleep(0.01)
+        pool.submit({"SEQ": 1}, "10.0.0.1", None) # fills the lane
+        results = []
+        submitter = threading.Thread(target=lambda: results.append(pool.submit({"SEQ": 2}, "10.0.0.1", None)))
+        submitter.start()
+        while not pool.get_stats()["blocked"]:
+            time.sleep(0.01)
+        pool.stop() # wakes the blocked submitter, which drops its message
+        submitter.join(5)
+        blocker.set()
+        self.assertEqual(results, [False])
+        self.assertEqual(pool.get_stats()["depth"], 1)
+
+        with self.assertRaises(ValueError):
+            DispatchPool(lambda m, a, p: None, Logger(verbose=False), overflow="random")
+
+class TestHandlerRegistry(unittest.TestCase):
+    """Table-driven dispatch"""
+
+    def setUp(self):
+        self.acks = []
+        self.original_send_ack = message_dispatcher.send_ack
+        message_dispatcher.send_ack = lambda message_id, addr: self.acks.append(message_id)
+        self.original_registry = message_dispatcher.registry
+        message_dispatcher.registry = HandlerRegistry()
+        message_dispatcher.registry.handlers = dict(self.original_registry.handlers)
+
+    def tearDown(self):
+        message_dispatcher.send_ack = self.original_send_ack
+        message_dispatcher.registry = self.original_registry
+
+    def test_dm_is_stored_acked_and_counted(self):
+        peer_manager = make_peer_manager()
+        dispatch(make_dm(), "127.0.0.2", peer_manager)
+        self.assertEqual(len(peer_manager.peers["bob@127.0.0.2"].dms), 1)
+        self.assertEqual(self.acks, ["abc"])
+        stats = message_dispatcher.registry.get_stats()["DM"]
+        self.assertEqual((stats["received"], stats["handled"]), (1, 1))
+        self.assertEqual(sum(stats["histogram"]), 1)
+
+    def test_declared_checks_drop_before_handler(self):
+        peer_manager = make_peer_manager()
+        dispatch(make_dm(to_user="someone@127.0.0.9"), "127.0.0.2", peer_manager)
+        malformed = make_dm()
+        del malformed["CONTENT"]
+        dispatch(malformed, "127.0.0.2", peer_manager)
+        self.assertNotIn("bob@127.0.0.2", peer_manager.peers)
+        self.assertEqual(self.acks, [])
+        self.assertEqual(message_dispatcher.registry.get_stats()["DM"]["dropped"], 2)
+
+    def test_retransmitted_dm_is_reacked_but_not_stored_twice(self):
+        peer_manager = make_peer_manager()
+        dispatch(make_dm(), "127.0.0.2", peer_manager)
+        dispatch(make_dm(), "127.0.0.2", peer_manager)
+        self.assertEqual(len(peer_manager.peers["bob@127.0.0.2"].dms), 1)
+        self.assertEqual(self.acks, ["abc", "abc"])
+        self.assertEqual(message_dispatcher.registry.get_stats()["DM"]["duplicates"], 1)
+        self.assertEqual(peer_manager.seen_messages.get_stats()["hits"], 1)
+
+    def test_failed_handler_leaves_the_message_for_its_retransmission(self):
+        peer_manager = make_peer_manager()
+        add_dm = peer_manager.add_dm
+        def fail_once(*args):
+            peer_manager.add_dm = add_dm
+            raise OSError("disk full")
+        peer_manager.add_dm = fail_once
+        with self.assertRaises(OSError):
+            dispatch(make_dm(), "127.0.0.2", peer_manager)
+        self.assertEqual(self.acks, []) # so the sender retransmits
+        dispatch(make_dm(), "127.0.0.2", peer_manager)
+        self.assertEqual(len(peer_manager.peers["bob@127.0.0.2"].dms), 1)
+        self.assertEqual(self.acks, ["abc"])
+        stats = message_dispatcher.registry.get_stats()["DM"]
+        self.assertEqual((stats["errors"], stats["handled"], stats["duplicates"]), (1, 1, 0))
+
+    def test_lazy_messages_are_dropped_without_decoding_the_rest(self):
+        peer_manager = make_peer_manager()
+        not_for_me = LazyMessage(craft_message(make_dm(to_user="someone@127.0.0.9")).encode())
+        dispatch(not_for_me, "127.0.0.2", peer_manager)
+        post = LazyMessage(b"TYPE: POST\nUSER_ID: stranger@127.0.0.9\nCONTENT: hi\nTTL: 3600\n\n")
+        dispatch(post, "127.0.0.9", peer_manager)
+        chunk = LazyMessage(craft_message({
+            "TYPE": "FILE_CHUNK", "FROM": "bob@127.0.0.2", "FILEID": "f1", "CHUNK_INDEX": 0, "TOTAL_CHUNKS": 1,
+            "TOKEN": "bob@127.0.0.2|1|file", "DATA": "QUJD" * 10000,
+        }).encode())
+        dispatch(chunk, "127.0.0.2", peer_manager)
+        self.assertNotIn("CONTENT", not_for_me.decoded())
+        self.assertEqual(post.decoded(), {"TYPE", "USER_ID"})
+        self.assertIn("TOKEN", chunk.decoded()) # expired token
+        self.assertEqual(chunk.decoded(), {"TYPE", "TOKEN"}) # DATA is never touched
+        stats = message_dispatcher.registry.get_stats()
+        self.assertEqual((stats["DM"]["dropped"], stats["POST"]["dropped"], stats["FILE_CHUNK"]["dropped"]), (1, 1, 1))
+
+    def test_only_accepted_messages_are_logged(self):
+        peer_manager = PeerManager(Logger(verbose=True))
+        peer_manager.own_profile = {"TYPE": "PROFILE", "USER_ID": "me@127.0.0.1", "DISPLAY_NAME": "Me"}
+        logged = []
+        peer_manager.logger.log = lambda tag, message: logged.append((tag, message))
+        post = LazyMessage(b"TYPE: POST\nUSER_ID: stranger@127.0.0.9\nCONTENT: hi\nTTL: 3600\n\n")
+        dispatch(post, "127.0.0.9", peer_manager)
+        dispatch(LazyMessage(b"TYPE: NOPE\n\n"), "127.0.0.9", peer_manager)
+        self.assertEqual(logged, [("DROP !", "POST from 127.0.0.9: ignored by its handler"),
+                                  ("DROP !", "NOPE from 127.0.0.9: unknown TYPE")]) # one line each, not the message
+        self.assertEqual(post.decoded(), {"TYPE", "USER_ID"})
+
+        logged.clear()
+        dispatch(LazyMessage(craft_message(make_dm("x", "carol@127.0.0.3")).encode()), "127.0.0.2", peer_manager)
+        self.assertEqual(logged, [("DROP !", "Ignored DM not addressed to me: carol@127.0.0.3")]) # failed check: its reason
+
+        logged.clear()
+        dm = LazyMessage(craft_message(make_dm()).encode())
+        dispatch(dm, "127.0.0.2", peer_manager)
+        dispatch(LazyMessage(craft_message(make_dm()).encode()), "127.0.0.2", peer_manager) # retransmission
+        self.assertEqual([tag for tag, message in logged], ["RECV <"])
+        self.assertIn("CONTENT: hello\n", logged[0][1])
+
+        logged.clear()
+        peer_manager.logger.verbose = False
+        dispatch(LazyMessage(b"TYPE: NOPE\n\n"), "127.0.0.9", peer_manager)
+        self.assertEqual(logged, [])
+
+    def test_new_types_plug_in_without_editing_dispatch(self):
+        seen = []
+
+        @message_dispatcher.registry.register("CUSTOM", required_fields=("VALUE",))
+        def handle_custom(message, addr, peer_manager):
+            seen.append(message["VALUE"])
+
+        dispatch({"TYPE": "CUSTOM", "VALUE": "1"}, "127.0.0.2", make_peer_manager())
+        dispatch({"TYPE": "NOPE"}, "127.0.0.2", make_peer_manager())
+        self.assertEqual(seen, ["1"])
+        self.assertEqual(message_dispatcher.registry.get_stats()["NOPE"]["dropped"], 1)
+
+class TestSeenCache(unittest.TestCase):
+    """LRU + TTL duplicate suppression"""
+
+    def test_ttl_and_capacity(self):
+        cache = SeenCache(capacity=2, ttl=10)
+        self.assertFalse(cache.check_and_add("a", now=0))
+        self.assertTrue(cache.check_and_add("a", now=5))
+        self.assertFalse(cache.check_and_add("b", now=6))
+        self.assertFalse(cache.check_and_add("c", now=7)) # evicts "a"
+        self.assertFalse(cache.check_and_add("a", now=8))
+        self.assertFalse(cache.check_and_add("c", now=20)) # everything expired
+        stats = cache.get_stats()
+        self.assertEqual((stats["hits"], stats["evicted"]), (1, 2))
+        self.assertEqual(len(cache), 1)
+
+if __name__ == '__main__':
+    unittest.main()
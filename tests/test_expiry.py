@@ -0,0 +1,100 @@
+import unittest
+import time
+import sys
+import os
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from core.expiry import ExpiryEngine
+from core.peer import PeerManager
+from utils.logger import Logger
+
+def make_peer_manager(user_id="me@127.0.0.1"):
+    peer_manager = PeerManager(Logger(verbose=False))
+    peer_manager.own_profile = {"TYPE": "PROFILE", "USER_ID": user_id, "DISPLAY_NAME": "Me"}
+    return peer_manager
+
+class TestExpiryEngine(unittest.TestCase):
+    """Min-heap of expiry times with per-kind pruners"""
+
+    def test_due_containers_are_pruned_once_per_pass(self):
+        calls = []
+        engine = ExpiryEngine(granularity=1)
+        engine.register("items", lambda container, items: calls.append((id(container), sorted(items))) or len(items))
+        a, b = [], []
+        for expires_at in (30, 10, 20):
+            engine.track("items", a, expires_at, expires_at)
+        engine.track("items", b, "b", 40)
+        self.assertEqual(engine.next_deadline(), 10)
+        self.assertEqual(engine.run_due(now=5), 0)
+        self.assertEqual(engine.run_due(now=30), 3)
+        self.assertEqual(calls, [(id(a), [10, 20, 30])]) # one prune for a's three entries
+        self.assertEqual(engine.pump(now=39.5), 1) # never sleeps less than the granularity
+        self.assertEqual(engine.pump(now=50), None)
+        stats = engine.get_stats()
+        self.assertEqual((stats["evicted"]["items"], stats["passes"], stats["pending"]), (4, 2, 0))
+        self.assertEqual(calls[1], (id(b), ["b"]))
+
+class TestPeerManagerExpiry(unittest.TestCase):
+    """Posts, DMs and tokens are evicted once expired"""
+
+    def test_expired_state_is_evicted(self):
+        peer_manager = make_peer_manager()
+        now = int(time.time())
+        peer_manager.follow("bob@127.0.0.2")
+        peer_manager.add_post("bob@127.0.0.2", "short", now, 60, "p1", f"bob@127.0.0.2|{now + 3600}|broadcast")
+        peer_manager.add_post("bob@127.0.0.2", "long", now, 3600, "p2", f"bob@127.0.0.2|{now + 3600}|broadcast")
+        peer_manager.add_dm("bob@127.0.0.2", "hi", now, "d1", f"bob@127.0.0.2|{now + 120}|chat")
+        peer_manager.add_own_post("mine", now, 60, "p3", f"me@127.0.0.1|{now + 60}|broadcast")
+        peer_manager.issue_token(f"me@127.0.0.1|{now + 60}|broadcast")
+        peer_manager.issue_token(f"me@127.0.0.1|{now + 7200}|chat")
+        peer_manager.revoke_token(f"bob@127.0.0.2|{now + 300}|chat")
+        peer_manager.revoke_token(f"bob@127.0.0.2|{now - 1}|chat") # already expired: not kept
+        peer_manager.revoke_token("malformed")
+        self.assertEqual(len(peer_manager.revoked_tokens), 1)
+
+        peer_manager.expiry.run_due(now=now + 61)
+        peer = peer_manager.peers["bob@127.0.0.2"]
+        self.assertEqual([post.message_id for post in peer.posts], ["p2"])
+        self.assertEqual(len(peer.dms), 1)
+        self.assertEqual(len(peer_manager.own_posts), 0)
+        self.assertEqual(list(peer_manager.issued_tokens), [f"me@127.0.0.1|{now + 7200}|chat"])
+
+        peer_manager.expiry.run_due(now=now + 7200)
+        self.assertEqual((list(peer.posts), list(peer.dms), peer_manager.issued_tokens, peer_manager.revoked_tokens), ([], [], {}, set()))
+        self.assertEqual(peer_manager.expiry.get_stats()["evicted"],
+                         {"posts": 3, "dms": 1, "issued_tokens": 2, "revoked_tokens": 1})
+        self.assertEqual(len(peer_manager.expiry), 0)
+
+    def test_dropped_records_are_not_kept_alive(self):
+        peer_manager = make_peer_manager()
+        now = int(time.time())
+        peer_manager.follow("bob@127.0.0.2")
+        for i in range(2000):
+            peer_manager.add_post("bob@127.0.0.2", f"post {i}", now, 10**9, f"p{i}", None)
+        peer = peer_manager.peers["bob@127.0.0.2"]
+        self.assertEqual(len(peer.posts), config.HISTORY_PEER_POSTS)
+        self.assertEqual(len(peer_manager.expiry), config.HISTORY_PEER_POSTS) # dropped posts were forgotten
+        self.assertLess(len(peer_manager.expiry.heap), 2 * config.HISTORY_PEER_POSTS + 2)
+        self.assertLessEqual(peer_manager.expiry.next_deadline(), time.time() + config.MAX_TTL) # TTL clamped
+        self.assertEqual(peer_manager.expiry.run_due(now=now + config.MAX_TTL + 1), config.HISTORY_PEER_POSTS)
+        self.assertEqual((len(peer.posts), len(peer_manager.expiry)), (0, 0))
+
+    def test_thread_evicts_when_due(self):
+        peer_manager = make_peer_manager()
+        peer_manager.expiry.granularity = 0.01
+        peer_manager.expiry.start()
+        try:
+            peer_manager.issue_token(f"me@127.0.0.1|{int(time.time()) + 3600}|chat")
+            peer_manager.issue_token(f"me@127.0.0.1|{int(time.time())}|chat") # due now
+            deadline = time.time() + 3
+            while len(peer_manager.issued_tokens) > 1 and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            peer_manager.expiry.stop()
+        self.assertEqual(len(peer_manager.issued_tokens), 1)
+
+if __name__ == '__main__':
+    unittest.main()
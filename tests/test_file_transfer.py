@@ -0,0 +1,441 @@
+import unittest
+import contextlib
+import io
+import tempfile
+import base64
+import hashlib
+import json
+import sys
+import os
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import core.file_transfer as file_transfer
+from core.file_transfer import ChunkBitmap, OutgoingTransfer, StreamTransfer, IncomingTransfer, handle_file_chunk, resume_incoming, parse_ranges
+from core.transfer_scheduler import TransferScheduler
+from core.peer import PeerManager
+from parser.message_parser import parse_message, parse_datagram
+from utils.chunk_frames import ChunkFrames, DIGEST_FIELD
+import utils.network_utils as network_utils
+from utils.network_utils import choose_chunk_size, handle_file_offer, accept_file_offer, reject_file_offer
+from utils.logger import Logger
+
+def make_peer_manager(user_id):
+    peer_manager = PeerManager(Logger(verbose=False))
+    peer_manager.own_profile = {"TYPE": "PROFILE", "USER_ID": user_id, "DISPLAY_NAME": user_id}
+    return peer_manager
+
+# send one transfer to completion the way the transfer thread does
+def drive(transfer, send):
+    scheduler = TransferScheduler()
+    scheduler.add(transfer)
+    while scheduler.get_stats()["active"]:
+        scheduler.wakeup.clear()
+        timeout = scheduler.pump(send)
+        if timeout != 0:
+            scheduler.wakeup.wait(config.ACK_TIMEOUT if timeout is None else timeout)
+
+class TestChunkBitmap(unittest.TestCase):
+    """Received-chunk bookkeeping"""
+
+    def test_base_and_window(self):
+        bitmap = ChunkBitmap(20)
+        for index in (0, 1, 3, 5):
+            self.assertTrue(bitmap.add(index))
+        self.assertFalse(bitmap.add(3))
+        self.assertEqual(bitmap.base, 2)
+        self.assertEqual(bitmap.count, 4)
+        # bits relative to base 2: index 3 -> bit 1, index 5 -> bit 3
+        self.assertEqual(bitmap.window_hex(8), "a")
+        bitmap.add(2)
+        bitmap.add(4)
+        self.assertEqual(bitmap.base, 6)
+        self.assertFalse(bitmap.complete())
+
+class TestChunkFrames(unittest.TestCase):
+    """Memory-mapped FILE_CHUNK frames"""
+
+    def test_frames_parse_like_crafted_messages(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "source.bin")
+            data = os.urandom(1000 * 11 + 7)
+            with open(source, "wb") as f:
+                f.write(data)
+            frames = ChunkFrames(source, "f1", "alice@127.0.0.1", "bob@127.0.0.1", "tok", 1000)
+            self.assertEqual(frames.total_chunks, 12)
+            received = b""
+            for index in range(frames.total_chunks):
+                message = parse_message(bytes(frames.frame(index, sack_now=index == 11)).decode("utf-8"))
+                self.assertEqual(int(message["CHUNK_INDEX"]), index)
+                self.assertEqual(message["SACK_NOW"], "1" if index == 11 else "0")
+                self.assertEqual((message["TYPE"], message["FILEID"], message["TOKEN"]), ("FILE_CHUNK", "f1", "tok"))
+                received += base64.b64decode(message["DATA"])
+            frames.close()
+            self.assertEqual(received, data)
+
+    def test_chunk_size_fits_the_mtu(self):
+        old = (config.FILE_MTU, config.FILE_JUMBO)
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                source = os.path.join(tmp, "source.bin")
+                with open(source, "wb") as f:
+                    f.write(os.urandom(300000))
+                for mtu, jumbo, limit in ((1500, False, 1472), (9000, False, 8972), (1500, True, 65507)):
+                    config.FILE_MTU, config.FILE_JUMBO = mtu, jumbo
+                    chunk_size = choose_chunk_size("f1", "alice@127.0.0.1", "bob@127.0.0.1", "alice@127.0.0.1|1700000000|file", 300000)
+                    frames = ChunkFrames(source, "f1", "alice@127.0.0.1", "bob@127.0.0.1", "alice@127.0.0.1|1700000000|file", chunk_size)
+                    sizes = [len(frames.frame(index, True)) for index in range(frames.total_chunks)]
+                    frames.close()
+                    self.assertLessEqual(max(sizes), limit)
+                    # only base64 rounding, digit-width slack and the room kept for the last chunk's digest left over
+                    self.assertGreater(max(sizes), limit - 24 - len(DIGEST_FIELD))
+        finally:
+            config.FILE_MTU, config.FILE_JUMBO = old
+
+    def test_binary_frames_carry_raw_chunks(self):
+        old = config.FILE_MTU
+        try:
+            config.FILE_MTU = 1500
+            with tempfile.TemporaryDirectory() as tmp:
+                source = os.path.join(tmp, "source.bin")
+                data = os.urandom(100000)
+                with open(source, "wb") as f:
+                    f.write(data)
+                token = "alice@127.0.0.1|1700000000|file"
+                text_size = choose_chunk_size("f1", "alice@127.0.0.1", "bob@127.0.0.1", token, len(data))
+                chunk_size = choose_chunk_size("f1", "alice@127.0.0.1", "bob@127.0.0.1", token, len(data), binary=True)
+                self.assertGreater(chunk_size, text_size * 5 // 4) # no base64 inflation
+                frames = ChunkFrames(source, "f1", "alice@127.0.0.1", "bob@127.0.0.1", token, chunk_size, binary=True)
+                received = b""
+                for index in range(frames.total_chunks):
+                    frame = frames.frame(index, sack_now=index == 0)
+                    self.assertLessEqual(len(frame), 1472)
+                    message = parse_datagram(frame)
+                    self.assertEqual(int(message["CHUNK_INDEX"]), index)
+                    self.assertEqual(message["SACK_NOW"], "1" if index == 0 else "0")
+                    received += bytes(message["DATA"])
+                frames.close()
+                self.assertEqual(received, data)
+        finally:
+            config.FILE_MTU = old
+
+class TestIncomingTransfer(unittest.TestCase):
+    """Chunks streamed to a preallocated part file"""
+
+    def test_out_of_order_writes_land_at_their_offset(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            target = os.path.join(tmp, "out.bin")
+            incoming = IncomingTransfer(target, 10, 3, 4)
+            self.assertEqual(os.path.getsize(target + ".part"), 10) # preallocated up front
+            self.assertTrue(incoming.write(2, b"89"))
+            self.assertTrue(incoming.write(0, b"0123"))
+            self.assertFalse(incoming.write(2, b"89"))
+            self.assertEqual(incoming.chunk_length(2), 2)
+            incoming.write(1, b"4567")
+            self.assertTrue(incoming.received.complete())
+            incoming.finish()
+            self.assertFalse(os.path.exists(target + ".part"))
+            with open(target, "rb") as f:
+                self.assertEqual(f.read(), b"0123456789")
+
+class TestWindowedTransfer(unittest.TestCase):
+    """Sender and receiver wired back to back over a lossy link"""
+
+    def setUp(self):
+        self.old = (config.ACK_TIMEOUT, config.RTO_MIN, config.RTO_JITTER, file_transfer.send_message)
+        config.ACK_TIMEOUT, config.RTO_MIN, config.RTO_JITTER = 0.05, 0.01, 0
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        config.ACK_TIMEOUT, config.RTO_MIN, config.RTO_JITTER, file_transfer.send_message = self.old
+        self.tmp.cleanup()
+
+    def test_lost_chunks_are_resent_selectively(self):
+        data = os.urandom(4096 * 40 + 123)
+        source = os.path.join(self.tmp.name, "source.bin")
+        target = os.path.join(self.tmp.name, "target.bin")
+        with open(source, "wb") as f:
+            f.write(data)
+
+        sender = make_peer_manager("alice@127.0.0.1")
+        receiver = make_peer_manager("bob@127.0.0.1")
+        receiver.file_transfer_context["f1"] = {
+            "accepted": True, "from": "alice@127.0.0.1", "filename": target, "filesize": len(data),
+            "token": "t", "total_chunks": None, "transfer": None,
+        }
+        transfer = OutgoingTransfer(sender, "f1", source, "bob@127.0.0.1", "t")
+
+        # receiver replies go straight back to the sender
+        def reply(message, addr):
+            if message["TYPE"] == "FILE_SACK":
+                transfer.on_sack(int(message["BASE"]), message["BITMAP"])
+            elif message["TYPE"] == "FILE_RECEIVED":
+                transfer.mark_complete()
+        file_transfer.send_message = reply
+
+        # drop the first transmission of every 7th chunk, including the last one
+        delivered = []
+        def lossy_send(frame, addr):
+            message = parse_datagram(bytes(frame)) # as the receive loop parses it
+            index = int(message["CHUNK_INDEX"])
+            if (index % 7 == 6 or index == transfer.total_chunks - 1) and index not in transfer.resent:
+                return
+            delivered.append(index)
+            handle_file_chunk(message, receiver)
+        drive(transfer, lossy_send)
+
+        self.assertIsNone(transfer.failed)
+        with open(target, "rb") as f:
+            self.assertEqual(f.read(), data)
+        dropped = [i for i in range(transfer.total_chunks) if i % 7 == 6 or i == transfer.total_chunks - 1]
+        self.assertEqual(transfer.stats["retransmits"], len(dropped))
+        self.assertEqual(sorted(delivered), list(range(transfer.total_chunks)))
+        self.assertGreater(transfer.goodput(), 0)
+        self.assertTrue(transfer.frames.file.closed)
+
+    def run_corrupting(self, data, corrupt):
+        source = os.path.join(self.tmp.name, "source.bin")
+        target = os.path.join(self.tmp.name, "target.bin")
+        with open(source, "wb") as f:
+            f.write(data)
+        sender = make_peer_manager("alice@127.0.0.1")
+        receiver = make_peer_manager("bob@127.0.0.1")
+        receiver.file_transfer_context["f1"] = {
+            "accepted": True, "from": "alice@127.0.0.1", "filename": target, "filesize": len(data),
+            "token": "t", "total_chunks": None, "transfer": None,
+        }
+        transfer = OutgoingTransfer(sender, "f1", source, "bob@127.0.0.1", "t")
+        replies = []
+        def reply(message, addr):
+            replies.append(message)
+            if message["TYPE"] == "FILE_SACK":
+                corrupt_indexes = [int(i) for i in filter(None, message.get("CORRUPT", "").split(","))]
+                transfer.on_sack(int(message["BASE"]), message["BITMAP"], corrupt=corrupt_indexes)
+            elif message["TYPE"] == "FILE_RECEIVED" and message["STATUS"] == "COMPLETE":
+                transfer.mark_complete()
+            elif message["TYPE"] == "FILE_RECEIVED":
+                transfer.cancel("receiver's SHA-256 did not match")
+        file_transfer.send_message = reply
+
+        def send(frame, addr):
+            message = parse_message(bytes(frame).decode("utf-8"))
+            corrupt(message, transfer)
+            handle_file_chunk(message, receiver)
+        drive(transfer, send)
+        return transfer, receiver.file_transfer_context["f1"]["transfer"], replies, target
+
+    def test_corrupt_chunk_is_resent_at_once(self):
+        data = os.urandom(4096 * 20)
+        def flip_once(message, transfer):
+            if message["CHUNK_INDEX"] == "05" and 5 not in transfer.resent:
+                raw = bytearray(base64.b64decode(message["DATA"]))
+                raw[100] ^= 0xFF
+                message["DATA"] = base64.b64encode(bytes(raw)).decode()
+        transfer, incoming, replies, target = self.run_corrupting(data, flip_once)
+        self.assertIsNone(transfer.failed)
+        self.assertEqual(transfer.stats["corrupt"], 1)
+        self.assertEqual(transfer.stats["timeouts"], 0) # re-requested by FILE_SACK, not by a timeout
+        self.assertIn("5", [sack.get("CORRUPT") for sack in replies if sack["TYPE"] == "FILE_SACK"])
+        self.assertTrue(incoming.digest_matches())
+        self.assertGreater(transfer.frames.hash_seconds, 0)
+        with open(target, "rb") as f:
+            self.assertEqual(f.read(), data)
+
+    def test_file_digest_mismatch_discards_the_file(self):
+        data = os.urandom(4096 * 10)
+        def wrong_digest(message, transfer):
+            if "SHA256" in message:
+                message["SHA256"] = "0" * 64
+        transfer, incoming, replies, target = self.run_corrupting(data, wrong_digest)
+        self.assertEqual(transfer.failed, "receiver's SHA-256 did not match")
+        self.assertEqual(replies[-1]["STATUS"], "CORRUPT")
+        self.assertFalse(os.path.exists(target))
+        self.assertFalse(os.path.exists(target + ".part"))
+
+class TestResume(unittest.TestCase):
+    """Restarting a receiver from its manifest"""
+
+    def setUp(self):
+        self.old = (config.FILE_MANIFEST_EVERY, config.ACK_TIMEOUT, config.RTO_MIN, file_transfer.send_message)
+        config.FILE_MANIFEST_EVERY, config.ACK_TIMEOUT, config.RTO_MIN = 4, 0.05, 0.01
+        self.sent = []
+        file_transfer.send_message = lambda message, addr: self.sent.append(message)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data = os.urandom(1000 * 39 + 500)
+        self.source = os.path.join(self.tmp.name, "source.bin")
+        self.target = os.path.join(self.tmp.name, "target.bin")
+        with open(self.source, "wb") as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        config.FILE_MANIFEST_EVERY, config.ACK_TIMEOUT, config.RTO_MIN, file_transfer.send_message = self.old
+        self.tmp.cleanup()
+
+    # deliver some chunks, then drop the receiver without finishing (as if it crashed)
+    def partial_receive(self, indices):
+        receiver = make_peer_manager("bob@127.0.0.1")
+        receiver.file_transfer_context["f1"] = {
+            "accepted": True, "from": "alice@127.0.0.1", "filename": self.target, "filesize": len(self.data),
+            "token": "t", "total_chunks": None, "transfer": None,
+        }
+        frames = ChunkFrames(self.source, "f1", "alice@127.0.0.1", "bob@127.0.0.1", "t", 1000)
+        for index in indices:
+            handle_file_chunk(parse_message(bytes(frames.frame(index)).decode("utf-8")), receiver)
+        frames.close()
+        os.close(receiver.file_transfer_context["f1"]["transfer"].fd)
+
+    def test_only_missing_chunks_are_resent(self):
+        self.partial_receive(list(range(25)) + [30, 31, 32])
+        receiver = make_peer_manager("bob@127.0.0.1")
+        resume_incoming(receiver, self.target + ".part.json")
+        resume = self.sent[-1]
+        self.assertEqual((resume["TYPE"], resume["RANGES"]), ("FILE_RESUME", "0-24,30-32"))
+
+        sender = make_peer_manager("alice@127.0.0.1")
+        transfer = OutgoingTransfer(sender, "f1", self.source, "bob@127.0.0.1", "t2", chunk_size=1000,
+                                    received_ranges=parse_ranges(resume["RANGES"]))
+        def reply(message, addr):
+            if message["TYPE"] == "FILE_SACK":
+                transfer.on_sack(int(message["BASE"]), message["BITMAP"])
+            elif message["TYPE"] == "FILE_RECEIVED":
+                transfer.mark_complete()
+        file_transfer.send_message = reply
+        drive(transfer, lambda frame, addr: handle_file_chunk(parse_message(bytes(frame).decode("utf-8")), receiver))
+
+        self.assertEqual(transfer.stats["chunks_sent"], 40 - 28)
+        self.assertFalse(os.path.exists(self.target + ".part.json"))
+        with open(self.target, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_digest_is_resent_when_the_last_chunk_was_already_received(self):
+        self.partial_receive(list(range(19)) + [39])
+        manifest_path = self.target + ".part.json"
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        self.assertIn(39, ChunkBitmap.from_bytes(40, base64.b64decode(manifest["bitmap"])))
+        manifest["sha256"] = None # as if the digest never made it to disk
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f)
+        receiver = make_peer_manager("bob@127.0.0.1")
+        incoming = resume_incoming(receiver, manifest_path)["transfer"]
+        resume = self.sent[-1]
+        self.assertEqual(resume["RANGES"], "0-18,39-39")
+
+        sender = make_peer_manager("alice@127.0.0.1")
+        transfer = OutgoingTransfer(sender, "f1", self.source, "bob@127.0.0.1", "t2", chunk_size=1000,
+                                    received_ranges=parse_ranges(resume["RANGES"]))
+        def reply(message, addr):
+            if message["TYPE"] == "FILE_SACK":
+                transfer.on_sack(int(message["BASE"]), message["BITMAP"])
+            elif message["TYPE"] == "FILE_RECEIVED":
+                transfer.mark_complete()
+                self.assertEqual(message["STATUS"], "COMPLETE")
+        file_transfer.send_message = reply
+        drive(transfer, lambda frame, addr: handle_file_chunk(parse_message(bytes(frame).decode("utf-8")), receiver))
+
+        self.assertEqual(incoming.expected_sha256, hashlib.sha256(self.data).hexdigest()) # checked, not skipped
+        with open(self.target, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_corrupted_part_file_starts_over(self):
+        self.partial_receive(range(8))
+        with open(self.target + ".part", "r+b") as f:
+            f.write(b"garbage")
+        incoming = IncomingTransfer.from_manifest(self.target + ".part.json")
+        self.assertEqual(incoming.received.count, 0)
+        incoming.abort()
+
+class TestFileOffer(unittest.TestCase):
+    """Offers wait for the shell's accept / reject instead of prompting on the receive path"""
+
+    def setUp(self):
+        self.old_send = network_utils.send_message
+        self.sent = []
+        network_utils.send_message = lambda message, addr: self.sent.append(message)
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        network_utils.send_message = self.old_send
+        self.tmp.cleanup()
+
+    def offer(self, receiver, file_id, filesize="2500"):
+        handle_file_offer({"TYPE": "FILE_OFFER", "FROM": "alice@127.0.0.1", "TO": "bob@127.0.0.1", "FILEID": file_id,
+                           "FILENAME": os.path.join(self.tmp.name, f"{file_id}.bin"), "FILESIZE": filesize,
+                           "FILETYPE": "application/octet-stream", "TOKEN": "t", "CHUNK_SIZE": "1000"}, receiver)
+
+    def test_offers_are_answered_from_the_shell(self):
+        receiver = make_peer_manager("bob@127.0.0.1")
+        self.offer(receiver, "f1")
+        self.offer(receiver, "f2")
+        self.assertEqual(sorted(receiver.file_offers), ["f1", "f2"])
+        self.assertEqual(self.sent, [])
+
+        self.assertTrue(accept_file_offer("f1", receiver))
+        self.assertEqual((self.sent[-1]["TYPE"], self.sent[-1]["FILEID"]), ("FILE_ACCEPTED", "f1"))
+        transfer = receiver.file_transfer_context["f1"]["transfer"]
+        self.assertEqual(transfer.total_chunks, 3)
+        transfer.abort()
+
+        self.assertTrue(reject_file_offer("f2", receiver))
+        self.assertFalse(receiver.file_transfer_context["f2"]["accepted"])
+        self.assertFalse(accept_file_offer("f2", receiver))
+        self.assertEqual(receiver.file_offers, {})
+        self.assertEqual(len(self.sent), 1)
+
+    def test_offer_with_malformed_filesize_is_rejected(self):
+        receiver = make_peer_manager("bob@127.0.0.1")
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.offer(receiver, "f3", filesize="25x")
+        self.assertIn("invalid FILESIZE '25x'", output.getvalue())
+        self.assertEqual(receiver.file_offers, {})
+        self.assertFalse(accept_file_offer("f3", receiver))
+        self.assertEqual(self.sent, [])
+
+class TestTransferScheduler(unittest.TestCase):
+    """Round-robin scheduling of concurrent transfers under byte budgets"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.sender = make_peer_manager("alice@127.0.0.1")
+        self.sent = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def stream(self, name, receiver, chunks):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(os.urandom(1000 * chunks))
+        return StreamTransfer(self.sender, name, path, receiver, "t", chunk_size=1000)
+
+    def record(self, frame, addr):
+        self.sent.append(parse_message(bytes(frame).decode("utf-8"))["FILEID"])
+
+    def test_chunks_alternate_and_queued_transfers_start_later(self):
+        scheduler = TransferScheduler(max_active=2)
+        for name, receiver in (("a", "bob@127.0.0.2"), ("b", "carol@127.0.0.3"), ("c", "dave@127.0.0.4")):
+            scheduler.add(self.stream(name, receiver, 3))
+        self.assertEqual(scheduler.get_stats()["queued"], 1)
+        while scheduler.pump(self.record, limit=4) == 0:
+            pass
+        self.assertEqual(self.sent, ["a", "b", "a", "b", "a", "b", "c", "c", "c"])
+        stats = scheduler.get_stats()
+        self.assertEqual((stats["completed"], stats["active"], stats["chunks"]), (3, 0, 9))
+        self.assertEqual([row["state"] for row in scheduler.get_transfers()], ["done"] * 3)
+
+    def test_peer_budget_throttles_one_receiver_only(self):
+        scheduler = TransferScheduler(peer_rate=1000, burst=0.1)
+        scheduler.add(self.stream("slow", "bob@127.0.0.2", 200))
+        scheduler.add(self.stream("fast", "carol@127.0.0.3", 200))
+        timeout = scheduler.pump(self.record, limit=120)
+        # each bucket starts with a 64KB burst allowance, about 46 frames of 1000 bytes + headers
+        self.assertEqual(self.sent.count("slow"), self.sent.count("fast"))
+        self.assertLess(len(self.sent), 120)
+        self.assertGreater(timeout, 0)
+        self.assertGreater(scheduler.get_stats()["throttled"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
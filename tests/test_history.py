@@ -0,0 +1,95 @@
+import unittest
+import tempfile
+import time
+import sys
+import os
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from core.history import BoundedHistory, HistoryLog, history_file
+from core.records import Post, GroupMessage
+from core.peer import PeerManager
+from utils.logger import Logger
+
+def contents(records):
+    return [record.content for record in records]
+
+class TestBoundedHistory(unittest.TestCase):
+    """Capped in-memory history with an optional spill log"""
+
+    def test_overflow_is_dropped_without_a_log(self):
+        history = BoundedHistory(3)
+        for i in range(5):
+            history.append(Post(f"p{i}", i))
+        self.assertEqual(contents(history), ["p2", "p3", "p4"])
+        self.assertEqual(contents(history.recent(2)), ["p3", "p4"])
+        self.assertEqual(contents(history.page(1, 2)), ["p2"])
+
+    def test_overflow_spills_and_pages_across_log_and_memory(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log = HistoryLog(history_file(tmp, "groups", "g/1"), GroupMessage)
+            history = BoundedHistory(8, log)
+            for i in range(20):
+                history.append(GroupMessage("a@127.0.0.1", f"m{i}", 1700000000 + i))
+            self.assertLessEqual(len(history), 8) # hot memory stays bounded
+            self.assertEqual(history.total(), 20)
+            self.assertEqual(contents(history.page(0, 5)), [f"m{i}" for i in range(15, 20)])
+            self.assertEqual(contents(history.page(2, 5)), [f"m{i}" for i in range(5, 10)]) # spans the log
+            self.assertEqual(contents(history.page(3, 6)), ["m0", "m1"])
+            self.assertEqual(history.page(4, 6), [])
+            self.assertEqual(history.page(3, 6)[0], GroupMessage("a@127.0.0.1", "m0", 1700000000))
+
+            reopened = HistoryLog(log.path, GroupMessage) # offsets rebuilt from the file
+            self.assertEqual(len(reopened), len(log))
+            self.assertEqual(contents(reopened.read(2, 4)), ["m2", "m3"])
+
+    def test_discard_removes_by_identity(self):
+        history = BoundedHistory(10)
+        posts = [Post("same", 1) for _ in range(3)]
+        for post in posts:
+            history.append(post)
+        self.assertEqual(history.discard([posts[1], Post("same", 1)]), 1)
+        self.assertEqual([id(post) for post in history], [id(posts[0]), id(posts[2])])
+
+class TestPeerManagerHistory(unittest.TestCase):
+    """Per-peer and per-group caps from config"""
+
+    def setUp(self):
+        self.old = (config.HISTORY_PEER_DMS, config.HISTORY_PEER_POSTS, config.HISTORY_DIR)
+        self.tmp = tempfile.TemporaryDirectory()
+        config.HISTORY_PEER_DMS, config.HISTORY_PEER_POSTS, config.HISTORY_DIR = 4, 4, self.tmp.name
+
+    def tearDown(self):
+        config.HISTORY_PEER_DMS, config.HISTORY_PEER_POSTS, config.HISTORY_DIR = self.old
+        self.tmp.cleanup()
+
+    def test_dm_history_is_capped_and_paged(self):
+        peer_manager = PeerManager(Logger(verbose=False))
+        for i in range(10):
+            peer_manager.add_dm("bob@127.0.0.2", f"d{i}", 1700000000 + i, f"m{i}", None)
+        self.assertLessEqual(len(peer_manager.peers["bob@127.0.0.2"].dms), 4)
+        self.assertEqual(contents(peer_manager.get_history("dms", "bob@127.0.0.2", 0, 3)), ["d7", "d8", "d9"])
+        self.assertEqual(contents(peer_manager.get_history("dms", "bob@127.0.0.2", 3, 3)), ["d0"])
+        self.assertTrue(os.path.exists(history_file(self.tmp.name, "dms", "bob@127.0.0.2")))
+        self.assertEqual(peer_manager.get_history("posts", "nobody@127.0.0.9"), [])
+
+    def test_spilled_posts_expire(self):
+        peer_manager = PeerManager(Logger(verbose=False))
+        peer_manager.follow("bob@127.0.0.2")
+        now = int(time.time())
+        for i in range(8): # p0 .. p3 are spilled; p0 and p1 are already past their TTL
+            peer_manager.add_post("bob@127.0.0.2", f"p{i}", now - 7200 if i < 2 else now, 3600, f"m{i}", None)
+        self.assertEqual(peer_manager.expiry.run_due(), 2)
+        self.assertEqual(contents(peer_manager.get_history("posts", "bob@127.0.0.2", 0, 10)), [f"p{i}" for i in range(2, 8)])
+        self.assertEqual(peer_manager.peers["bob@127.0.0.2"].posts.total(), 6)
+
+        # after a restart, records that expired in the log are left out when it is opened
+        path = history_file(self.tmp.name, "posts", "bob@127.0.0.2")
+        reopened = HistoryLog(path, Post, lambda post: post.timestamp + post.ttl)
+        self.assertEqual(contents(reopened.read(0, len(reopened))), ["p2", "p3"])
+        self.assertEqual(len(HistoryLog(path, Post)), 4)
+
+if __name__ == '__main__':
+    unittest.main()
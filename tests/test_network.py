@@ -0,0 +1,145 @@
+import unittest
+import socket
+import time
+import sys
+import os
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from network.send_pool import SendPool, send_pool
+from network.udp_handler import UDPHandler
+from network.async_engine import AsyncEngine
+from core.peer import PeerManager
+from core.broadcaster import ping_frame
+from utils.logger import Logger
+
+class TestSendPool(unittest.TestCase):
+    """Send path socket reuse"""
+
+    def setUp(self):
+        self.receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.receiver.bind(("127.0.0.1", 0))
+        self.receiver.settimeout(1)
+        self.pool = SendPool(size=2)
+
+    def tearDown(self):
+        self.pool.close()
+        self.receiver.close()
+
+    def test_sockets_are_reused(self):
+        addr = self.receiver.getsockname()
+        for _ in range(50):
+            self.pool.sendto(b"TYPE: PING\n\n", addr)
+        stats = self.pool.get_stats()
+        self.assertEqual(stats["sends"], 50)
+        self.assertEqual(stats["sockets_created"], 2)
+        self.assertEqual(self.receiver.recv(100), b"TYPE: PING\n\n")
+
+    def test_attached_socket_is_used_and_not_closed(self):
+        bound = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        bound.bind(("127.0.0.1", 0))
+        self.pool.attach(bound)
+        self.pool.sendto(b"TYPE: PING\n\n", self.receiver.getsockname())
+        _, addr = self.receiver.recvfrom(100)
+        self.assertEqual(addr, bound.getsockname())
+        self.pool.close()
+        self.assertNotEqual(bound.fileno(), -1)
+        bound.close()
+
+class TestBatchedReceive(unittest.TestCase):
+    """Draining ready datagrams per wakeup"""
+
+    def setUp(self):
+        self.old_port = config.PORT
+        config.PORT = 0
+        self.handler = UDPHandler(Logger(verbose=False), None, lambda m, a, p: None, batch_size=8)
+        self.addr = ("127.0.0.1", self.handler.sock.getsockname()[1])
+        self.sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def tearDown(self):
+        config.PORT = self.old_port
+        send_pool.detach(self.handler.sock)
+        self.handler.sock.close()
+        self.sender.close()
+
+    def test_drain_respects_batch_size(self):
+        for i in range(10):
+            self.sender.sendto(f"TYPE: PING\nUSER_ID: u{i}@1\n\n".encode(), self.addr)
+        first = self.handler.drain()
+        self.assertEqual(len(first), 8)
+        self.assertEqual(first[0][0], b"TYPE: PING\nUSER_ID: u0@1\n\n")
+        self.assertIs(first[0][0].obj, self.handler.buffers[0]) # no copy per datagram
+        second = self.handler.drain()
+        self.assertEqual(len(second), 2)
+        self.assertEqual(self.handler.drain(), [])
+
+class TestFrameCache(unittest.TestCase):
+    """Encoded PING / PROFILE frames"""
+
+    def test_ping_is_encoded_once_per_profile_version(self):
+        peer_manager = PeerManager(Logger(verbose=False))
+        self.assertIsNone(ping_frame(peer_manager)) # no profile yet
+        peer_manager.own_profile = {"TYPE": "PROFILE", "USER_ID": "alice@127.0.0.1"}
+        peer_manager.profile_version += 1
+        first = ping_frame(peer_manager)
+        self.assertEqual(first, b"TYPE: PING\nUSER_ID: alice@127.0.0.1\n\n")
+        self.assertIs(ping_frame(peer_manager), first)
+        peer_manager.own_profile = {"TYPE": "PROFILE", "USER_ID": "alice@127.0.0.2"}
+        peer_manager.profile_version += 1 # what set_own_profile does
+        self.assertEqual(ping_frame(peer_manager), b"TYPE: PING\nUSER_ID: alice@127.0.0.2\n\n")
+        stats = peer_manager.frames.get_stats()
+        self.assertEqual((stats["hits"], stats["builds"]), (1, 2))
+
+class TestAsyncEngine(unittest.TestCase):
+    """Receive and retransmission timers on one event loop"""
+
+    def setUp(self):
+        self.old = (config.PORT, config.ACK_TIMEOUT, config.RTO_MIN, config.RTO_JITTER)
+        config.PORT = 0
+        config.ACK_TIMEOUT, config.RTO_MIN, config.RTO_JITTER = 0.05, 0.01, 0
+        self.received = []
+        self.peer_manager = PeerManager(Logger(verbose=False))
+        self.engine = AsyncEngine(Logger(verbose=False), self.peer_manager, lambda m, a, p: self.received.append(m))
+        self.engine.start()
+        self.engine.own_ip = None # accept loopback datagrams in the test
+        self.receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.receiver.bind(("127.0.0.1", 0))
+        self.receiver.settimeout(2)
+
+    def tearDown(self):
+        config.PORT, config.ACK_TIMEOUT, config.RTO_MIN, config.RTO_JITTER = self.old
+        self.engine.stop()
+        self.receiver.close()
+
+    def test_retransmits_until_acked_or_given_up(self):
+        addr = self.receiver.getsockname()
+        for i in range(1000):
+            self.peer_manager.track_ack(f"m{i}", {"TYPE": "DM", "MESSAGE_ID": f"m{i}"}, addr)
+        for i in range(500):
+            self.peer_manager.ack_received(f"m{i}")
+        deadline = time.time() + 5
+        while self.peer_manager.pending_acks and time.time() < deadline:
+            time.sleep(0.02)
+        stats = self.engine.get_stats()
+        self.assertEqual(self.peer_manager.pending_acks, {})
+        self.assertEqual(stats["gave_up"], 500)
+        self.assertEqual(stats["retransmits"], 500 * (config.ACK_MAX_ATTEMPTS - 1))
+        self.assertEqual(stats["timers"], 0)
+
+    def test_bound_socket_is_shared_with_the_send_pool(self):
+        self.assertIn(self.engine.sock, send_pool.sockets)
+        sources = set()
+        for _ in range(send_pool.size):
+            send_pool.sendto(b"TYPE: PING\n\n", self.receiver.getsockname())
+            sources.add(self.receiver.recvfrom(64)[1][1])
+        self.assertIn(self.engine.sock.getsockname()[1], sources)
+        self.engine.stop()
+        deadline = time.time() + 2
+        while self.engine.sock in send_pool.sockets and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertNotIn(self.engine.sock, send_pool.sockets)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,7 +5,8 @@ import os
 # Add parent directory to path to import modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from parser.message_parser import parse_message, craft_message
+from parser import message_parser
+from parser.message_parser import LazyMessage, parse_message, parse_message_bytes, craft_message, craft_binary_message, parse_binary_message, parse_datagram, copy_bulk
 from utils.logger import Logger
 
 class TestLSNPProtocol(unittest.TestCase):
@@ -27,5 +28,111 @@ class TestLSNPProtocol(unittest.TestCase):
         crafted = craft_message(test_dict)
         self.assertTrue(crafted.endswith('\n\n'))
 
+class TestBytesParser(unittest.TestCase):
+    """parse_message_bytes gives the same result as parse_message"""
+
+    CASES = [
+        "TYPE: PING\nUSER_ID: alice@10.0.0.1\n\n",
+        "TYPE: POST\r\nCONTENT: a: b: c\r\nTTL:3600\r\n\r\n",
+        "\n\n  TYPE : DM \nno colon here\n: empty key\nCONTENT:\nCONTENT: second wins\n",
+        "TYPE: DM\nCONTENT: caf\u00e9 \u2603\u00a0\nDISPLAY_NAME:\x1c Bob\x1f\n",
+        "\u2003TYPE: PROFILE\nAVATAR_DATA: \u00a0QUJD\u3000\nDATA:\x0b\x0cREVG \t\n\x1cX\u00e9Y : z",
+        "TYPE: FILE_CHUNK\nCHUNK_INDEX: 0007\nDATA: " + "QUJD" * 5000 + "\n\n",
+        "",
+        "TYPE: PING",
+    ]
+
+    def setUp(self):
+        self.min_size = message_parser.BULK_MIN_SIZE
+        message_parser.BULK_MIN_SIZE = 0 # the bytes path even for these short cases
+
+    def tearDown(self):
+        message_parser.BULK_MIN_SIZE = self.min_size
+
+    def test_parity_with_parse_message(self):
+        for text in self.CASES:
+            expected = parse_message(text)
+            for data in (text.encode("utf-8"), bytearray(text.encode("utf-8")), memoryview(text.encode("utf-8"))):
+                message = parse_message_bytes(data)
+                self.assertEqual(list(message), list(expected), text[:40])
+                for key, value in message.items():
+                    if isinstance(value, memoryview):
+                        self.assertIn(key, ("DATA", "AVATAR_DATA"))
+                        value = bytes(value).decode("utf-8")
+                    self.assertEqual(value, expected[key], (text[:40], key))
+
+    def test_lazy_message_matches_parse_message_bytes(self):
+        for text in self.CASES:
+            data = text.encode("utf-8")
+            expected = parse_message_bytes(data)
+            lazy = LazyMessage(data)
+            self.assertEqual(lazy.get("TYPE"), expected.get("TYPE"))
+            self.assertEqual(list(lazy), list(expected))
+            self.assertEqual(lazy, expected)
+            self.assertIsNone(lazy.get("MISSING"))
+            self.assertNotIn("MISSING", lazy)
+
+    def test_missing_known_keys_do_not_parse_everything(self):
+        for text in self.CASES:
+            expected = parse_message_bytes(text.encode("utf-8"))
+            for key in ("TYPE", "TO", "SACK_NOW", "CRC32", "CONTENT", "DATA"): # one key per fresh view
+                self.assertEqual(LazyMessage(text.encode("utf-8")).get(key), expected.get(key), (text[:40], key))
+        chunk = LazyMessage(b"TYPE: FILE_CHUNK\nCHUNK_INDEX: 0007\nDATA: QUJD\n\n")
+        self.assertIsNone(chunk.get("SACK_NOW"))
+        self.assertNotIn("CRC32", chunk)
+        self.assertIsNone(chunk.get("BINARY"))
+        self.assertIsNone(chunk._fields) # answered without indexing the message
+
+    def test_data_is_a_slice_of_the_datagram(self):
+        data = b"TYPE: FILE_CHUNK\nDATA: QUJD\n\n"
+        message = parse_message_bytes(data)
+        self.assertIs(message["DATA"].obj, data)
+        self.assertEqual(craft_message(message), "TYPE: FILE_CHUNK\nDATA: QUJD\n\n")
+
+    def test_short_or_bulk_free_datagrams_are_parsed_as_text(self):
+        message_parser.BULK_MIN_SIZE = self.min_size
+        small_chunk = b"TYPE: FILE_CHUNK\nDATA: QUJD\n\n"
+        big_dm = b"TYPE: DM\nCONTENT: " + b"x" * self.min_size + b"\n\n"
+        for data in (b"TYPE: PING\nUSER_ID: alice@10.0.0.1\n\n", small_chunk, big_dm):
+            self.assertEqual(parse_message_bytes(data), parse_message(data.decode("utf-8")))
+            self.assertEqual(parse_datagram(data), parse_message(data.decode("utf-8")))
+            self.assertNotIsInstance(parse_datagram(data), LazyMessage)
+        big_chunk = b"TYPE: FILE_CHUNK\nDATA: " + b"QUJD" * self.min_size + b"\n\n"
+        self.assertIsInstance(parse_message_bytes(big_chunk)["DATA"], memoryview)
+        self.assertIsInstance(parse_datagram(big_chunk), LazyMessage)
+
+class TestBinaryFrames(unittest.TestCase):
+    """Length-prefixed header plus raw bytes"""
+
+    def test_round_trip_and_text_fallback(self):
+        payload = bytes(range(256)) * 4 # includes newlines and colons
+        fields = {"TYPE": "FILE_CHUNK", "FROM": "alice@127.0.0.1", "CHUNK_INDEX": 3, "DATA": payload}
+        frame = craft_binary_message(fields, "DATA")
+        self.assertLess(len(frame), len(craft_message(dict(fields, DATA="A" * (len(payload) * 4 // 3)))))
+        message = parse_datagram(frame)
+        self.assertEqual(message["TYPE"], "FILE_CHUNK")
+        self.assertEqual(message["CHUNK_INDEX"], "3")
+        self.assertEqual(bytes(message["DATA"]), payload)
+        self.assertEqual(message["BINARY"], "DATA") # tells handlers DATA is raw
+
+        text = craft_message({"TYPE": "PING", "USER_ID": "alice@127.0.0.1"}).encode("utf-8")
+        self.assertEqual(parse_datagram(text), {"TYPE": "PING", "USER_ID": "alice@127.0.0.1"})
+        with self.assertRaises(ValueError):
+            parse_binary_message(frame[:20])
+
+    def test_views_of_a_reused_buffer(self):
+        buffer = bytearray(65535)
+        frame = craft_binary_message({"TYPE": "FILE_CHUNK", "CHUNK_INDEX": 3, "DATA": b"raw"}, "DATA")
+        text = craft_message({"TYPE": "PING", "USER_ID": "alice@127.0.0.1"}).encode("utf-8")
+        buffer[:len(frame)] = frame
+        chunk = parse_datagram(memoryview(buffer)[:len(frame)])
+        self.assertIs(chunk["DATA"].obj, buffer) # not copied while it is handled right away
+        copy_bulk(chunk) # ... but copied before it is queued
+        buffer[:len(text)] = text
+        ping = parse_datagram(memoryview(buffer)[:len(text)])
+        buffer[:] = bytes(len(buffer)) # the next receive
+        self.assertEqual(chunk["DATA"], b"raw")
+        self.assertEqual(ping["USER_ID"], "alice@127.0.0.1")
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
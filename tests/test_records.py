@@ -0,0 +1,95 @@
+import unittest
+import time
+import sys
+import os
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from core.records import Peer, Post, DM, Like, GroupMessage
+from core.peer import PeerManager
+from utils.logger import Logger
+
+def make_peer_manager(user_id="me@127.0.0.1"):
+    peer_manager = PeerManager(Logger(verbose=False))
+    peer_manager.own_profile = {"TYPE": "PROFILE", "USER_ID": user_id, "DISPLAY_NAME": "Me"}
+    return peer_manager
+
+class TestRecords(unittest.TestCase):
+    """Slotted Peer / Post / DM / Like / GroupMessage records"""
+
+    def test_records_have_no_instance_dict(self):
+        for record in (Peer("Bob", "ok"), Post("hi"), DM("hi"), Like("a@1", 1, "LIKE", "hi", 2), GroupMessage("a@1", "hi", 2)):
+            self.assertFalse(hasattr(record, "__dict__"), type(record).__name__)
+            with self.assertRaises(AttributeError):
+                record.extra = 1
+
+    def test_equality_and_repr(self):
+        self.assertEqual(Post("hi", 1, 60, "m1", "t"), Post("hi", 1, 60, "m1", "t"))
+        self.assertNotEqual(Post("hi", 1), DM("hi", 1))
+        self.assertEqual(repr(GroupMessage("a@1", "hi", 2)), "GroupMessage(sender='a@1', content='hi', timestamp=2)")
+
+class TestPeerManagerRecords(unittest.TestCase):
+    """PeerManager keeps its state in records"""
+
+    def test_dm_from_unknown_peer_creates_a_listable_peer(self):
+        peer_manager = make_peer_manager()
+        peer_manager.add_dm("bob@127.0.0.2", "hello", 1700000000, "m1", "t")
+        self.assertEqual(peer_manager.list_peers(), [("bob@127.0.0.2", "bob")])
+        self.assertEqual(list(peer_manager.peers["bob@127.0.0.2"].dms), [DM("hello", 1700000000, "m1", "t")])
+        peer_manager.add_peer("bob@127.0.0.2", "Bob", "online")
+        self.assertEqual(peer_manager.get_display_name("bob@127.0.0.2"), "Bob")
+        self.assertEqual(len(peer_manager.peers["bob@127.0.0.2"].dms), 1) # kept across the PROFILE
+
+    def test_posts_only_from_followed_or_known_users(self):
+        peer_manager = make_peer_manager()
+        peer_manager.add_post("carol@127.0.0.3", "ignored", 1)
+        self.assertNotIn("carol@127.0.0.3", peer_manager.peers)
+        peer_manager.follow("carol@127.0.0.3")
+        peer_manager.add_post("carol@127.0.0.3", "lunch?", 2, 3600, "p1", "t")
+        self.assertEqual(list(peer_manager.peers["carol@127.0.0.3"].posts), [Post("lunch?", 2, 3600, "p1", "t")])
+
+    def test_like_replaces_and_unlike_removes(self):
+        peer_manager = make_peer_manager()
+        peer_manager.handle_like_received("bob@127.0.0.2", 5, "LIKE", "post")
+        peer_manager.handle_like_received("bob@127.0.0.2", 5, "LIKE", "post")
+        self.assertEqual([(like.from_user, like.post_timestamp) for like in peer_manager.received_likes], [("bob@127.0.0.2", 5)])
+        peer_manager.handle_like_received("bob@127.0.0.2", 5, "UNLIKE", "post")
+        self.assertEqual(peer_manager.received_likes, [])
+
+class TestPeerIndexes(unittest.TestCase):
+    """Follower and group membership lookups"""
+
+    def setUp(self):
+        self.peer_manager = make_peer_manager()
+        for i in range(2, 6):
+            self.peer_manager.add_peer(f"u{i}@10.0.0.{i}", f"U{i}", "ok")
+
+    def test_followers_keep_order_and_one_per_ip(self):
+        peer_manager = self.peer_manager
+        for user_id in ("u4@10.0.0.4", "u2@10.0.0.2", "u3@10.0.0.3"):
+            peer_manager.add_follower("me@127.0.0.1", user_id)
+        peer_manager.add_peer("other@10.0.0.2", "Other", "ok")
+        peer_manager.add_follower("me@127.0.0.1", "other@10.0.0.2") # IP already follows
+        peer_manager.add_follower("me@127.0.0.1", "stranger@10.0.0.9") # not a known peer
+        self.assertEqual(peer_manager.get_follower_ips(), ["10.0.0.4", "10.0.0.2", "10.0.0.3"])
+        peer_manager.remove_follower("me@127.0.0.1", "u2@10.0.0.2")
+        self.assertEqual(peer_manager.get_follower_ips(), ["10.0.0.4", "10.0.0.3"])
+        peer_manager.add_follower("me@127.0.0.1", "other@10.0.0.2") # the IP is free again
+        self.assertEqual(list(peer_manager.followers), ["u4@10.0.0.4", "u3@10.0.0.3", "other@10.0.0.2"])
+
+    def test_group_membership_updates(self):
+        peer_manager = self.peer_manager
+        peer_manager.create_group("g1", "team", ["me@127.0.0.1", "u3@10.0.0.3", "u2@10.0.0.2"])
+        with self.assertRaises(ValueError):
+            peer_manager.create_group("g2", "bad", ["nobody@10.0.0.99"])
+        peer_manager.update_group("g1", add_members=["u5@10.0.0.5", "u3@10.0.0.3"], remove_members=["u2@10.0.0.2"])
+        self.assertEqual(peer_manager.get_group_details("g1")["members"], ["me@127.0.0.1", "u3@10.0.0.3", "u5@10.0.0.5"])
+        self.assertEqual(peer_manager.get_group_member_ips("g1"), ["127.0.0.1", "10.0.0.3", "10.0.0.5"])
+        now = str(int(time.time()))
+        self.assertTrue(peer_manager.handle_group_message({"GROUP_ID": "g1", "FROM": "u5@10.0.0.5", "CONTENT": "hi", "TIMESTAMP": now}))
+        self.assertFalse(peer_manager.handle_group_message({"GROUP_ID": "g1", "FROM": "u2@10.0.0.2", "CONTENT": "hi", "TIMESTAMP": now}))
+
+if __name__ == '__main__':
+    unittest.main()
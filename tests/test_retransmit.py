@@ -0,0 +1,114 @@
+import unittest
+import threading
+import time
+import sys
+import os
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from core.retransmit import RetransmitScheduler
+from core.rtt import RttTracker
+from core.peer import PeerManager
+from parser.message_parser import encode_message
+from utils.logger import Logger
+
+class TestRetransmitScheduler(unittest.TestCase):
+    """Heap-backed retransmission deadlines"""
+
+    def test_fires_in_deadline_order_and_skips_cancelled(self):
+        fired = []
+        scheduler = RetransmitScheduler(lambda key: fired.append(key))
+        scheduler.schedule("late", 0.3)
+        scheduler.schedule("early", 0.1)
+        scheduler.schedule("cancelled", 0.2)
+        self.assertTrue(scheduler.cancel("cancelled"))
+        self.assertFalse(scheduler.cancel("missing"))
+        scheduler.run_due(time.monotonic() + 1)
+        self.assertEqual(fired, ["early", "late"])
+        self.assertEqual(len(scheduler), 0)
+
+    def test_thread_wakes_for_earlier_deadline(self):
+        fired = threading.Event()
+        scheduler = RetransmitScheduler(lambda key: fired.set())
+        scheduler.start()
+        scheduler.schedule("far", 60)
+        time.sleep(0.05) # timer thread is now sleeping until the far deadline
+        started = time.monotonic()
+        scheduler.schedule("near", 0.05)
+        self.assertTrue(fired.wait(2))
+        self.assertLess(time.monotonic() - started, 1)
+        scheduler.stop()
+
+    def test_many_cancelled_entries_are_compacted(self):
+        scheduler = RetransmitScheduler(lambda key: None)
+        for i in range(20000):
+            scheduler.schedule(i, 30)
+        for i in range(19990):
+            scheduler.cancel(i)
+        scheduler.schedule("one-more", 30)
+        stats = scheduler.get_stats()
+        self.assertEqual(stats["pending"], 11)
+        self.assertEqual(stats["heap_size"], 11)
+
+class TestAckWatcher(unittest.TestCase):
+    """PeerManager retransmission on top of the scheduler"""
+
+    def setUp(self):
+        self.old = (config.ACK_TIMEOUT, config.RTO_MIN, config.RTO_JITTER)
+        config.ACK_TIMEOUT, config.RTO_MIN, config.RTO_JITTER = 0.05, 0.01, 0
+
+    def tearDown(self):
+        config.ACK_TIMEOUT, config.RTO_MIN, config.RTO_JITTER = self.old
+
+    def test_retransmits_then_gives_up(self):
+        sent = []
+        peer_manager = PeerManager(Logger(verbose=False))
+        peer_manager.retransmit_scheduler.on_due = lambda key: peer_manager.retransmit_due(key, send=lambda m, a: sent.append(m))
+        peer_manager.start_ack_watcher()
+        frame = encode_message({"TYPE": "DM", "MESSAGE_ID": "lost"})
+        peer_manager.track_ack("lost", {"TYPE": "DM", "MESSAGE_ID": "lost"}, ("127.0.0.1", 1), frame)
+        peer_manager.track_ack("acked", {"TYPE": "DM", "MESSAGE_ID": "acked"}, ("127.0.0.1", 1))
+        peer_manager.ack_received("acked")
+        deadline = time.time() + 3
+        while peer_manager.pending_acks and time.time() < deadline:
+            time.sleep(0.01)
+        peer_manager.retransmit_scheduler.stop()
+        self.assertEqual(peer_manager.pending_acks, {})
+        self.assertEqual(len(sent), config.ACK_MAX_ATTEMPTS - 1)
+        self.assertTrue(all(resent is frame for resent in sent)) # the first send's bytes, not re-encoded
+        stats = peer_manager.rtt.get_stats()["127.0.0.1"]
+        self.assertEqual((stats["samples"], stats["retransmits"], stats["timeouts"]), (1, config.ACK_MAX_ATTEMPTS - 1, 1))
+
+class TestRttEstimator(unittest.TestCase):
+    """Adaptive retransmission timeout"""
+
+    def setUp(self):
+        self.old = (config.ACK_TIMEOUT, config.RTO_MIN, config.RTO_MAX, config.RTO_JITTER)
+        config.ACK_TIMEOUT, config.RTO_MIN, config.RTO_MAX, config.RTO_JITTER = 1, 0.2, 10, 0
+
+    def tearDown(self):
+        config.ACK_TIMEOUT, config.RTO_MIN, config.RTO_MAX, config.RTO_JITTER = self.old
+
+    def test_rto_tracks_samples_and_is_clamped(self):
+        tracker = RttTracker()
+        self.assertEqual(tracker.rto("10.0.0.1"), 1) # unmeasured peer
+        tracker.sample("10.0.0.1", 0.1)
+        # srtt 0.1, rttvar 0.05 -> 0.1 + 4 * 0.05
+        self.assertAlmostEqual(tracker.rto("10.0.0.1"), 0.3)
+        for _ in range(50):
+            tracker.sample("10.0.0.1", 0.001)
+        self.assertEqual(tracker.rto("10.0.0.1"), 0.2) # RTO_MIN
+        tracker.sample("10.0.0.2", 8)
+        self.assertEqual(tracker.rto("10.0.0.2"), 10) # RTO_MAX
+
+    def test_backoff_doubles_per_attempt(self):
+        tracker = RttTracker()
+        tracker.sample("10.0.0.1", 0.1)
+        self.assertAlmostEqual(tracker.backoff("10.0.0.1", 1), 0.3)
+        self.assertAlmostEqual(tracker.backoff("10.0.0.1", 3), 1.2)
+        self.assertEqual(tracker.backoff("10.0.0.1", 10), 10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import unittest
+import shutil
+import tempfile
+import time
+import sys
+import os
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from core.history import history_file
+from core.peer import PeerManager
+from utils.logger import Logger
+
+ME = "me@127.0.0.1"
+BOB = "bob@127.0.0.2"
+ANN = "ann@127.0.0.3"
+
+def make_peer_manager(directory=None):
+    peer_manager = PeerManager(Logger(verbose=False))
+    peer_manager.own_profile = {"TYPE": "PROFILE", "USER_ID": ME, "DISPLAY_NAME": "Me"}
+    if directory:
+        peer_manager.load_state(directory)
+    return peer_manager
+
+# stop writing without the clean shutdown (no final compaction or fsync)
+def crash(peer_manager):
+    store = peer_manager.store
+    store.running = False
+    store.wakeup.set()
+    store.thread.join()
+    store.wal.close()
+
+def populate(peer_manager, dms=3):
+    now = int(time.time())
+    peer_manager.add_peer(BOB, "Bob", "ok", "image/png", "base64", "aGk=")
+    peer_manager.add_peer(ANN, "Ann", "busy")
+    peer_manager.follow(BOB)
+    peer_manager.follow(ANN)
+    peer_manager.unfollow(ANN)
+    peer_manager.add_follower(ME, ANN)
+    peer_manager.add_post(BOB, "lunch?", now, 3600, "p1", f"{BOB}|{now + 3600}|broadcast")
+    for i in range(dms):
+        peer_manager.add_dm(BOB, f"d{i}", now + i, f"m{i}", f"{BOB}|{now + 3600}|chat")
+    peer_manager.revoke_token(f"{ANN}|{now + 600}|chat")
+    peer_manager.create_group("g1", "team", [ME, BOB])
+    peer_manager.update_group("g1", add_members=[ANN])
+    peer_manager.send_group_message("g1", "hello team")
+    peer_manager.create_game("t1", BOB, is_initiator=True, token=None)
+    peer_manager.apply_move("t1", 4, is_self=True)
+
+def summary(peer_manager):
+    bob = peer_manager.peers[BOB]
+    return {
+        "peers": sorted(peer_manager.list_peers()),
+        "avatar": (bob.avatar_type, bob.avatar_data),
+        "posts": [post.content for post in bob.posts],
+        "dms": [dm.content for dm in bob.dms],
+        "following": sorted(peer_manager.following),
+        "followers": peer_manager.get_follower_ips(),
+        "revoked": len(peer_manager.revoked_tokens),
+        "groups": peer_manager.list_groups(),
+        "group_messages": [message.content for message in peer_manager.groups["g1"]["messages"]],
+        "owned": sorted(peer_manager.owned_groups),
+        "board": peer_manager.games["t1"]["board"],
+    }
+
+class TestStateStore(unittest.TestCase):
+    """Snapshot + write-ahead log recovery of PeerManager state"""
+
+    def setUp(self):
+        self.old = (config.HISTORY_PEER_DMS, config.HISTORY_DIR, config.STATE_SNAPSHOT_EVERY)
+        self.tmp = tempfile.mkdtemp()
+        self.state_dir = os.path.join(self.tmp, "state")
+
+    def tearDown(self):
+        config.HISTORY_PEER_DMS, config.HISTORY_DIR, config.STATE_SNAPSHOT_EVERY = self.old
+        shutil.rmtree(self.tmp)
+
+    def test_restart_restores_state_from_wal_then_snapshot(self):
+        peer_manager = make_peer_manager(self.state_dir)
+        populate(peer_manager)
+        expected = summary(peer_manager)
+        crash(peer_manager) # the WAL is all there is
+
+        restored = make_peer_manager(self.state_dir)
+        self.assertEqual(summary(restored), expected)
+        self.assertEqual(restored.store.get_stats()["replayed"], restored.store.get_stats()["seq"])
+        restored.store.close() # clean shutdown compacts into a snapshot
+
+        restored = make_peer_manager(self.state_dir)
+        self.assertEqual(summary(restored), expected)
+        self.assertEqual(restored.store.get_stats()["replayed"], 0)
+        restored.store.close()
+
+    def test_torn_record_is_cut_and_later_changes_survive(self):
+        peer_manager = make_peer_manager(self.state_dir)
+        populate(peer_manager)
+        peer_manager.store.wal.write(b'[999,"add_dm",["bob@127.0.0.2","half') # write cut short by a crash
+        crash(peer_manager)
+
+        restored = make_peer_manager(self.state_dir)
+        restored.add_dm(BOB, "after", int(time.time()), "m9", None)
+        crash(restored)
+        self.assertEqual([dm.content for dm in make_peer_manager(self.state_dir).peers[BOB].dms], ["d0", "d1", "d2", "after"])
+
+    def test_crash_during_compaction_does_not_replay_twice(self):
+        config.STATE_SNAPSHOT_EVERY = 10
+        peer_manager = make_peer_manager(self.state_dir)
+        populate(peer_manager)
+        wal_path = peer_manager.store.wal_path
+        old_wal = open(wal_path, "rb").read()
+        peer_manager.store.compact()
+        peer_manager.add_dm(BOB, "after", int(time.time()), "m9", None)
+        self.assertEqual(peer_manager.store.get_stats()["wal_records"], 1)
+        crash(peer_manager)
+
+        # as if the snapshot was written but the WAL was not restarted yet
+        with open(wal_path, "rb") as f:
+            tail = f.read()
+        with open(wal_path, "wb") as f:
+            f.write(old_wal + tail)
+        restored = make_peer_manager(self.state_dir)
+        self.assertEqual([dm.content for dm in restored.peers[BOB].dms], ["d0", "d1", "d2", "after"])
+        self.assertEqual(restored.store.get_stats()["replayed"], 1)
+        restored.store.close()
+
+    def test_spilled_history_is_not_duplicated_by_replay(self):
+        config.HISTORY_PEER_DMS, config.HISTORY_DIR = 4, os.path.join(self.tmp, "history")
+        peer_manager = make_peer_manager(self.state_dir)
+        populate(peer_manager, dms=10)
+        peer_manager.store.compact()
+        for i in range(10, 20):
+            peer_manager.add_dm(BOB, f"d{i}", int(time.time()), f"m{i}", None)
+        crash(peer_manager)
+
+        for _ in range(2): # the replayed tail spills the same records again each time
+            restored = make_peer_manager(self.state_dir)
+            self.assertEqual(restored.peers[BOB].dms.total(), 20)
+            self.assertEqual([dm.content for dm in restored.get_history("dms", BOB, 0, 20)], [f"d{i}" for i in range(20)])
+            crash(restored)
+        self.assertTrue(os.path.exists(history_file(config.HISTORY_DIR, "dms", BOB)))
+
+if __name__ == '__main__':
+    unittest.main()
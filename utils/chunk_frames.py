@@ -0,0 +1,147 @@
+import binascii
+import hashlib
+import mmap
+import os
+import time
+import zlib
+from parser.message_parser import BINARY_MAGIC, BINARY_PREFIX
+
+# per-chunk fields patched in place, from CHUNK_INDEX's value to the start of DATA
+INDEX_TAIL = b"\nSACK_NOW: 0\nCRC32: 00000000\n"
+# the whole-file digest, only in the last chunk's frame
+DIGEST_FIELD = b"SHA256: " + b"0" * 64 + b"\n"
+
+# builds FILE_CHUNK datagrams for one file without per-chunk copies of the file data:
+# the file is memory-mapped and sliced as memoryviews, and every field except
+# CHUNK_INDEX, SACK_NOW, CRC32 and DATA is encoded once into a reusable bytearray.
+# CHUNK_INDEX is zero-padded to a fixed width so it can be patched in place.
+# copies per chunk: base64 of the mapped slice, then that text into the frame buffer
+# (the old path read, encoded, decoded to str, crafted the message text and encoded it again).
+# in binary mode (for receivers that negotiated it) the frame is the binary LSNP layout
+# from parser.message_parser and the raw slice is copied in with no base64 at all.
+# every chunk carries a CRC32, and the SHA-256 of the whole file is built from the same
+# mapped slices as they are first sent (in index order) and goes out with the last chunk
+# (with every chunk for a resumed receiver that already has the last one)
+class ChunkFrames:
+	def __init__(self, filepath, file_id, sender_id, receiver_id, token, chunk_size, binary=False):
+		self.chunk_size = chunk_size
+		self.binary = binary
+		self.filesize = os.path.getsize(filepath)
+		self.total_chunks = (self.filesize + chunk_size - 1) // chunk_size  # ceil division
+		self.file = open(filepath, "rb")
+		self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.filesize else None
+		self.view = memoryview(self.map) if self.map is not None else memoryview(b"")
+		self.sha256 = hashlib.sha256() # over chunks 0 .. hashed_chunks - 1
+		self.hashed_chunks = 0
+		self.digest = None # hex SHA-256 of the file once every chunk has been hashed
+		self.digest_in_every_frame = False
+		self.hash_seconds = 0.0 # CPU time spent on CRC32 and SHA-256
+
+		self.index_width = len(str(max(self.total_chunks - 1, 0)))
+		header = self.header(file_id, sender_id, receiver_id, token, self.total_chunks, chunk_size)
+		header += b"0" * self.index_width + INDEX_TAIL
+		self.fields_end = len(header) # where the digest field goes in the last chunk
+		header += b"BINARY: DATA\n\n" if binary else b"DATA: "
+		if binary:
+			header = BINARY_PREFIX.pack(BINARY_MAGIC, len(header)) + header
+			self.fields_end += BINARY_PREFIX.size
+		self.index_at = header.index(b"\nCHUNK_INDEX: ") + len(b"\nCHUNK_INDEX: ")
+		self.sack_at = self.index_at + self.index_width + len(b"\nSACK_NOW: ")
+		self.crc_at = self.sack_at + len(b"0\nCRC32: ")
+		self.data_at = len(header)
+		self.buffer = bytearray(self.data_at + (chunk_size if binary else 4 * ((chunk_size + 2) // 3) + 2))
+		self.buffer[:self.data_at] = header
+
+	# the fixed fields, up to the CHUNK_INDEX value
+	@staticmethod
+	def header(file_id, sender_id, receiver_id, token, total_chunks, chunk_size):
+		return (
+			f"TYPE: FILE_CHUNK\n"
+			f"FROM: {sender_id}\n"
+			f"TO: {receiver_id}\n"
+			f"FILEID: {file_id}\n"
+			f"TOTAL_CHUNKS: {total_chunks}\n"
+			f"CHUNK_SIZE: {chunk_size}\n"
+			f"TOKEN: {token}\n"
+			f"TIMESTAMP: {int(time.time())}\n"
+			f"CHUNK_INDEX: "
+		).encode("utf-8")
+
+	# bytes of a frame that are not DATA, for a file of at most filesize bytes
+	# (chunk counts and sizes are bounded by filesize, so its digits are the worst case;
+	# the digest field is counted too, since the last chunk can be a full one)
+	@classmethod
+	def overhead(cls, file_id, sender_id, receiver_id, token, filesize, binary=False):
+		header = cls.header(file_id, sender_id, receiver_id, token, filesize, filesize)
+		fields = len(header) + len(str(filesize)) + len(INDEX_TAIL) + len(DIGEST_FIELD)
+		if binary:
+			return BINARY_PREFIX.size + fields + len(b"BINARY: DATA\n\n")
+		return fields + len(b"DATA: ") + len(b"\n\n")
+
+	# largest chunk whose DATA fits in a datagram payload of the given size
+	# (base64 DATA takes 4 bytes for every 3, raw binary DATA takes them as they are)
+	@staticmethod
+	def chunk_size_for(datagram_size, overhead, binary=False):
+		if binary:
+			return max(1, datagram_size - overhead)
+		return max(3, (datagram_size - overhead) // 4 * 3)
+
+	# extend the file digest through chunk `index`. chunks go out in order, so this is
+	# normally the chunk being framed; chunks a resumed receiver already had are read here
+	def _hash_through(self, index):
+		while self.hashed_chunks <= index:
+			start = self.hashed_chunks * self.chunk_size
+			self.sha256.update(self.view[start:start + self.chunk_size])
+			self.hashed_chunks += 1
+		if self.hashed_chunks == self.total_chunks and self.digest is None:
+			self.digest = self.sha256.hexdigest()
+
+	# hash the whole file up front and send its digest with every chunk: for a resumed
+	# transfer whose receiver already has the last chunk, which would otherwise carry it
+	def send_digest_with_every_chunk(self):
+		if not self.total_chunks:
+			return
+		hash_started = time.perf_counter()
+		self._hash_through(self.total_chunks - 1)
+		self.hash_seconds += time.perf_counter() - hash_started
+		self.digest_in_every_frame = True
+
+	# the datagram for one chunk. the returned view aliases the shared buffer,
+	# so it must be sent before the next call
+	def frame(self, index, sack_now=False):
+		buffer = self.buffer
+		buffer[self.index_at:self.index_at + self.index_width] = b"%0*d" % (self.index_width, index)
+		buffer[self.sack_at] = 0x31 if sack_now else 0x30 # ASCII "1" / "0"
+		start = index * self.chunk_size
+		chunk = self.view[start:start + self.chunk_size]
+		hash_started = time.perf_counter()
+		buffer[self.crc_at:self.crc_at + 8] = b"%08x" % zlib.crc32(chunk)
+		if index >= self.hashed_chunks:
+			self._hash_through(index)
+		self.hash_seconds += time.perf_counter() - hash_started
+		if self.binary:
+			end = self.data_at + len(chunk)
+			buffer[self.data_at:end] = chunk
+		else:
+			encoded = binascii.b2a_base64(chunk, newline=False)
+			end = self.data_at + len(encoded)
+			buffer[self.data_at:end] = encoded
+			buffer[end:end + 2] = b"\n\n"
+			end += 2
+		if index == self.total_chunks - 1 or self.digest_in_every_frame:
+			return self._with_digest(end)
+		return memoryview(buffer)[:end]
+
+	# the frame with the SHA256 field added (built once per send of the chunk)
+	def _with_digest(self, end):
+		field = b"SHA256: " + self.digest.encode("ascii") + b"\n"
+		frame = bytearray(self.buffer[:self.fields_end]) + field + self.buffer[self.fields_end:end]
+		if self.binary:
+			BINARY_PREFIX.pack_into(frame, 0, BINARY_MAGIC, self.data_at - BINARY_PREFIX.size + len(field))
+		return memoryview(frame)
+
+	def close(self):
+		self.view.release()
+		if self.map is not None:
+			self.map.close()
+		self.file.close()
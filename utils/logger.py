@@ -1,5 +1,17 @@
 import datetime
-from parser.message_parser import craft_message
+from collections.abc import Mapping
+from parser.message_parser import is_binary_message, parse_binary_message, LazyMessage
+
+# LSNP text for logging; raw binary fields are shown by size. a received LazyMessage is
+# written out line by line from the datagram rather than parsed into a dict first
+def _loggable(msg):
+	if isinstance(msg, (bytes, bytearray, memoryview)):
+		if not is_binary_message(msg):
+			return bytes(msg).decode("utf-8")
+		msg = parse_binary_message(msg)
+	fields = msg.iter_fields() if isinstance(msg, LazyMessage) else msg.items()
+	return "".join(f"{key}: <{len(value)} bytes>\n" if isinstance(value, (bytes, bytearray, memoryview)) else f"{key}: {value}\n"
+				for key, value in fields) + "\n"
 
 # logger class that supports verbose mode
 class Logger:
@@ -22,9 +34,8 @@ class Logger:
 	def log_send(self, msg_type, ip, msg=None, peer_manager=None):
 		if self.verbose:
 			if msg:
-				if isinstance(msg, dict):
-					lsnp_text = craft_message(msg)
-					self.log("SEND >", lsnp_text)
+				if isinstance(msg, (Mapping, bytes, bytearray, memoryview)): # message or pre-encoded frame
+					self.log("SEND >", _loggable(msg))
 
 		# non-verbose mode (sending messages)
 		else:
@@ -82,10 +93,9 @@ class Logger:
 		#self.log("RECV <", f"From {ip} | TYPE: {msg_type}")
 		if self.verbose:
 			if msg:
-				# if msg is a dict (parsed message), convert to LSNP text
-				if isinstance(msg, dict):
-					lsnp_text = craft_message(msg)
-					self.log("RECV <", lsnp_text)
+				# if msg is a parsed message, convert to LSNP text
+				if isinstance(msg, Mapping):
+					self.log("RECV <", _loggable(msg))
 				else:
 					self.log("RECV <", msg)
 
@@ -105,8 +115,8 @@ class Logger:
 					display_name = peer_manager.get_display_name(user_id)
 					avatar_info = ""
 					peer_info = peer_manager.peers.get(user_id)
-					if peer_info and peer_info.get('avatar_type') and peer_info.get('avatar_data'):
-						avatar_info = f" | Avatar: {peer_info.get('avatar_type')}"
+					if peer_info and peer_info.has_avatar():
+						avatar_info = f" | Avatar: {peer_info.avatar_type}"
 					print(f"\n\nNew post from {display_name}{avatar_info}: \n{msg.get('CONTENT', 'No content')}")
 
 			if msg.get("TYPE") == "DM":
@@ -115,8 +125,8 @@ class Logger:
 					display_name = peer_manager.get_display_name(user_id)
 					avatar_info = ""
 					peer_info = peer_manager.peers.get(user_id)
-					if peer_info and peer_info.get('avatar_type') and peer_info.get('avatar_data'):
-						avatar_info = f" | Avatar: {peer_info.get('avatar_type')}"
+					if peer_info and peer_info.has_avatar():
+						avatar_info = f" | Avatar: {peer_info.avatar_type}"
 					print(f"\n\nFrom {display_name}{avatar_info}: \n{msg.get('CONTENT', 'No content')}")
 			
 			if msg.get("TYPE") == "FOLLOW":
@@ -149,8 +159,8 @@ class Logger:
 					post_content = "your post"
 					if hasattr(peer_manager, 'own_posts') and peer_manager.own_posts:
 						for post in peer_manager.own_posts:
-							if post.get('timestamp') == post_timestamp:
-								post_content = post.get('content', 'your post')
+							if post.timestamp == post_timestamp:
+								post_content = post.content
 								break
 					
 					if action == "LIKE":
@@ -184,6 +194,12 @@ class Logger:
 	def log_drop(self, reason=""):
 		self.log("DROP !", reason)
 
+	# one line for a message dispatch passed over without a reason of its own to print
+	# (unknown TYPE, or one its handler ignores); verbose mode only
+	def log_ignored(self, msg_type, ip, reason):
+		if self.verbose:
+			self.log("DROP !", f"{msg_type} from {ip}: {reason}")
+
 	def log_retry(self, attempt, context=""):
 		self.log("RETRY", f"Attempt {attempt} {context}")
 
@@ -1,5 +1,5 @@
 import socket
-from parser.message_parser import craft_message
+from parser.message_parser import encode_message
 import ipaddress
 import psutil
 import struct
@@ -10,12 +10,21 @@ import uuid
 import base64
 import config
 import os
+import sys
+from network.send_pool import send_pool
+from utils.chunk_frames import ChunkFrames
 
+CHUNK_SIZE = 4096 # FILE_CHUNK payload bytes when the sender does not advertise one
+MAX_UDP_PAYLOAD = 65507 # 65535 minus the IPv4 and UDP headers
+IP_UDP_HEADERS = 28
+
+# sends through the shared send pool unless a specific socket is given.
+# msg_dict may also be a frame already built with encode_message (sent as is)
 def send_message(msg_dict, addr, udp_socket=None):
+	frame = msg_dict if isinstance(msg_dict, (bytes, bytearray, memoryview)) else encode_message(msg_dict)
 	if udp_socket is None:
-		udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-	msg_text = craft_message(msg_dict)
-	udp_socket.sendto(msg_text.encode('utf-8'), addr)
+		return send_pool.sendto(frame, addr)
+	return udp_socket.sendto(frame, addr)
 
 # def get_local_ip():
 #     # This tries to connect to an external host, but doesn't actually send data,
@@ -119,6 +128,41 @@ def validate_token(token, required_scope, revoked_tokens):
     except Exception as e:
         return False, f"Invalid token format: {e}"
 
+# the expiry (epoch seconds) of a user|expiry|scope token, or None if it is malformed
+def token_expiry(token):
+    try:
+        return int(token.split("|")[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+# MTU of the route to ip as the kernel sees it (interface MTU, or a smaller path MTU it has
+# already learned). only Linux exposes this; elsewhere the default is returned
+def probe_path_mtu(ip, default=1500):
+	if not sys.platform.startswith("linux"):
+		return default
+	IP_MTU_DISCOVER, IP_PMTUDISC_DO, IP_MTU = 10, 2, 14 # from <linux/in.h>
+	sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	try:
+		sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+		sock.connect((ip, config.PORT))
+		return sock.getsockopt(socket.IPPROTO_IP, IP_MTU)
+	except OSError:
+		return default
+	finally:
+		sock.close()
+
+# chunk size whose FILE_CHUNK datagrams fit in one IP packet on the path to the receiver
+# (config.FILE_MTU overrides the probe). jumbo mode fills the largest UDP datagram instead,
+# which only makes sense on loopback or links that fragment cheaply
+def choose_chunk_size(file_id, sender_id, receiver_id, token, filesize, binary=False):
+	if config.FILE_JUMBO:
+		datagram_size = MAX_UDP_PAYLOAD
+	else:
+		mtu = config.FILE_MTU or probe_path_mtu(receiver_id.split("@")[1])
+		datagram_size = min(mtu, 65535) - IP_UDP_HEADERS
+	overhead = ChunkFrames.overhead(file_id, sender_id, receiver_id, token, filesize, binary)
+	return ChunkFrames.chunk_size_for(datagram_size, overhead, binary)
+
 # func for sending file offer
 def send_file_offer(peer_manager, ttl):
 	from_id = peer_manager.get_own_profile().get("USER_ID")
@@ -138,6 +182,7 @@ def send_file_offer(peer_manager, ttl):
 	import time
 	now = int(time.time())
 	token = f"{from_id}|{now + ttl}|file"
+	chunk_size = choose_chunk_size(file_id, from_id, to_user, token, filesize)
 
 	offer_msg = {
 		"TYPE": "FILE_OFFER",
@@ -148,16 +193,22 @@ def send_file_offer(peer_manager, ttl):
 		"FILETYPE": filetype,
 		"FILEID": file_id,
 		"DESCRIPTION": description,
+		"CHUNK_SIZE": chunk_size,
 		"TIMESTAMP": now,
 		"TOKEN": token
 	}
+	binary_chunk_size = None
+	if config.BINARY_FRAMES: # receivers that also support it reply BINARY: YES and get raw chunks
+		binary_chunk_size = choose_chunk_size(file_id, from_id, to_user, token, filesize, binary=True)
+		offer_msg["BINARY"] = "YES"
+		offer_msg["BINARY_CHUNK_SIZE"] = binary_chunk_size
 
 	ip = to_user.split("@")[1]
 	send_message(offer_msg, (ip, config.PORT))
 	peer_manager.logger.log_send("FILE_OFFER", to_user, offer_msg)
 
 	print(f"File offer sent to {to_user} for '{filename}' ({filesize} bytes)")
-	peer_manager.add_pending_file(file_id, file_path, token)
+	peer_manager.add_pending_file(file_id, file_path, token, to_user, chunk_size, binary_chunk_size)
 
 	# return these for use in sending FILE_CHUNK later
 	return {
@@ -167,39 +218,63 @@ def send_file_offer(peer_manager, ttl):
 		"token": token
 	}
 
-# func for handling file offer
+# func for handling file offer: it waits in peer_manager.file_offers until the user types
+# 'accept <fileid>' or 'reject <fileid>' in the shell (this runs on a dispatch worker,
+# which must not block on input)
 def handle_file_offer(message, peer_manager):
 	from_user = message["FROM"]
 	file_id = message["FILEID"]
+	display_name = peer_manager.get_display_name(from_user)
+	filesize = message.get("FILESIZE") or ""
+	if not filesize.isdigit(): # checked here, so 'accept' never meets an offer it cannot parse
+		print(f"Rejected file '{message.get('FILENAME')}' from {display_name}: invalid FILESIZE '{filesize}'.")
+		return
+	peer_manager.file_offers[file_id] = dict(message)
+
+	# Non-verbose prompt
+	print(f"User {display_name} is sending you a file '{message['FILENAME']}' ({message['FILESIZE']} bytes). "
+		f"Type 'accept {file_id}' or 'reject {file_id}'.")
+
+# the shell's 'reject <fileid>'; False if no such offer is waiting
+def reject_file_offer(file_id, peer_manager):
+	if peer_manager.file_offers.pop(file_id, None) is None:
+		return False
+	print("You ignored the file offer.")
+	peer_manager.file_transfer_context[file_id] = {"accepted": False}
+	return True
+
+# the shell's 'accept <fileid>': reply FILE_ACCEPTED and get ready for the chunks;
+# False if no such offer is waiting
+def accept_file_offer(file_id, peer_manager):
+	message = peer_manager.file_offers.pop(file_id, None)
+	if message is None:
+		return False
+	from_user = message["FROM"]
 	filename = message["FILENAME"]
 	filesize = int(message["FILESIZE"])
 	filetype = message["FILETYPE"]
 	description = message.get("DESCRIPTION", "")
 	token = message["TOKEN"]
+	chunk_size = message.get("CHUNK_SIZE", "")
+	chunk_size = int(chunk_size) if chunk_size.isdigit() and int(chunk_size) > 0 else None
+	binary_chunk_size = message.get("BINARY_CHUNK_SIZE", "")
+	binary = config.BINARY_FRAMES and message.get("BINARY") == "YES" and binary_chunk_size.isdigit() and int(binary_chunk_size) > 0
+	if binary:
+		chunk_size = int(binary_chunk_size)
 
-	# Non-verbose prompt
-	display_name = peer_manager.get_display_name(from_user)
-	print(f"User {display_name} is sending you a file. Do you accept? (yes/no)")
-
-	response = input("> ").strip().lower()
-	if response == "yes":
-		import time
-		now = int(time.time())
-
-		accepted_msg = {
-		"TYPE": "FILE_ACCEPTED",
-		"FROM": peer_manager.get_own_profile()["USER_ID"],
-		"TO": from_user,
-		"FILEID": file_id,
-		"TIMESTAMP": now
-		}
-		send_message(accepted_msg, (from_user.split('@')[1], config.PORT))
-		peer_manager.logger.log_send("FILE_ACCEPTED", from_user, accepted_msg)
-		
-	else:
-		print("You ignored the file offer.")
-		peer_manager.file_transfer_context[file_id] = {"accepted": False}
-		return
+	now = int(time.time())
+	accepted_msg = {
+	"TYPE": "FILE_ACCEPTED",
+	"FROM": peer_manager.get_own_profile()["USER_ID"],
+	"TO": from_user,
+	"FILEID": file_id,
+	"SACK": "YES", # we acknowledge chunks selectively, so the sender can use a window
+	"TIMESTAMP": now
+	}
+	if binary:
+		accepted_msg["BINARY"] = "YES" # send DATA as raw bytes
+	send_message(accepted_msg, (from_user.split('@')[1], config.PORT))
+	peer_manager.logger.log_send("FILE_ACCEPTED", from_user, accepted_msg)
 
 	# Store offer context
 	peer_manager.file_transfer_context[file_id] = {
@@ -210,83 +285,17 @@ def handle_file_offer(message, peer_manager):
 		"filetype": filetype,
 		"description": description,
 		"token": token,
-		"received_chunks": {},
 		"total_chunks": None,
+		"transfer": None, # IncomingTransfer, created when the first chunk arrives
 	}
 
-	print(f"Accepted file offer for: {filename} ({filesize} bytes)")
+	# with the chunk size advertised the part file and bitmap can be set up right away
+	if chunk_size:
+		from core.file_transfer import IncomingTransfer
+		total_chunks = (filesize + chunk_size - 1) // chunk_size
+		context = peer_manager.file_transfer_context[file_id]
+		context["total_chunks"] = total_chunks
+		context["transfer"] = IncomingTransfer(filename, filesize, total_chunks, chunk_size, file_id, from_user, binary=binary)
 
-def handle_file_chunk(message, peer_manager):
-	file_id = message["FILEID"]
-	from_user = message["FROM"]
-	token = message["TOKEN"]
-	
-	if file_id not in peer_manager.file_transfer_context:
-		return  # No matching FILE_OFFER
-	if not peer_manager.file_transfer_context[file_id].get("accepted", False):
-		return  # User rejected the offer
-	
-	# Validate token
-	if not validate_token(token, "file", peer_manager.revoked_tokens):
-		return  # Invalid or expired token
-
-	# Extract chunk info
-	chunk_index = int(message["CHUNK_INDEX"])
-	total_chunks = int(message["TOTAL_CHUNKS"])
-	chunk_data = base64.b64decode(message["DATA"])
-	
-	# Prepare metadata context
-	context = peer_manager.file_transfer_context[file_id]
-	context["total_chunks"] = total_chunks
-	context["received_chunks"][chunk_index] = chunk_data
-
-	# Check if all chunks are received
-	if len(context["received_chunks"]) == total_chunks:
-		filename = context["filename"]
-		chunks = [context["received_chunks"][i] for i in range(total_chunks)]
-		full_data = b''.join(chunks)
-
-		# Save file (simulate or write)
-		with open(filename, "wb") as f:
-			f.write(full_data)
-
-		print(f"File transfer of {filename} is complete")
-
-		# Send FILE_RECEIVED
-		file_received_msg = {
-			"TYPE": "FILE_RECEIVED",
-			"FROM": peer_manager.get_own_profile().get("USER_ID"),
-			"TO": from_user,
-			"FILEID": file_id,
-			"STATUS": "COMPLETE",
-			"TIMESTAMP": int(time.time())
-		}
-		send_message(file_received_msg, (from_user.split("@")[1], config.PORT))
-
-def send_file_chunks(file_id, filepath, receiver_id, token, peer_manager):
-	CHUNK_SIZE = 4096
-	total_size = os.path.getsize(filepath)
-	total_chunks = (total_size + CHUNK_SIZE - 1) // CHUNK_SIZE  # ceil division
-	sender_id = peer_manager.get_own_profile()["USER_ID"]
-	receiver_ip = receiver_id.split("@")[1]
-
-	with open(filepath, "rb") as f:
-		for chunk_index in range(total_chunks):
-			chunk_data = f.read(CHUNK_SIZE)
-			encoded_data = base64.b64encode(chunk_data).decode()
-
-			message = {
-				"TYPE": "FILE_CHUNK",
-				"FROM": sender_id,
-				"TO": receiver_id,
-				"FILEID": file_id,
-				"CHUNK_INDEX": chunk_index,
-				"TOTAL_CHUNKS": total_chunks,
-				"CHUNK_SIZE": CHUNK_SIZE,
-				"DATA": encoded_data,
-				"TOKEN": token,
-				"TIMESTAMP": int(time.time())
-			}
-
-			send_message(message, (receiver_ip, config.PORT))
-			peer_manager.logger.log_send("FILE_CHUNK", receiver_id, message)
\ No newline at end of file
+	print(f"Accepted file offer for: {filename} ({filesize} bytes)")
+	return True